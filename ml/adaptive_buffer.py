@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Adaptive Memory Buffer
+======================
+Replaces LabelMapper's fixed 1.2 x predicted memory with a buffer learned
+from outcomes, per project_type and base label. The base label is the
+smallest label covering the unbuffered prediction.
+
+For every (project_type, base label) cell we keep a streaming quantile
+sketch of each outcome's actual / predicted memory ratio, rounded down to
+node sizes: M / predicted, where M is the largest node memory below the
+actual peak. A build avoids OOM exactly when predicted x buffer > M. So
+the buffer for a target OOM risk r is the (1 - r) quantile of that ratio.
+Labels are coarse, so a plain actual/predicted quantile would
+over-provision: on generator data its 5% target gave 0.6% OOMs on about
+11% more memory. Builds that OOM on any node carry no buffer signal and
+count as ratio 0. Python builds that come in well under the next node get
+buffers near the floor, and emulator builds that overshoot get more
+headroom.
+
+Sketch: log-spaced ratio buckets at 1% relative accuracy between
+RATIO_MIN and RATIO_MAX (about 300 counters per cell), with under- and overflow
+buckets. Memory is fixed, at 7 types x 5 labels x ~300 floats (~80 KB),
+however many outcomes stream in. Updates are one np.add.at per batch, and
+--decay fades old counts so the buffers track recent behaviour.
+Quantiles read a bucket's upper edge, so they err on the safe side.
+
+Cells with fewer than --min-samples outcomes fall back to their
+project_type, then to all builds, then to 1.2. Buffers are clamped to
+[--min-buffer, --max-buffer].
+
+The compiled table (memory_buffers.json) is what the label-selection step
+reads. predict.py --buffers adds 'memoryBuffer' to each response, and
+LabelMapper and label_selector.py use it in place of 1.2. Lookup is a
+bisect plus two list indexes.
+
+Usage:
+    python adaptive_buffer.py update --state buffer_sketch.npz --log-db prediction_log.db \\
+        --output memory_buffers.json --oom-risk 0.02
+    python adaptive_buffer.py update --state buffer_sketch.npz --csv backfill/part-00000.csv --output memory_buffers.json
+    python adaptive_buffer.py evaluate --buffers memory_buffers.json --csv holdout_scored.csv
+"""
+
+import argparse
+import bisect
+import json
+import math
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+
+from node_pool import INSTANCES, MEMORY_BUFFER, label_indices
+from predict import PROJECT_TYPES
+from prediction_log import JOIN_FROM
+
+
+RATIO_MIN, RATIO_MAX = 0.05, 20.0
+RELATIVE_ACCURACY = 0.01
+DEFAULT_OOM_RISK = 0.05
+DEFAULT_MIN_SAMPLES = 50
+DEFAULT_MIN_BUFFER = 1.0
+DEFAULT_MAX_BUFFER = 3.0
+
+LABELS = list(INSTANCES)
+NODE_MEMORY = [float(config['memory']) for config in INSTANCES.values()]
+N_TYPES = max(PROJECT_TYPES.values()) + 2           # known codes plus one 'other' row
+
+# Outcomes joined with the prediction they belong to, after a cursor
+OUTCOMES_QUERY = (
+    "SELECT o.id, p.project_type, p.pred_memory_gb, o.memory_gb" + JOIN_FROM
+    + " AND o.id > ? AND o.memory_gb > 0 AND p.pred_memory_gb > 0 ORDER BY o.id"
+)
+
+
+def needed_ratio(predicted_gb, actual_gb):
+    """
+    Smallest buffer (exclusive) that avoids OOM: largest node memory below
+    the actual peak / predicted. 0 when the smallest node fits or none does.
+    """
+    memory = np.array(NODE_MEMORY)
+    below = np.searchsorted(memory, actual_gb, side='left') - 1
+    fits_somewhere = actual_gb <= memory[-1]
+    limit = np.where((below >= 0) & fits_somewhere, memory[np.maximum(below, 0)], 0.0)
+    return limit / predicted_gb
+
+
+def type_rows(project_types):
+    """Sketch row per project_type code; unknown codes share the last row."""
+    codes = np.asarray(project_types, dtype=float).astype(np.int64)
+    return np.where((codes >= 0) & (codes < N_TYPES - 1), codes, N_TYPES - 1)
+
+
+# =============================================================================
+# SKETCH
+# =============================================================================
+
+class RatioSketches:
+    """Fixed-size log-bucket histograms of actual/predicted memory per (project_type, base label)."""
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, counts=None, cursor=0):
+        self.relative_accuracy = relative_accuracy
+        self.log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        n_buckets = int(math.ceil(math.log(RATIO_MAX / RATIO_MIN) / self.log_gamma)) + 2
+        self.counts = counts if counts is not None else np.zeros((N_TYPES, len(LABELS), n_buckets))
+        self.cursor = cursor            # last prediction-log outcome id folded in
+
+    @property
+    def n_buckets(self):
+        return self.counts.shape[2]
+
+    def buckets(self, ratios):
+        """Bucket index: 0 below RATIO_MIN, last above RATIO_MAX."""
+        with np.errstate(divide='ignore'):
+            index = np.floor(np.log(np.asarray(ratios, dtype=float) / RATIO_MIN) / self.log_gamma) + 1
+        return np.clip(np.nan_to_num(index, nan=0, neginf=0), 0, self.n_buckets - 1).astype(np.int64)
+
+    def upper_edge(self, bucket):
+        if bucket >= self.n_buckets - 1:
+            return RATIO_MAX
+        return RATIO_MIN * math.exp(bucket * self.log_gamma)
+
+    def update(self, project_types, predicted_gb, actual_gb, weight=1.0):
+        """Fold a batch of outcomes in."""
+        predicted_gb = np.asarray(predicted_gb, dtype=float)
+        actual_gb = np.asarray(actual_gb, dtype=float)
+        valid = (predicted_gb > 0) & (actual_gb > 0)
+        predicted_gb, actual_gb = predicted_gb[valid], actual_gb[valid]
+        rows = type_rows(project_types)[valid]
+        labels = label_indices(predicted_gb, 1.0)
+        buckets = self.buckets(needed_ratio(predicted_gb, actual_gb))
+        np.add.at(self.counts, (rows, labels, buckets), weight)
+        return int(valid.sum())
+
+    def decay(self, factor):
+        """Scale every count by factor (< 1 forgets older outcomes)."""
+        self.counts *= factor
+
+    def quantile(self, counts, q):
+        """Conservative q-quantile of one histogram (upper edge of the bucket holding it)."""
+        total = counts.sum()
+        if total <= 0:
+            return None
+        bucket = int(np.searchsorted(np.cumsum(counts), q * total, side='left'))
+        return self.upper_edge(min(bucket, self.n_buckets - 1))
+
+    def compile(self, oom_risk=DEFAULT_OOM_RISK, min_samples=DEFAULT_MIN_SAMPLES,
+                min_buffer=DEFAULT_MIN_BUFFER, max_buffer=DEFAULT_MAX_BUFFER):
+        """Buffer table {project_type: {label: buffer}} plus the sample count behind each entry."""
+        q = 1 - oom_risk
+        clamp = lambda ratio: round(min(max_buffer, max(min_buffer, ratio)), 3)
+        overall = self.counts.sum(axis=(0, 1))
+        default = clamp(self.quantile(overall, q)) if overall.sum() >= min_samples else MEMORY_BUFFER
+
+        buffers, samples = {}, {}
+        for row in range(N_TYPES):
+            type_counts = self.counts[row].sum(axis=0)
+            type_buffer = clamp(self.quantile(type_counts, q)) if type_counts.sum() >= min_samples else default
+            key = str(row) if row < N_TYPES - 1 else 'other'
+            buffers[key], samples[key] = {}, {}
+            for l, label in enumerate(LABELS):
+                cell = self.counts[row, l]
+                n = float(cell.sum())
+                buffers[key][label] = clamp(self.quantile(cell, q)) if n >= min_samples else type_buffer
+                samples[key][label] = round(n, 1)
+        return {'oom_risk': oom_risk, 'min_samples': min_samples, 'default': default,
+                'labels': LABELS, 'buffers': buffers, 'samples': samples}
+
+    def save(self, path):
+        tmp = f'{path}.tmp.npz'
+        np.savez_compressed(tmp, counts=self.counts,
+                            meta=np.array([self.relative_accuracy, self.cursor], dtype=np.float64))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            relative_accuracy, cursor = data['meta']
+            return cls(float(relative_accuracy), data['counts'].copy(), int(cursor))
+
+
+# =============================================================================
+# LOOKUP
+# =============================================================================
+
+class MemoryBuffers:
+    """Compiled buffer table for the label-selection hot path."""
+
+    def __init__(self, path):
+        with open(path) as f:
+            table = json.load(f)
+        self.oom_risk = table['oom_risk']
+        self.default = table['default']
+        self.rows = []
+        for row in range(N_TYPES):
+            key = str(row) if row < N_TYPES - 1 else 'other'
+            entry = table['buffers'].get(key, {})
+            self.rows.append([entry.get(label, self.default) for label in LABELS])
+
+    def lookup(self, project_type, predicted_memory_gb):
+        """Buffer for one build: project_type code and unbuffered predicted memory."""
+        code = int(project_type)
+        row = self.rows[code if 0 <= code < N_TYPES - 1 else N_TYPES - 1]
+        label = min(bisect.bisect_left(NODE_MEMORY, predicted_memory_gb), len(NODE_MEMORY) - 1)
+        return row[label]
+
+    def lookup_many(self, project_types, predicted_memory_gb):
+        table = np.array(self.rows)
+        return table[type_rows(project_types), label_indices(predicted_memory_gb, 1.0)]
+
+
+# =============================================================================
+# INPUT
+# =============================================================================
+
+def log_outcomes(db_path, cursor):
+    """(ids, project_types, predicted, actual) for outcomes after the cursor."""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        rows = conn.execute(OUTCOMES_QUERY, (cursor,)).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return np.array([], dtype=np.int64), *(np.array([]) for _ in range(3))
+    ids, types, predicted, actual = (np.array(column) for column in zip(*rows))
+    return ids.astype(np.int64), types.astype(float), predicted.astype(float), actual.astype(float)
+
+
+def csv_outcomes(path):
+    """project_type, pred_memory_gb and actual memory (memory_gb or actual_memory_gb) from a CSV."""
+    df = pd.read_csv(path)
+    actual = 'actual_memory_gb' if 'actual_memory_gb' in df.columns else 'memory_gb'
+    missing = [c for c in ('project_type', 'pred_memory_gb', actual) if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns in {path}: {missing}")
+    df = df.dropna(subset=['pred_memory_gb', actual])
+    return df['project_type'].to_numpy(), df['pred_memory_gb'].to_numpy(), df[actual].to_numpy()
+
+
+# =============================================================================
+# EVALUATION
+# =============================================================================
+
+def provisioning(predicted_gb, actual_gb, buffer):
+    """OOM rate (node memory below actual) and mean node memory for a buffer (scalar or per build)."""
+    node = np.array(NODE_MEMORY)[label_indices(np.asarray(predicted_gb) * buffer, 1.0)]
+    return {'oom_rate': round(float((node < actual_gb).mean()), 4),
+            'mean_node_gb': round(float(node.mean()), 3)}
+
+
+def evaluate(buffers, project_types, predicted_gb, actual_gb):
+    """Fixed 1.2 vs adaptive buffers, overall and per project_type."""
+    adaptive = buffers.lookup_many(project_types, predicted_gb)
+    rows = type_rows(project_types)
+    names = {code: name for name, code in reversed(list(PROJECT_TYPES.items()))}
+    report = {'builds': len(predicted_gb),
+              'fixed': provisioning(predicted_gb, actual_gb, MEMORY_BUFFER),
+              'adaptive': provisioning(predicted_gb, actual_gb, adaptive),
+              'by_project_type': {}}
+    for row in np.unique(rows):
+        mask = rows == row
+        report['by_project_type'][names.get(int(row), 'other')] = {
+            'builds': int(mask.sum()),
+            'fixed': provisioning(predicted_gb[mask], actual_gb[mask], MEMORY_BUFFER),
+            'adaptive': provisioning(predicted_gb[mask], actual_gb[mask], adaptive[mask]),
+            'mean_buffer': round(float(adaptive[mask].mean()), 3),
+        }
+    return report
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Learn per-project-type memory buffers from outcomes')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    update = sub.add_parser('update', help='Fold new outcomes into the sketch and recompile the buffers')
+    update.add_argument('--state', required=True, help='Sketch file (.npz), created if missing')
+    source = update.add_mutually_exclusive_group(required=True)
+    source.add_argument('--log-db', help='Prediction log; only outcomes newer than the last update are read')
+    source.add_argument('--csv', help='CSV with project_type, pred_memory_gb and memory_gb/actual_memory_gb')
+    update.add_argument('--output', required=True, help='Compiled buffer table (memory_buffers.json)')
+    update.add_argument('--oom-risk', type=float, default=DEFAULT_OOM_RISK)
+    update.add_argument('--min-samples', type=int, default=DEFAULT_MIN_SAMPLES)
+    update.add_argument('--min-buffer', type=float, default=DEFAULT_MIN_BUFFER)
+    update.add_argument('--max-buffer', type=float, default=DEFAULT_MAX_BUFFER)
+    update.add_argument('--decay', type=float, default=1.0,
+                        help='Multiply existing counts by this before adding new outcomes')
+
+    evaluation = sub.add_parser('evaluate', help='Compare fixed 1.2 and learned buffers on scored builds')
+    evaluation.add_argument('--buffers', required=True)
+    evaluation.add_argument('--csv', required=True)
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'evaluate':
+            project_types, predicted, actual = csv_outcomes(args.csv)
+            print(json.dumps(evaluate(MemoryBuffers(args.buffers), project_types,
+                                      predicted.astype(float), actual.astype(float)), indent=2))
+            return
+
+        sketch = RatioSketches.load(args.state) if os.path.exists(args.state) else RatioSketches()
+        sketch.decay(args.decay)
+        if args.log_db:
+            ids, project_types, predicted, actual = log_outcomes(args.log_db, sketch.cursor)
+            if len(ids):
+                sketch.cursor = int(ids.max())
+        else:
+            project_types, predicted, actual = csv_outcomes(args.csv)
+        added = sketch.update(project_types, predicted, actual)
+        sketch.save(args.state)
+
+        table = sketch.compile(args.oom_risk, args.min_samples, args.min_buffer, args.max_buffer)
+        tmp = f'{args.output}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(table, f, indent=2)
+        os.replace(tmp, args.output)
+    except (FileNotFoundError, ValueError, sqlite3.Error) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps({name: table['buffers'][str(code)] for name, code in PROJECT_TYPES.items()
+                      if name in ('python', 'java', 'nodejs', 'react-native', 'android', 'ios')}, indent=2))
+    print(f"✅ Added {added} outcomes ({sketch.counts.sum():.0f} in sketch); buffers for "
+          f"{args.oom_risk:.0%} OOM risk: {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
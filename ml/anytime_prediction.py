@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Anytime Prediction
+==================
+Latency-budgeted forest prediction: trees are evaluated in a fixed order,
+a block at a time, while a running mean (and, for memory, a running
+variance) of the tree outputs is kept per row. A row stops as soon as its
+node label can no longer flip:
+
+    mean memory +/- margin * standard error  ->  same label at both ends
+
+(after at least --min-trees trees), or when the time budget runs out, or
+when every tree has been used. Bagged trees are exchangeable, so the
+standard error of the running mean is an honest estimate of how far the
+full forest can still move it.
+
+The buffer is the fixed MEMORY_BUFFER, one multiplier per row, or a
+learned table (adaptive_buffer.py): per row, one multiplier per label of
+the unbuffered memory, so each end of the band gets the buffer that
+predict.py would attach to that prediction.
+
+Builds that are clearly lightweight or clearly heavytest stop after the
+first step; only predictions near a label boundary pay for the whole
+forest. Stopped rows drop out of the batch, so later steps only walk
+the rows still undecided. A single row is walked tree by tree in plain
+Python (FlatForest.row_leaves), since the batch traversal's fixed
+max_depth numpy steps would cost more than the trees it saves.
+
+The benchmark replays a data set one request at a time and as one batch,
+and reports the average trees used, the speedup over the full flattened
+forest, and label agreement / memory error against it.
+
+Usage:
+    python predict.py --model model.pkl --input context.json --budget-ms 2
+    python anytime_prediction.py --model model.pkl --data ../resources/enhanced_training_data.csv
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+from bisect import bisect_left
+
+import numpy as np
+
+from forest_arrays import FlatForest
+from node_pool import INSTANCES, MEMORY_BUFFER, label_indices
+
+
+DEFAULT_BLOCK = 10              # trees in the first step
+DEFAULT_GROWTH = 1.0            # each later step is this many times the previous one
+DEFAULT_MIN_TREES = 20          # never decide a label on fewer trees
+DEFAULT_MARGIN = 2.0            # standard errors the mean must clear a label boundary by
+MEMORY_OUTPUT = 1               # memory is the second model output
+MIN_MEMORY_GB = 0.5             # format_prediction's floor
+SKLEARN_ROWS = 200              # single-row sklearn baseline is slow; time it on this many rows
+NODE_MEMORY = np.array([config['memory'] for config in INSTANCES.values()], dtype=float)
+
+
+# =============================================================================
+# ANYTIME PREDICTOR
+# =============================================================================
+
+def node_labels(required_gb):
+    """label_indices for already-buffered memory, without rebuilding the node array per call."""
+    return np.minimum(np.searchsorted(NODE_MEMORY, required_gb), len(NODE_MEMORY) - 1)
+
+
+def buffered(memory_gb, buffer):
+    """Memory times its buffer: a scalar, one per row, or (rows, labels) picked by memory's label."""
+    buffer = np.asarray(buffer, dtype=float)
+    if buffer.ndim == 2:
+        buffer = buffer[np.arange(len(memory_gb)), node_labels(memory_gb)]
+    return memory_gb * buffer
+
+
+class AnytimePredictor:
+    """Progressive evaluation of a FlatForest with label-stability early stopping."""
+
+    def __init__(self, forest, block=DEFAULT_BLOCK, growth=DEFAULT_GROWTH, min_trees=DEFAULT_MIN_TREES,
+                 margin=DEFAULT_MARGIN, tree_order=None):
+        self.forest = forest
+        self.block = max(1, block)
+        self.growth = max(1.0, growth)
+        self.min_trees = min_trees
+        self.margin = margin
+        self.order = np.arange(forest.n_trees) if tree_order is None else np.asarray(tree_order)
+
+        # Trees evaluated after each step
+        self.steps = []
+        size, k = float(self.block), 0
+        while k < len(self.order):
+            k = min(len(self.order), k + int(size))
+            self.steps.append(k)
+            size *= self.growth
+
+    def predict(self, X, budget_s=None, buffer=MEMORY_BUFFER):
+        """
+        Running-mean predictions for each row. buffer is a scalar, one per
+        row, or a (rows, labels) table of per-label buffers (see buffered()).
+
+        Returns (predictions (rows, outputs), trees used per row, why each
+        row stopped: 'stable', 'budget' or 'all').
+        """
+        X = np.asarray(X, dtype=float)
+        deadline = None if budget_s is None else time.perf_counter() + budget_s
+        if len(X) == 1 and (np.isscalar(buffer) or np.ndim(buffer) == 2):
+            row_buffer = buffer if np.isscalar(buffer) else np.asarray(buffer, dtype=float)[0].tolist()
+            prediction, used, stopped = self._predict_row(X[0], deadline, row_buffer)
+            return prediction[None], np.array([used]), np.array([stopped], dtype=object)
+        n_trees = len(self.order)
+        total = np.zeros((len(X), self.forest.n_outputs))
+        squares = np.zeros(len(X))
+        used = np.zeros(len(X), dtype=np.int64)
+        stopped = np.full(len(X), 'all', dtype=object)
+
+        active = np.arange(len(X))
+        for start, k in zip([0] + self.steps, self.steps):
+            trees = self.order[start:k]
+            values = self.forest.tree_predictions(X[active], trees)
+            total[active] += values.sum(axis=1)
+            squares[active] += (values[:, :, MEMORY_OUTPUT] ** 2).sum(axis=1)
+            used[active] += len(trees)
+            if k >= n_trees:
+                break
+
+            if k >= self.min_trees:
+                mean = total[active, MEMORY_OUTPUT] / k
+                se = np.sqrt(np.maximum(squares[active] / k - mean ** 2, 0) / k)
+                row_buffer = buffer if np.isscalar(buffer) else np.asarray(buffer)[active]
+                low = node_labels(buffered(np.maximum(mean - self.margin * se, MIN_MEMORY_GB), row_buffer))
+                high = node_labels(buffered(np.maximum(mean + self.margin * se, MIN_MEMORY_GB), row_buffer))
+                stable = low == high
+                stopped[active[stable]] = 'stable'
+                active = active[~stable]
+                if not len(active):
+                    break
+
+            if deadline is not None and time.perf_counter() >= deadline:
+                stopped[active] = 'budget'
+                break
+
+        return total / used[:, None], used, stopped
+
+    def _predict_row(self, x, deadline, buffer):
+        """
+        predict() for one row: trees are walked one by one in plain Python
+        (FlatForest.row_leaves), since the batch traversal's fixed max_depth
+        numpy steps would cost more than the trees it saves. buffer is a
+        scalar or a list of per-label buffers.
+        """
+        n_trees = len(self.order)
+        node_memory = NODE_MEMORY.tolist()
+        last = len(node_memory) - 1
+
+        def label(memory):
+            scale = buffer if np.isscalar(buffer) else buffer[min(bisect_left(node_memory, memory), last)]
+            return min(bisect_left(node_memory, memory * scale), last)
+
+        leaves = []
+        total = squares = 0.0
+        stopped = 'all'
+        for start, k in zip([0] + self.steps, self.steps):
+            step = self.forest.row_leaves(x, self.order[start:k])
+            leaves += step
+            if k >= n_trees:
+                break
+            memory = self.forest.value[step, MEMORY_OUTPUT].tolist()
+            total += sum(memory)
+            squares += sum(m * m for m in memory)
+            if k >= self.min_trees:
+                mean = total / k
+                se = math.sqrt(max(squares / k - mean * mean, 0) / k)
+                if label(max(mean - self.margin * se, MIN_MEMORY_GB)) == \
+                        label(max(mean + self.margin * se, MIN_MEMORY_GB)):
+                    stopped = 'stable'
+                    break
+            if deadline is not None and time.perf_counter() >= deadline:
+                stopped = 'budget'
+                break
+        return self.forest.value[leaves].mean(axis=0), len(leaves), stopped
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+def benchmark(model, X, budget_s=None, **options):
+    """
+    Anytime vs full-forest prediction on the rows of X, one request at a
+    time and as one batch: trees used, speedup, label agreement.
+
+    Single requests are compared with both the full flattened forest and
+    sklearn's model.predict (what predict.py runs without a budget).
+    """
+    forest = FlatForest.from_model(model)
+    predictor = AnytimePredictor(forest, **options)
+
+    def one_at_a_time(fn, rows):
+        started = time.perf_counter()
+        outputs = [fn(rows[i:i + 1]) for i in range(len(rows))]
+        return outputs, (time.perf_counter() - started) / len(rows)
+
+    _, sklearn_s = one_at_a_time(model.predict, X[:SKLEARN_ROWS])
+    full, full_s = one_at_a_time(forest.predict, X)
+    anytime, anytime_s = one_at_a_time(lambda row: predictor.predict(row, budget_s), X)
+    full = np.vstack(full)
+    predictions = np.vstack([p for p, _, _ in anytime])
+    used = np.concatenate([u for _, u, _ in anytime])
+    stopped = np.concatenate([s for _, _, s in anytime])
+
+    started = time.perf_counter()
+    forest.predict(X)
+    full_batch_s = time.perf_counter() - started
+    started = time.perf_counter()
+    batch, batch_used, _ = predictor.predict(X, budget_s)
+    batch_s = time.perf_counter() - started
+
+    def labels(raw):
+        return label_indices(np.maximum(raw[:, MEMORY_OUTPUT], MIN_MEMORY_GB))
+
+    full_labels = labels(full)
+    full_memory = np.maximum(full[:, MEMORY_OUTPUT], MIN_MEMORY_GB)
+    return {
+        'rows': len(X),
+        'trees_total': forest.n_trees,
+        'budget_ms': None if budget_s is None else budget_s * 1000,
+        'block': predictor.block,
+        'growth': predictor.growth,
+        'min_trees': predictor.min_trees,
+        'margin': predictor.margin,
+        'single_row': {
+            'mean_trees_used': round(float(used.mean()), 1),
+            'stopped': {reason: int((stopped == reason).sum()) for reason in ('stable', 'budget', 'all')},
+            'label_agreement': round(float((labels(predictions) == full_labels).mean()), 4),
+            'memory_mae_vs_full': round(float(np.abs(np.maximum(predictions[:, MEMORY_OUTPUT], MIN_MEMORY_GB)
+                                                     - full_memory).mean()), 4),
+            'sklearn_us': round(sklearn_s * 1e6, 1),
+            'full_us': round(full_s * 1e6, 1),
+            'anytime_us': round(anytime_s * 1e6, 1),
+            'speedup_vs_full': round(full_s / anytime_s, 2),
+            'speedup_vs_sklearn': round(sklearn_s / anytime_s, 2),
+        },
+        'batch': {
+            'mean_trees_used': round(float(batch_used.mean()), 1),
+            'label_agreement': round(float((labels(batch) == full_labels).mean()), 4),
+            'full_ms': round(full_batch_s * 1000, 1),
+            'anytime_ms': round(batch_s * 1000, 1),
+            'speedup': round(full_batch_s / batch_s, 2),
+        },
+    }
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    import joblib
+    import pandas as pd
+    from predict import FEATURE_COLUMNS
+
+    parser = argparse.ArgumentParser(description='Benchmark latency-budgeted (anytime) forest prediction')
+    parser.add_argument('--model', required=True, help='Path to trained model.pkl')
+    parser.add_argument('--data', required=True, help='CSV with the 27 feature columns')
+    parser.add_argument('--rows', type=int, default=2000, help='Rows to replay (0 = all)')
+    parser.add_argument('--budget-ms', type=float, help='Per-request time budget (default: none)')
+    parser.add_argument('--block', type=int, default=DEFAULT_BLOCK, help='Trees in the first step')
+    parser.add_argument('--growth', type=float, default=DEFAULT_GROWTH, help='Step size multiplier')
+    parser.add_argument('--min-trees', type=int, default=DEFAULT_MIN_TREES)
+    parser.add_argument('--margin', type=float, default=DEFAULT_MARGIN)
+    args = parser.parse_args()
+
+    try:
+        model = joblib.load(args.model)
+        X = pd.read_csv(args.data, usecols=FEATURE_COLUMNS)[FEATURE_COLUMNS].fillna(0).to_numpy(dtype=float)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.rows:
+        X = X[:args.rows]
+
+    budget_s = None if args.budget_ms is None else args.budget_ms / 1000
+    report = benchmark(model, X, budget_s, block=args.block, growth=args.growth, min_trees=args.min_trees, margin=args.margin)
+    print(json.dumps(report, indent=2))
+    single, batch = report['single_row'], report['batch']
+    print(f"✅ {single['mean_trees_used']}/{report['trees_total']} trees on average, "
+          f"{single['label_agreement']:.2%} label agreement; per request {single['speedup_vs_full']}x "
+          f"vs the full forest ({single['speedup_vs_sklearn']}x vs sklearn), batch {batch['speedup']}x",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
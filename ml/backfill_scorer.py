@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Offline Backfill Scorer
+=======================
+Re-scores historic builds with a (candidate) model to compare node
+selection: what the model predicts for each row and which label
+LabelMapper would pick from it.
+
+Input is either a CSV with the 27 feature columns (enhanced_training_data.csv,
+an export) or the prediction log database. The parent reads it in chunks
+and keeps at most 2 x --cores chunks in flight to a process pool. Each
+worker loads the model once, plus any per-project-type submodels, with
+n_jobs=1 so workers do not oversubscribe the cores. Each chunk becomes one
+shard, part-<chunk>.csv, which holds the predictions, the label and any
+actual or previously logged values for comparison.
+
+Progress is checkpointed (checkpoint.json in the output directory) after
+every chunk, so an interrupted run resumes where it stopped. Only full
+chunks are checkpointed: the short last chunk of a CSV, or a log id range
+that reaches past the newest prediction, is rescored on every run, so
+rows appended since then are picked up. The checkpoint also pins the
+input, model and chunk size; use --restart to rescore from scratch.
+
+Usage:
+    python backfill_scorer.py --model candidate/model.pkl --input ../resources/enhanced_training_data.csv \\
+        --output backfill/ --cores 8 --chunk-size 50000
+    python backfill_scorer.py --model candidate/model.pkl --log-db prediction_log.db --output backfill/
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import predict
+from node_pool import INSTANCES, label_indices
+from predict import FEATURE_COLUMNS
+from prediction_log import TARGET_COLUMNS, model_id_for
+
+
+DEFAULT_CHUNK_SIZE = 50_000
+LABELS = list(INSTANCES)
+NODE_MEMORY = np.array([config['memory'] for config in INSTANCES.values()], dtype=float)
+
+# Prediction log rows: the logged features and prediction, plus the build's latest outcome if any
+LOG_QUERY = f"""
+SELECT p.id AS row, p.build_id, {', '.join(f'p.{col}' for col in FEATURE_COLUMNS)},
+       p.pred_memory_gb AS logged_memory_gb,
+       {', '.join(f'o.{col}' for col in TARGET_COLUMNS)}, o.status
+FROM predictions p
+LEFT JOIN outcomes o ON o.id = (SELECT MAX(id) FROM outcomes WHERE build_id = p.build_id)
+WHERE p.id >= ? AND p.id < ?
+ORDER BY p.id
+"""
+
+
+# =============================================================================
+# INPUT CHUNKS
+# =============================================================================
+
+def csv_chunks(path, chunk_size):
+    """
+    (chunk index, frame, complete) over a CSV; 'row' is the 0-based data row
+    number. Only a full chunk is complete: rows appended later land in the
+    short last one.
+    """
+    reader = pd.read_csv(path, chunksize=chunk_size)
+    for index, frame in enumerate(reader):
+        missing = [c for c in FEATURE_COLUMNS if c not in frame.columns]
+        if missing:
+            raise ValueError(f"Missing feature columns: {missing}")
+        frame.insert(0, 'row', np.arange(index * chunk_size, index * chunk_size + len(frame)))
+        yield index, frame, len(frame) == chunk_size
+
+
+def log_chunks(db_path, chunk_size):
+    """
+    (chunk index, frame, complete) over the prediction log; chunk i covers a
+    fixed range of prediction ids. A range reaching past the newest id is not
+    complete, since the log may still grow into it.
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Prediction log not found: {db_path}")
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        first, last = conn.execute('SELECT MIN(id), MAX(id) FROM predictions').fetchone()
+        if first is None:
+            return
+        for index in range((last - first) // chunk_size + 1):
+            start = first + index * chunk_size
+            frame = pd.read_sql_query(LOG_QUERY, conn, params=(start, start + chunk_size))
+            yield index, frame, start + chunk_size - 1 <= last
+    finally:
+        conn.close()
+
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+_MODEL_PATH = None
+
+
+def init_worker(model_path):
+    """Load the model and its submodels once per worker process."""
+    global _MODEL_PATH
+    _MODEL_PATH = model_path
+    for path in [model_path, *predict.load_routes(model_path).values()]:
+        model = predict.load_model(path)
+        if hasattr(model, 'n_jobs'):
+            model.n_jobs = 1
+
+
+def score_chunk(index, frame, output_dir):
+    """Score one chunk into part-<index>.csv; returns (index, summary)."""
+    X = frame[FEATURE_COLUMNS].fillna(0).to_numpy(dtype=float)
+    predictions = np.empty((len(X), len(TARGET_COLUMNS)))
+    routes = predict.load_routes(_MODEL_PATH)
+    paths = np.array([routes.get(int(code), _MODEL_PATH) for code in X[:, FEATURE_COLUMNS.index('project_type')]])
+    for path in dict.fromkeys(paths):
+        rows = paths == path
+        predictions[rows] = predict.load_model(path).predict(X[rows])
+    predictions = np.maximum(predictions, 0)
+    labels = label_indices(predictions[:, 1])
+
+    out = pd.DataFrame({'row': frame['row'].to_numpy()})
+    for col in ('build_id', 'status'):
+        if col in frame.columns:
+            out[col] = frame[col].to_numpy()
+    out['project_type'] = frame['project_type'].to_numpy()
+    for k, col in enumerate(TARGET_COLUMNS):
+        out[f'pred_{col}'] = np.round(predictions[:, k], 4)
+    out['label'] = np.array(LABELS)[labels]
+
+    summary = {'rows': len(out), 'labels': np.bincount(labels, minlength=len(LABELS)).tolist()}
+    if 'logged_memory_gb' in frame.columns:
+        logged = frame['logged_memory_gb'].to_numpy(dtype=float)
+        known = ~np.isnan(logged)
+        out['logged_label'] = np.where(known, np.array(LABELS)[label_indices(np.nan_to_num(logged))], '')
+        summary['label_changed'] = int((out['logged_label'] != out['label'])[known].sum())
+    if 'memory_gb' in frame.columns:
+        actual = frame['memory_gb'].to_numpy(dtype=float)
+        for col in TARGET_COLUMNS:
+            out[f'actual_{col}'] = frame[col].to_numpy()
+        known = ~np.isnan(actual)
+        summary['with_actual'] = int(known.sum())
+        summary['under_provisioned'] = int((NODE_MEMORY[labels] < actual)[known].sum())
+
+    path = os.path.join(output_dir, f'part-{index:05d}.csv')
+    out.to_csv(f'{path}.tmp', index=False)
+    os.replace(f'{path}.tmp', path)
+    return index, summary
+
+
+# =============================================================================
+# CHECKPOINT
+# =============================================================================
+
+def load_checkpoint(path, config, restart=False):
+    """Completed chunk summaries for this exact run config; {} when starting over."""
+    if restart or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('config') != config:
+        raise ValueError(f"{path} is from a different input/model/chunk size; use --restart")
+    return {int(index): summary for index, summary in checkpoint['done'].items()}
+
+
+def save_checkpoint(path, config, done):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'config': config, 'done': {str(i): s for i, s in sorted(done.items())}}, f)
+    os.replace(tmp, path)
+
+
+# =============================================================================
+# BACKFILL
+# =============================================================================
+
+def run_backfill(model_path, chunks, output_dir, config, cores, restart=False):
+    """Fan chunks out to `cores` workers; returns the run report."""
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = os.path.join(output_dir, 'checkpoint.json')
+    done = load_checkpoint(checkpoint_path, config, restart)
+    resumed = len(done)
+
+    started = time.perf_counter()
+    scored = 0
+    pending = deque()
+    partial = {}                # scored but not checkpointed: rescored next run
+
+    def collect(result, complete):
+        nonlocal scored
+        index, summary = result.get()
+        scored += summary['rows']
+        if complete:
+            done[index] = summary
+            save_checkpoint(checkpoint_path, config, done)
+        else:
+            partial[index] = summary
+
+    with multiprocessing.Pool(cores, initializer=init_worker, initargs=(model_path,)) as pool:
+        for index, frame, complete in chunks:
+            if index in done:
+                continue
+            pending.append((pool.apply_async(score_chunk, (index, frame, output_dir)), complete))
+            if len(pending) >= 2 * cores:
+                collect(*pending.popleft())
+        while pending:
+            collect(*pending.popleft())
+    seconds = time.perf_counter() - started
+
+    totals = {'rows': 0, 'labels': [0] * len(LABELS)}
+    for summary in [*done.values(), *partial.values()]:
+        for key, value in summary.items():
+            if key == 'labels':
+                totals['labels'] = [a + b for a, b in zip(totals['labels'], value)]
+            else:
+                totals[key] = totals.get(key, 0) + value
+
+    report = {
+        'model_id': config['model_id'],
+        'chunks': len(done) + len(partial),
+        'chunks_resumed': resumed,
+        'chunks_open': len(partial),
+        'rows_scored': scored,
+        'seconds': round(seconds, 2),
+        'rows_per_second': round(scored / seconds, 1) if seconds > 0 else None,
+        'cores': cores,
+        'total_rows': totals['rows'],
+        'labels': dict(zip(LABELS, totals['labels'])),
+    }
+    if totals.get('with_actual'):
+        report['under_provisioned_rate'] = round(totals['under_provisioned'] / totals['with_actual'], 4)
+    if 'label_changed' in totals:
+        report['label_changed_vs_logged'] = totals['label_changed']
+    return report
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-score historic builds with a model, in parallel')
+    parser.add_argument('--model', required=True, help='Model to score with (submodel routes are honored)')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='CSV with the 27 feature columns')
+    source.add_argument('--log-db', help='Prediction log SQLite database')
+    parser.add_argument('--output', required=True, help='Directory for part-*.csv shards and checkpoint.json')
+    parser.add_argument('--cores', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"❌ Model not found: {args.model}", file=sys.stderr)
+        sys.exit(1)
+
+    config = {
+        'input': os.path.abspath(args.input or args.log_db),
+        'source': 'csv' if args.input else 'log',
+        'model_id': model_id_for(args.model),
+        'chunk_size': args.chunk_size,
+    }
+    chunks = (csv_chunks(args.input, args.chunk_size) if args.input
+              else log_chunks(args.log_db, args.chunk_size))
+    try:
+        report = run_backfill(args.model, chunks, args.output, config, max(1, args.cores), args.restart)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps(report, indent=2))
+    print(f"✅ {report['total_rows']} rows in {report['chunks']} shards: {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
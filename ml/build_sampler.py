@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Build Resource Sampler
+======================
+Measures what a build actually used and emits a real training row.
+
+Wraps a build command (or attaches to a running process tree), samples
+CPU time and RSS of the whole tree from /proc at a fixed interval, and keeps
+only running aggregates (no per-sample history):
+- cpu_avg_pct:    tree CPU seconds / (wall seconds * cpus) * 100
+- memory_gb:      peak summed RSS of the tree
+- build_time_min: wall time
+
+The row is written in the exact training_features.csv schema by joining
+the measurements with the build's context JSON (the same file predict.py
+reads), so it can be appended to the training data directly.
+
+Usage:
+    python build_sampler.py --context ml_input.json --output real_builds.csv -- mvn package
+    python build_sampler.py --context ml_input.json --output real_builds.csv --pid 4242
+    python build_sampler.py --benchmark --interval 1.0 --duration 20
+
+Linux only (reads /proc).
+"""
+
+import argparse
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+from predict import FEATURE_COLUMNS, engineer_features
+
+
+TARGET_COLUMNS = ['cpu_avg_pct', 'memory_gb', 'build_time_min']
+
+DEFAULT_INTERVAL = 1.0
+
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+# =============================================================================
+# /PROC READERS
+# =============================================================================
+
+def read_stat(pid):
+    """
+    Return (cpu_seconds, rss_bytes) for one process, or None if it is gone.
+
+    cpu_seconds includes cutime/cstime, i.e. children this process has
+    already reaped, so CPU from short-lived compiler/test processes is not
+    lost between samples.
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            data = f.read()
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    # Fields after the parenthesised command name (which may contain spaces)
+    fields = data[data.rindex(b')') + 2:].split()
+    ticks = int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14])
+    return ticks / CLK_TCK, int(fields[21]) * PAGE_SIZE
+
+
+def list_children(pid):
+    """Direct children of pid via /proc/<pid>/task/*/children."""
+    children = []
+    try:
+        for tid in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{tid}/children') as f:
+                children.extend(int(c) for c in f.read().split())
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        pass
+    return children
+
+
+def list_children_by_scan():
+    """ppid -> [pid] for every process; fallback when task/children is unavailable."""
+    tree = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        ppid = int(data[data.rindex(b')') + 2:].split()[1])
+        tree.setdefault(ppid, []).append(int(entry))
+    return tree
+
+
+HAS_CHILDREN_FILE = os.path.exists(f'/proc/{os.getpid()}/task/{os.getpid()}/children')
+
+
+def process_tree(root_pid):
+    """(pid, parent_pid) for every live process in the tree rooted at root_pid."""
+    by_parent = None if HAS_CHILDREN_FILE else list_children_by_scan()
+    tree, stack = [], [(root_pid, None)]
+    while stack:
+        pid, parent = stack.pop()
+        tree.append((pid, parent))
+        children = list_children(pid) if by_parent is None else by_parent.get(pid, [])
+        stack.extend((child, pid) for child in children)
+    return tree
+
+
+# =============================================================================
+# SAMPLER
+# =============================================================================
+
+class TreeSampler:
+    """
+    Samples a process tree on a background thread, downsampling as it goes.
+
+    Only the latest cumulative CPU per pid, the peak tree RSS and the sample
+    count are kept, so memory is O(live processes) regardless of build length.
+    """
+
+    def __init__(self, root_pid, interval=DEFAULT_INTERVAL):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.samples = 0
+        self.peak_rss = 0
+        self.live = {}          # pid -> (cumulative cpu seconds, parent pid)
+        self.departed_cpu = 0.0
+        self.start_time = None
+        self.end_time = None
+        self.sampler_cpu = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _add_tree(self, root, current):
+        """Read every process under root into current; returns their summed RSS."""
+        rss = 0
+        for pid, parent in process_tree(root):
+            stat = read_stat(pid) if pid not in current else None
+            if stat is None:
+                continue
+            cpu, pid_rss = stat
+            current[pid] = (cpu, parent)
+            rss += pid_rss
+        return rss
+
+    def sample(self):
+        """Take one sample; returns False once the root process is gone."""
+        current = {}
+        rss = self._add_tree(self.root_pid, current)
+
+        # A process that left the tree but is still running was orphaned
+        # (reparented to init): keep sampling it as a root of its own,
+        # since no process in the tree will ever reap it.
+        for pid in self.live:
+            if pid not in current and read_stat(pid) is not None:
+                rss += self._add_tree(pid, current)
+                if pid in current:
+                    current[pid] = (current[pid][0], None)
+
+        # A process that vanished was reaped. If an ancestor from the last
+        # sample is still live, its CPU reaches that ancestor's cutime (via
+        # any ancestors that exited in between); otherwise keep the last
+        # value we saw so it is not lost.
+        for pid, (cpu, parent) in self.live.items():
+            if pid in current:
+                continue
+            while parent is not None and parent not in current:
+                parent = self.live.get(parent, (0.0, None))[1]
+            if parent is None:
+                self.departed_cpu += cpu
+        self.live = current
+
+        self.peak_rss = max(self.peak_rss, rss)
+        self.samples += 1
+        return self.root_pid in current
+
+    def _run(self):
+        thread_start = time.thread_time()
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            if not self.sample():
+                break
+            next_tick += self.interval
+            self._stop.wait(max(0.0, next_tick - time.monotonic()))
+        self.sampler_cpu = time.thread_time() - thread_start
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.end_time = time.monotonic()
+
+    def wait(self):
+        """Block until the root process exits (attach mode)."""
+        self._thread.join()
+        self.end_time = time.monotonic()
+
+    @property
+    def wall_seconds(self):
+        return (self.end_time or time.monotonic()) - self.start_time
+
+    @property
+    def cpu_seconds(self):
+        return self.departed_cpu + sum(cpu for cpu, _ in self.live.values())
+
+
+def measurements(wall_seconds, cpu_seconds, peak_rss, cpus):
+    """Convert raw totals into the three training targets."""
+    cpu_pct = cpu_seconds / (wall_seconds * cpus) * 100 if wall_seconds > 0 else 0.0
+    return {
+        'cpu_avg_pct': round(min(100.0, cpu_pct), 1),
+        'memory_gb': round(peak_rss / 1024 ** 3, 2),
+        'build_time_min': round(wall_seconds / 60, 1),
+    }
+
+
+def run_command(command, interval, cpus):
+    """Run a build command under the sampler; returns (exit_code, targets, sampler)."""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    proc = subprocess.Popen(command)
+    sampler = TreeSampler(proc.pid, interval).start()
+    exit_code = proc.wait()
+    sampler.stop()
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    # Once the tree is reaped, rusage gives exact CPU for everything it ran
+    cpu_seconds = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    peak_rss = max(sampler.peak_rss, after.ru_maxrss * 1024)
+    return exit_code, measurements(sampler.wall_seconds, cpu_seconds, peak_rss, cpus), sampler
+
+
+def attach(pid, interval, cpus):
+    """Sample an existing process tree until its root exits."""
+    sampler = TreeSampler(pid, interval).start()
+    sampler.wait()
+    return measurements(sampler.wall_seconds, sampler.cpu_seconds, sampler.peak_rss, cpus), sampler
+
+
+# =============================================================================
+# TRAINING ROW OUTPUT
+# =============================================================================
+
+def build_training_row(context, targets):
+    """Join context features and measured targets in training_features.csv order."""
+    features = engineer_features(context)
+    row = {col: features[col] for col in FEATURE_COLUMNS}
+    row.update(targets)
+    return row
+
+
+def append_row(path, row):
+    """Append one row, writing the header if the file is new or empty."""
+    write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FEATURE_COLUMNS + TARGET_COLUMNS)
+        if write_header:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+# =============================================================================
+# OVERHEAD BENCHMARK
+# =============================================================================
+
+def benchmark(interval, duration, processes=8):
+    """
+    Measure sampler CPU overhead against a synthetic build tree.
+
+    Spawns a shell that runs `processes` busy children, samples it for
+    `duration` seconds, and reports the sampler thread's own CPU time as a
+    percentage of one core.
+    """
+    script = ' '.join(['(while :; do :; done) &'] * processes) + ' wait'
+    proc = subprocess.Popen(['sh', '-c', script])
+    try:
+        time.sleep(0.5)  # let the tree spawn
+        sampler = TreeSampler(proc.pid, interval).start()
+        time.sleep(duration)
+        sampler.stop()
+    finally:
+        for pid, _ in process_tree(proc.pid)[1:]:
+            try:
+                os.kill(pid, 9)
+            except ProcessLookupError:
+                pass
+        proc.kill()
+        proc.wait()
+
+    overhead_pct = sampler.sampler_cpu / sampler.wall_seconds * 100
+    return {
+        'interval_s': interval,
+        'duration_s': round(sampler.wall_seconds, 2),
+        'tree_processes': processes + 1,
+        'samples': sampler.samples,
+        'sampler_cpu_ms': round(sampler.sampler_cpu * 1000, 2),
+        'cpu_ms_per_sample': round(sampler.sampler_cpu * 1000 / max(sampler.samples, 1), 3),
+        'overhead_pct_of_core': round(overhead_pct, 3),
+        'within_budget': overhead_pct < 1.0,
+    }
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Sample build CPU/memory and emit a training row')
+    parser.add_argument('--context', help='Build context JSON (same input as predict.py)')
+    parser.add_argument('--output', help='CSV to append the training row to')
+    parser.add_argument('--pid', type=int, help='Attach to a running process tree instead of running a command')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='Seconds between samples')
+    parser.add_argument('--cpus', type=int, default=os.cpu_count(), help='CPUs on the node (for cpu_avg_pct)')
+    parser.add_argument('--include-failed', action='store_true',
+                        help='Emit a row even if the command exits non-zero')
+    parser.add_argument('--benchmark', action='store_true', help='Measure sampler overhead and exit')
+    parser.add_argument('--duration', type=float, default=10.0, help='Benchmark duration in seconds')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='Build command (after --)')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.interval, args.duration)))
+        return
+
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if bool(command) == bool(args.pid):
+        parser.error('give either a command (after --) or --pid')
+    if not args.context or not args.output:
+        parser.error('--context and --output are required')
+
+    with open(args.context) as f:
+        context = json.load(f)
+
+    if args.pid:
+        exit_code = 0
+        targets, sampler = attach(args.pid, args.interval, args.cpus)
+    else:
+        exit_code, targets, sampler = run_command(command, args.interval, args.cpus)
+
+    overhead = sampler.sampler_cpu / sampler.wall_seconds * 100 if sampler.wall_seconds > 0 else 0.0
+    print(json.dumps({**targets, 'exitCode': exit_code, 'samples': sampler.samples,
+                      'samplerOverheadPct': round(overhead, 3)}), file=sys.stderr)
+
+    if exit_code == 0 or args.include_failed:
+        append_row(args.output, build_training_row(context, targets))
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
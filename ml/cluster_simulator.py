@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Cluster Simulator
+=================
+Discrete-event simulation of the Jenkins EC2 node pool, for evaluating
+node-selection policies (label thresholds, memory buffers) offline.
+
+A build arrival trace is replayed through an elastic pool modelled on
+LabelMapper.INSTANCES:
+- Each build has predicted and actual cpu / memory / time
+- A policy maps predictions to a label (e.g. the current 1.2x memory rule)
+- Builds queue per label and start on any free executor of that label,
+  like Jenkins; nodes boot on demand (up to --max-nodes per label) and
+  terminate after --idle-timeout minutes idle
+- A build whose actual memory does not fit in what its node has left is
+  OOM-killed part way through and, by default, retried one label up
+
+Reported per policy: queue wait percentiles, executor and memory
+utilization, OOM-kill rate and node cost (INSTANCES hourly_price).
+
+Traces:
+- synthesized from enhanced_training_data.csv: arrivals follow the
+  weekday x hour-of-day profile of its timestamps, resources are
+  bootstrapped from its rows and predictions get lognormal error
+- --trace CSV (timestamp or arrival_s, actuals, optional pred_* columns)
+- --log-db: joined predictions/outcomes from prediction_log.py
+
+Events live in one heap; arrivals are pre-sorted and merged in, so a
+million builds replay in well under a few minutes.
+
+Usage:
+    python cluster_simulator.py --builds 1000000 --days 30 --policy buffer:1.2 buffer:1.5 oracle
+    python cluster_simulator.py --log-db prediction_log.db --policy buffer:1.2 --report sim.json
+"""
+
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from node_pool import INSTANCES, MEMORY_BUFFER, label_indices
+
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(SCRIPT_DIR), 'resources', 'enhanced_training_data.csv')
+
+LABELS = list(INSTANCES)
+NODE_MEMORY = np.array([INSTANCES[label]['memory'] for label in LABELS], dtype=float)
+
+DEFAULT_BOOT_MIN = 3.0          # EC2 agent launch + Jenkins connect
+DEFAULT_IDLE_TIMEOUT_MIN = 10.0
+DEFAULT_MAX_NODES = 1000        # per label
+DEFAULT_OOM_AT = 0.5            # fraction of the build's runtime before the kill
+DEFAULT_PREDICTION_ERROR = 0.25 # lognormal sigma for synthesized predictions
+DEFAULT_MAX_ATTEMPTS = 2
+
+# Event kinds; the heap orders ties by kind, so finished builds free their
+# executors before nodes come up or idle checks run at the same instant
+BUILD_END, NODE_READY, IDLE_CHECK = 0, 1, 2
+
+
+# =============================================================================
+# POLICIES
+# =============================================================================
+
+class BufferPolicy:
+    """LabelMapper.getLabel: smallest label whose memory covers predicted memory x buffer."""
+
+    def __init__(self, buffer=MEMORY_BUFFER):
+        self.buffer = float(buffer)
+        self.name = f'buffer:{self.buffer:g}'
+
+    def labels(self, trace):
+        return label_indices(trace['pred_memory'], self.buffer)
+
+
+class OraclePolicy:
+    """
+    Smallest label that fits the actual memory. Still OOMs when co-located
+    builds on a multi-executor node together outgrow it.
+    """
+
+    name = 'oracle'
+
+    def labels(self, trace):
+        return label_indices(trace['memory'], buffer=1.0)
+
+
+class StaticPolicy:
+    """Every build on one label (what pipelines without ML selection do)."""
+
+    def __init__(self, label='build'):
+        if label not in INSTANCES:
+            raise ValueError(f"Unknown label: {label}")
+        self.index = LABELS.index(label)
+        self.name = f'static:{label}'
+
+    def labels(self, trace):
+        return np.full(len(trace['memory']), self.index, dtype=np.int64)
+
+
+POLICIES = {
+    'buffer': BufferPolicy,
+    'oracle': OraclePolicy,
+    'static': StaticPolicy,
+}
+
+
+def parse_policy(spec):
+    """'buffer:1.5' -> BufferPolicy(1.5); 'static:test' -> StaticPolicy('test')."""
+    name, _, arg = spec.partition(':')
+    if name not in POLICIES:
+        raise ValueError(f"Unknown policy: {name} (expected one of {list(POLICIES)})")
+    return POLICIES[name](arg) if arg else POLICIES[name]()
+
+
+# =============================================================================
+# TRACES
+# =============================================================================
+
+def _trace(arrival_s, memory, cpu, time_min, pred_memory, pred_cpu, pred_time):
+    order = np.argsort(arrival_s, kind='stable')
+    arrays = {
+        'arrival_s': arrival_s, 'memory': memory, 'cpu': cpu, 'time_min': time_min,
+        'pred_memory': pred_memory, 'pred_cpu': pred_cpu, 'pred_time': pred_time,
+    }
+    return {key: np.asarray(value, dtype=float)[order] for key, value in arrays.items()}
+
+
+def synthesize_trace(data_path, n_builds, days, prediction_error=DEFAULT_PREDICTION_ERROR, seed=42):
+    """
+    Synthesize n_builds arrivals over `days` days from the dataset.
+
+    Arrival slots are drawn from the dataset's weekday x hour histogram
+    (add-one smoothed); actual resources are bootstrapped rows and each
+    prediction is the actual times lognormal noise.
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.read_csv(data_path, usecols=['timestamp', 'memory_gb', 'cpu_avg_pct', 'build_time_min'],
+                     parse_dates=['timestamp'])
+
+    slots = df['timestamp'].dt.dayofweek * 24 + df['timestamp'].dt.hour
+    weights = np.bincount(slots, minlength=7 * 24) + 1.0
+    weights /= weights.sum()
+
+    # Weekday x hour slot, then a day in the horizon with that weekday
+    slot = rng.choice(7 * 24, size=n_builds, p=weights)
+    weekday, hour = slot // 24, slot % 24
+    weeks = rng.integers(0, max(1, -(-days // 7)), size=n_builds)
+    day = np.minimum(weeks * 7 + weekday, days - 1)
+    arrival_s = (day * 24 + hour) * 3600.0 + rng.uniform(0, 3600, size=n_builds)
+
+    rows = rng.integers(0, len(df), size=n_builds)
+    memory = df['memory_gb'].to_numpy()[rows]
+    cpu = df['cpu_avg_pct'].to_numpy()[rows]
+    time_min = df['build_time_min'].to_numpy()[rows]
+
+    def predicted(actual):
+        return actual * rng.lognormal(0.0, prediction_error, size=n_builds)
+
+    return _trace(arrival_s, memory, cpu, time_min,
+                  predicted(memory), np.clip(predicted(cpu), 0, 100), predicted(time_min))
+
+
+def load_trace_csv(path, prediction_error=DEFAULT_PREDICTION_ERROR, seed=42):
+    """
+    Read a trace CSV: timestamp (or arrival_s), memory_gb, cpu_avg_pct,
+    build_time_min and optionally pred_memory_gb, pred_cpu_avg_pct,
+    pred_build_time_min (synthesized from the actuals when missing).
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.read_csv(path)
+    if 'arrival_s' in df:
+        arrival_s = df['arrival_s'].to_numpy(dtype=float)
+    else:
+        ts = pd.to_datetime(df['timestamp'])
+        arrival_s = (ts - ts.min()).dt.total_seconds().to_numpy()
+
+    def column(name):
+        actual = df[name].to_numpy(dtype=float)
+        if f'pred_{name}' in df:
+            return actual, df[f'pred_{name}'].to_numpy(dtype=float)
+        return actual, actual * rng.lognormal(0.0, prediction_error, size=len(df))
+
+    memory, pred_memory = column('memory_gb')
+    cpu, pred_cpu = column('cpu_avg_pct')
+    time_min, pred_time = column('build_time_min')
+    return _trace(arrival_s, memory, cpu, time_min, pred_memory, pred_cpu, pred_time)
+
+
+def load_trace_log(db_path, since=None):
+    """Real predictions paired with measured outcomes from the prediction log."""
+    from prediction_log import PredictionLog, FEATURE_COLUMNS
+
+    log = PredictionLog(db_path)
+    try:
+        rows = log.joined(since=since).fetchall()
+    finally:
+        log.close()
+    if not rows:
+        raise ValueError(f"No joined predictions/outcomes in {db_path}")
+
+    # (build_id, ts, model_id, *features, pred cpu/mem/time, actual cpu/mem/time, status)
+    values = np.array([row[1:2] + row[3 + len(FEATURE_COLUMNS):-1] for row in rows], dtype=float)
+    ts, pred_cpu, pred_memory, pred_time, cpu, memory, time_min = values.T
+    return _trace(ts - ts.min(), memory, cpu, time_min, pred_memory, pred_cpu, pred_time)
+
+
+# =============================================================================
+# SIMULATION
+# =============================================================================
+
+def simulate(trace, policy, max_nodes=None, warm=None, boot_min=DEFAULT_BOOT_MIN,
+             idle_timeout_min=DEFAULT_IDLE_TIMEOUT_MIN, oom_at=DEFAULT_OOM_AT,
+             max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Replay a trace under one policy; returns the summary report dict.
+
+    max_nodes / warm: {label: count}. Warm nodes are up from t=0 and never
+    idle out. max_attempts: 1 disables the retry one label up after an OOM.
+    """
+    started = time.perf_counter()
+    n_labels = len(LABELS)
+    max_nodes = [int((max_nodes or {}).get(label, DEFAULT_MAX_NODES)) for label in LABELS]
+    executors = [int(INSTANCES[label]['executors']) for label in LABELS]
+    price = [float(INSTANCES[label].get('hourly_price', 0.0)) for label in LABELS]
+    boot_s = boot_min * 60.0
+    idle_s = idle_timeout_min * 60.0
+
+    arrival = trace['arrival_s']
+    actual_mem = trace['memory'].tolist()
+    duration_s = (trace['time_min'] * 60.0).tolist()
+    label_of = policy.labels(trace).tolist()
+    n_builds = len(label_of)
+
+    # Per-build results
+    wait_s = np.full(n_builds, np.nan)
+    queued_at = arrival.tolist()
+    attempts = [0] * n_builds
+
+    # Per-node state (parallel lists indexed by node id)
+    node_label, node_free, node_mem_free, node_booted, node_warm = [], [], [], [], []
+    node_alive, node_in_free, node_idle_token = [], [], []
+
+    queues = [deque() for _ in range(n_labels)]
+    free_nodes = [[] for _ in range(n_labels)]  # stack of node ids with a free executor
+    alive = [0] * n_labels
+    booting_exec = [0] * n_labels
+    node_seconds = [0.0] * n_labels
+    busy_exec_s = [0.0] * n_labels
+    used_mem_s = [0.0] * n_labels
+    oom_kills = [0] * n_labels
+    first_oom = 0
+    events = []
+
+    def boot(lab, t, is_warm=False):
+        node = len(node_label)
+        node_label.append(lab)
+        node_free.append(0)
+        node_mem_free.append(NODE_MEMORY[lab])
+        node_booted.append(t)
+        node_warm.append(is_warm)
+        node_alive.append(True)
+        node_in_free.append(False)
+        node_idle_token.append(0)
+        alive[lab] += 1
+        booting_exec[lab] += executors[lab]
+        heapq.heappush(events, (t if is_warm else t + boot_s, NODE_READY, node, 0))
+
+    def start(b, node, t):
+        lab = node_label[node]
+        if attempts[b] == 0:
+            wait_s[b] = t - queued_at[b]
+        attempts[b] += 1
+        node_free[node] -= 1
+        run_s = duration_s[b]
+        if actual_mem[b] > node_mem_free[node]:
+            # Under-provisioned: killed once memory outgrows the node
+            run_s *= oom_at
+            heapq.heappush(events, (t + run_s, BUILD_END, b, ~node))
+        else:
+            node_mem_free[node] -= actual_mem[b]
+            used_mem_s[lab] += actual_mem[b] * run_s
+            heapq.heappush(events, (t + run_s, BUILD_END, b, node))
+        busy_exec_s[lab] += run_s
+
+    def dispatch(lab, t):
+        queue, free = queues[lab], free_nodes[lab]
+        while queue and free:
+            node = free[-1]
+            if not node_alive[node] or node_free[node] == 0:
+                free.pop()
+                node_in_free[node] = False
+                continue
+            start(queue.popleft(), node, t)
+        # Boot nodes for demand not already covered by booting executors
+        pending = len(queue) - booting_exec[lab]
+        while pending > 0 and alive[lab] < max_nodes[lab]:
+            boot(lab, t)
+            pending -= executors[lab]
+
+    def release(node, t):
+        lab = node_label[node]
+        node_free[node] += 1
+        if not node_in_free[node]:
+            node_in_free[node] = True
+            free_nodes[lab].append(node)
+        if node_free[node] == executors[lab] and not node_warm[node]:
+            node_idle_token[node] += 1
+            heapq.heappush(events, (t + idle_s, IDLE_CHECK, node, node_idle_token[node]))
+
+    for lab, label in enumerate(LABELS):
+        for _ in range(int((warm or {}).get(label, 0))):
+            boot(lab, 0.0, is_warm=True)
+
+    n_events = 0
+    next_build = 0
+    arrival_list = arrival.tolist()
+    t = 0.0
+    while next_build < n_builds or events:
+        if next_build < n_builds and (not events or arrival_list[next_build] <= events[0][0]):
+            # Arrival
+            b = next_build
+            next_build += 1
+            t = arrival_list[b]
+            lab = label_of[b]
+            queues[lab].append(b)
+            dispatch(lab, t)
+            n_events += 1
+            continue
+
+        t, kind, a, node = heapq.heappop(events)
+        n_events += 1
+        if kind == BUILD_END:
+            b = a
+            if node < 0:
+                node = ~node
+                lab = node_label[node]
+                oom_kills[lab] += 1
+                if attempts[b] == 1:
+                    first_oom += 1
+                release(node, t)
+                if attempts[b] < max_attempts:
+                    # Retry one label up, as a re-run with a bigger label would
+                    label_of[b] = min(lab + 1, n_labels - 1)
+                    queued_at[b] = t
+                    queues[label_of[b]].append(b)
+                    dispatch(label_of[b], t)
+            else:
+                node_mem_free[node] += actual_mem[b]
+                release(node, t)
+            dispatch(node_label[node], t)
+        elif kind == NODE_READY:
+            lab = node_label[a]
+            booting_exec[lab] -= executors[lab]
+            node_free[a] = executors[lab]
+            node_in_free[a] = True
+            free_nodes[lab].append(a)
+            dispatch(lab, t)
+            if node_free[a] == executors[lab] and not node_warm[a]:
+                heapq.heappush(events, (t + idle_s, IDLE_CHECK, a, node_idle_token[a]))
+        elif node_alive[a] and node == node_idle_token[a] and node_free[a] == executors[node_label[a]]:
+            # IDLE_CHECK still current: the node stayed idle the whole timeout
+            lab = node_label[a]
+            node_alive[a] = False
+            alive[lab] -= 1
+            node_seconds[lab] += t - node_booted[a]
+
+    end_t = t
+    for node, lab in enumerate(node_label):
+        if node_alive[node]:
+            node_seconds[lab] += end_t - node_booted[node]
+
+    return _report(policy, trace, wait_s, label_of, executors, price, node_seconds, busy_exec_s,
+                   used_mem_s, oom_kills, first_oom, len(node_label), n_events,
+                   time.perf_counter() - started)
+
+
+def _report(policy, trace, wait_s, label_of, executors, price, node_seconds, busy_exec_s,
+            used_mem_s, oom_kills, first_oom, nodes_launched, n_events, elapsed_s):
+    n_builds = len(wait_s)
+    wait_min = wait_s[~np.isnan(wait_s)] / 60.0
+    exec_s = sum(node_seconds[i] * executors[i] for i in range(len(LABELS)))
+    mem_s = sum(node_seconds[i] * NODE_MEMORY[i] for i in range(len(LABELS)))
+    cost = sum(node_seconds[i] / 3600.0 * price[i] for i in range(len(LABELS)))
+    initial = np.bincount(policy.labels(trace), minlength=len(LABELS))
+
+    per_label = {}
+    for i, label in enumerate(LABELS):
+        per_label[label] = {
+            'builds': int(initial[i]),
+            'node_hours': round(node_seconds[i] / 3600.0, 1),
+            'executor_utilization': round(busy_exec_s[i] / (node_seconds[i] * executors[i]), 3)
+            if node_seconds[i] else 0.0,
+            'oom_kills': oom_kills[i],
+            'cost': round(node_seconds[i] / 3600.0 * price[i], 2),
+        }
+
+    def pct(q):
+        return round(float(np.percentile(wait_min, q)), 2) if len(wait_min) else 0.0
+
+    return {
+        'policy': policy.name,
+        'builds': n_builds,
+        'simulated_days': round(float(trace['arrival_s'][-1] - trace['arrival_s'][0]) / 86400, 1)
+        if n_builds else 0.0,
+        'queue_wait_min': {
+            'mean': round(float(wait_min.mean()), 2) if len(wait_min) else 0.0,
+            'p50': pct(50), 'p95': pct(95), 'p99': pct(99),
+            'max': round(float(wait_min.max()), 2) if len(wait_min) else 0.0,
+        },
+        'oom_kill_rate': round(first_oom / n_builds, 4) if n_builds else 0.0,
+        'oom_kills': sum(oom_kills),
+        'executor_utilization': round(sum(busy_exec_s) / exec_s, 3) if exec_s else 0.0,
+        'memory_utilization': round(sum(used_mem_s) / mem_s, 3) if mem_s else 0.0,
+        'nodes_launched': nodes_launched,
+        'node_hours': round(sum(node_seconds) / 3600.0, 1),
+        'cost_usd': round(cost, 2),
+        'cost_per_build_usd': round(cost / n_builds, 5) if n_builds else 0.0,
+        'per_label': per_label,
+        'events': n_events,
+        'elapsed_s': round(elapsed_s, 2),
+        'events_per_s': round(n_events / elapsed_s) if elapsed_s else 0,
+    }
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def parse_label_counts(values):
+    counts = {}
+    for value in values or []:
+        label, _, count = value.partition('=')
+        if label not in INSTANCES:
+            raise ValueError(f"Unknown label: {label} (expected one of {LABELS})")
+        counts[label] = int(count)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate node-selection policies over a build trace')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--trace', help='Trace CSV (timestamp or arrival_s, actuals, optional pred_* columns)')
+    source.add_argument('--log-db', help='Prediction log database (joined predictions and outcomes)')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH, help='Dataset to synthesize a trace from')
+    parser.add_argument('--builds', type=int, default=100000, help='Synthesized trace length')
+    parser.add_argument('--days', type=int, default=30, help='Synthesized trace horizon')
+    parser.add_argument('--prediction-error', type=float, default=DEFAULT_PREDICTION_ERROR,
+                        help='Lognormal sigma of synthesized predictions')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--policy', nargs='+', default=[f'buffer:{MEMORY_BUFFER}'],
+                        help=f'Policies to compare: {", ".join(POLICIES)} (e.g. buffer:1.5 static:test)')
+    parser.add_argument('--max-nodes', nargs='*', metavar='LABEL=N', help='Per-label node cap')
+    parser.add_argument('--warm', nargs='*', metavar='LABEL=N', help='Always-on nodes per label')
+    parser.add_argument('--boot-min', type=float, default=DEFAULT_BOOT_MIN)
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT_MIN)
+    parser.add_argument('--oom-at', type=float, default=DEFAULT_OOM_AT,
+                        help='Fraction of runtime an OOM-killed build runs before dying')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help='Attempts per build (retries go one label up); 1 disables retries')
+    parser.add_argument('--report', help='Write the comparison JSON to this file')
+    args = parser.parse_args()
+
+    try:
+        policies = [parse_policy(spec) for spec in args.policy]
+        max_nodes = parse_label_counts(args.max_nodes)
+        warm = parse_label_counts(args.warm)
+        if args.log_db:
+            trace = load_trace_log(args.log_db)
+        elif args.trace:
+            trace = load_trace_csv(args.trace, args.prediction_error, args.seed)
+        else:
+            trace = synthesize_trace(args.data, args.builds, args.days, args.prediction_error, args.seed)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    reports = []
+    for policy in policies:
+        report = simulate(trace, policy, max_nodes, warm, args.boot_min, args.idle_timeout,
+                          args.oom_at, args.max_attempts)
+        reports.append(report)
+        print(f"✅ {report['policy']}: wait p95 {report['queue_wait_min']['p95']} min, "
+              f"OOM {report['oom_kill_rate']:.2%}, cost ${report['cost_usd']} "
+              f"({report['elapsed_s']}s)", file=sys.stderr)
+
+    output = json.dumps(reports, indent=2)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
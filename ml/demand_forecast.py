@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Demand Forecast for Node Pool Pre-Warming
+==========================================
+Turns the hour-of-day shape of build traffic into a per-label warm-pool
+schedule, so nodes are already up when the morning peak arrives instead
+of every build paying for a cold EC2 launch.
+
+Builds (from the prediction log, or historic data such as
+enhanced_training_data.csv) are labelled with the 1.2x rule and rolled up
+per (day, hour, label): build count, memory GB, CPU cores and executor
+minutes. A build's minutes are spread over the hours it actually runs.
+All grouping is one np.bincount per batch.
+
+The rollups are the forecast state: they are saved to a small JSON file
+and days older than --window-days are dropped. Prediction log rows are
+merged in by id watermark, so a refresh only reads what arrived since the
+last one. CSV rows are matched by a 64-bit hash of the row (build_id,
+timestamp and targets) kept per day in the window, so late-arriving or
+unsorted rows are still merged once; a CSV refresh rereads the file but
+only hashes and rolls up, and the hashes (8 bytes per build) are saved
+as a sorted array in <state>.seen.npz next to the JSON. The window, UTC offset and buffer are part
+of the state; a refresh with different --window-days/--utc-offset is
+refused (start a new state file instead).
+
+Warm pool size for (label, hour) at service level s is the s-quantile,
+across the days in the window, of that hour's average busy executors,
+divided by executors per node and rounded up.
+
+Usage:
+    python demand_forecast.py --log-db prediction_log.db --state demand_state.json --service-level 0.9
+    python demand_forecast.py --csv ../resources/enhanced_training_data.csv --state demand_state.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from node_pool import INSTANCES, MEMORY_BUFFER, label_indices
+
+
+LABELS = list(INSTANCES)
+EXECUTORS = np.array([INSTANCES[label]['executors'] for label in LABELS], dtype=float)
+
+# Rolled-up measures per (day, hour, label)
+MEASURES = ['builds', 'memory_gb', 'cpu_cores', 'executor_minutes']
+
+DEFAULT_SERVICE_LEVEL = 0.9
+DEFAULT_WINDOW_DAYS = 28
+MAX_SPAN_HOURS = 48             # longer builds are clipped when spreading minutes
+STATE_VERSION = 3
+CSV_COLUMNS = ['timestamp', 'memory_gb', 'cpu_avg_pct', 'build_time_min']
+
+
+# =============================================================================
+# ROLLUP STATE
+# =============================================================================
+
+def first_copies(keys):
+    """Mask of the first occurrence of each key."""
+    order = np.argsort(keys, kind='stable')
+    first = np.ones(len(keys), dtype=bool)
+    first[order[1:]] = keys[order[1:]] != keys[order[:-1]]
+    return first
+
+
+def sorted_contains(sorted_keys, keys):
+    """Mask of keys present in the sorted array (np.isin without re-sorting it)."""
+    at = np.minimum(np.searchsorted(sorted_keys, keys), max(len(sorted_keys) - 1, 0))
+    return sorted_keys[at] == keys if len(sorted_keys) else np.zeros(len(keys), dtype=bool)
+
+
+def seen_path(state_path):
+    """The CSV row hash array saved next to a state JSON."""
+    return f'{os.path.splitext(state_path)[0]}.seen.npz'
+
+
+class DemandForecast:
+    """
+    Per-day (24 x labels x measures) rollups plus what has been ingested.
+
+    Memory is bounded by window_days x 24 x labels x measures floats, plus
+    one uint64 row hash per CSV build in the window.
+    """
+
+    def __init__(self, window_days=DEFAULT_WINDOW_DAYS, utc_offset_hours=0.0, buffer=MEMORY_BUFFER):
+        self.window_days = window_days
+        self.utc_offset_hours = utc_offset_hours
+        self.buffer = buffer
+        self.days = {}              # day number -> ndarray (24, labels, measures)
+        self.last_id = 0            # prediction log watermark
+        self.seen = {}              # day number -> sorted uint64 array of CSV row hashes merged
+
+    # ------------------------------------------------------------------ ingest
+
+    def add(self, ts, memory_gb, cpu_pct, time_min):
+        """Merge a batch of builds (arrays of epoch seconds and predictions)."""
+        ts = np.asarray(ts, dtype=float)
+        if not len(ts):
+            return 0
+        memory_gb = np.asarray(memory_gb, dtype=float)
+        cpu_cores = np.asarray(cpu_pct, dtype=float) / 100.0
+        minutes = np.clip(np.asarray(time_min, dtype=float), 0, MAX_SPAN_HOURS * 60)
+        label = label_indices(memory_gb, self.buffer)
+
+        local_min = (ts + self.utc_offset_hours * 3600) / 60.0
+        start_hour = np.floor(local_min / 60.0).astype(np.int64)   # hours since epoch
+        first_day = int(start_hour.min() // 24)
+        n_labels = len(LABELS)
+
+        # Spread each build's minutes over the hours it runs: one row per
+        # (build, hour spanned), minutes = overlap of [start, end) with the hour
+        end_min = local_min + minutes
+        spans = (np.floor(np.maximum(end_min - 1e-9, local_min) / 60.0).astype(np.int64) - start_hour) + 1
+        build = np.repeat(np.arange(len(ts)), spans)
+        hour = start_hour[build] + (np.arange(len(build)) - np.repeat(np.cumsum(spans) - spans, spans))
+        overlap = (np.minimum(end_min[build], (hour + 1) * 60.0)
+                   - np.maximum(local_min[build], hour * 60.0))
+
+        n_days = int(hour.max() // 24) - first_day + 1
+        size = n_days * 24 * n_labels
+
+        def cells(hours, labels):
+            return (hours - first_day * 24) * n_labels + labels
+
+        starts = cells(start_hour, label)
+        totals = np.stack([
+            np.bincount(starts, minlength=size),
+            np.bincount(starts, weights=memory_gb, minlength=size),
+            np.bincount(starts, weights=cpu_cores, minlength=size),
+            np.bincount(cells(hour, label[build]), weights=overlap, minlength=size),
+        ], axis=-1).reshape(n_days, 24, n_labels, len(MEASURES))
+
+        for offset in np.flatnonzero(totals.reshape(n_days, -1).any(axis=1)):
+            day = first_day + int(offset)
+            if day in self.days:
+                self.days[day] += totals[offset]
+            else:
+                self.days[day] = totals[offset].copy()
+        self._prune()
+        return len(ts)
+
+    def _prune(self):
+        if self.days:
+            newest = max(self.days)
+            for day in [d for d in self.days if d <= newest - self.window_days]:
+                del self.days[day]
+            for day in [d for d in self.seen if d <= newest - self.window_days]:
+                del self.seen[day]
+
+    def refresh_from_log(self, db_path, chunk_size=50_000):
+        """Merge predictions logged since the last refresh."""
+        from prediction_log import PredictionLog
+
+        log = PredictionLog(db_path)
+        added = 0
+        try:
+            cursor = log.predictions_since(self.last_id)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                ids, ts, cpu, memory, minutes = np.array(rows, dtype=float).T
+                added += self.add(ts, memory, cpu, minutes)
+                self.last_id = int(ids[-1])
+        finally:
+            log.close()
+        return added
+
+    def refresh_from_csv(self, path, chunk_size=50_000):
+        """Merge rows of a historic CSV not merged before (actuals as demand), in any order."""
+        header = pd.read_csv(path, nrows=0).columns
+        columns = (['build_id'] if 'build_id' in header else []) + CSV_COLUMNS
+        known = np.sort(np.concatenate([np.zeros(0, dtype=np.uint64), *self.seen.values()]))
+        merged_days, merged_keys = [], []
+        added = 0
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+            ts = pd.to_datetime(chunk['timestamp']).to_numpy().astype('datetime64[s]').astype(np.int64).astype(float)
+            keys = pd.util.hash_pandas_object(chunk[columns], index=False, categorize=False).to_numpy()
+            days = np.floor((ts + self.utc_offset_hours * 3600) / 86400).astype(np.int64)
+
+            # New: not merged before, first copy within the chunk, and inside the window
+            new = first_copies(keys) & ~sorted_contains(known, keys)
+            if self.days:
+                new &= days > max(self.days) - self.window_days
+            if new.any():
+                known = np.sort(np.concatenate([known, keys[new]]))
+            merged_days.append(days[new])
+            merged_keys.append(keys[new])
+            if new.any():
+                added += self.add(ts[new], chunk['memory_gb'].to_numpy()[new],
+                                  chunk['cpu_avg_pct'].to_numpy()[new], chunk['build_time_min'].to_numpy()[new])
+
+        if added:
+            days = np.concatenate(merged_days)
+            keys = np.concatenate(merged_keys)
+            order = np.lexsort((keys, days))
+            days, keys = days[order], keys[order]
+            bounds = np.flatnonzero(np.diff(days)) + 1
+            for day, day_keys in zip(days[np.r_[0, bounds]].tolist(), np.split(keys, bounds)):
+                old = self.seen.get(day)
+                self.seen[day] = day_keys if old is None else np.sort(np.concatenate([old, day_keys]))
+        self._prune()
+        return added
+
+    # ---------------------------------------------------------------- forecast
+
+    def _stack(self):
+        """(days, 24, labels, measures) over every day in the window, empty days as zeros."""
+        if not self.days:
+            return np.zeros((0, 24, len(LABELS), len(MEASURES)))
+        newest = max(self.days)
+        first = max(min(self.days), newest - self.window_days + 1)
+        empty = np.zeros((24, len(LABELS), len(MEASURES)))
+        return np.stack([self.days.get(day, empty) for day in range(first, newest + 1)])
+
+    def schedule(self, service_level=DEFAULT_SERVICE_LEVEL):
+        """Per-label warm nodes for each hour of the day, plus the demand behind them."""
+        stacked = self._stack()
+        if not len(stacked):
+            return {'days_observed': 0, 'service_level': service_level, 'warm_nodes': {}, 'demand': {}}
+
+        busy = stacked[..., MEASURES.index('executor_minutes')] / 60.0         # (days, 24, labels)
+        needed = np.quantile(busy, service_level, axis=0)                     # (24, labels)
+        warm = np.ceil(np.round(needed / EXECUTORS, 6)).astype(int)
+        mean = stacked.mean(axis=0)                                           # (24, labels, measures)
+
+        return {
+            'days_observed': len(stacked),
+            'service_level': service_level,
+            'utc_offset_hours': self.utc_offset_hours,
+            'warm_nodes': {label: warm[:, i].tolist() for i, label in enumerate(LABELS)},
+            'demand': {
+                label: {
+                    'busy_executors_p': np.round(needed[:, i], 2).tolist(),
+                    **{f'mean_{m}': np.round(mean[:, i, j], 2).tolist() for j, m in enumerate(MEASURES)},
+                }
+                for i, label in enumerate(LABELS)
+            },
+        }
+
+    # ------------------------------------------------------------- persistence
+
+    def save(self, path):
+        state = {
+            'version': STATE_VERSION,
+            'window_days': self.window_days,
+            'utc_offset_hours': self.utc_offset_hours,
+            'buffer': self.buffer,
+            'labels': LABELS,
+            'last_id': self.last_id,
+            'seen_rows': sum(len(keys) for keys in self.seen.values()),
+            'days': {str(day): np.round(values, 4).tolist() for day, values in sorted(self.days.items())},
+        }
+        # Hashes first: the JSON's seen_rows must match them for the pair to load
+        seen_days = sorted(self.seen)
+        tmp = f'{seen_path(path)}.tmp.npz'
+        np.savez(tmp, days=np.array(seen_days, dtype=np.int64),
+                 counts=np.array([len(self.seen[day]) for day in seen_days], dtype=np.int64),
+                 keys=np.concatenate([np.zeros(0, dtype=np.uint64), *(self.seen[day] for day in seen_days)]))
+        os.replace(tmp, seen_path(path))
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, **defaults):
+        """Restore saved state; a missing, incompatible or half-written pair starts fresh."""
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            with np.load(seen_path(path)) as data:
+                seen_days, counts, keys = data['days'], data['counts'], data['keys']
+        except (FileNotFoundError, ValueError, KeyError):
+            return cls(**defaults)
+        if (state.get('version') != STATE_VERSION or state.get('labels') != LABELS
+                or state.get('seen_rows') != len(keys)):
+            return cls(**defaults)
+        forecast = cls(state['window_days'], state['utc_offset_hours'], state['buffer'])
+        forecast.last_id = state['last_id']
+        forecast.seen = dict(zip(seen_days.tolist(), np.split(keys, np.cumsum(counts)[:-1])))
+        forecast.days = {int(day): np.array(values) for day, values in state['days'].items()}
+        return forecast
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-label warm-pool schedule from hour-of-day demand')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--log-db', help='Prediction log database (predicted resources)')
+    source.add_argument('--csv', help='Historic builds CSV (timestamp, memory_gb, cpu_avg_pct, build_time_min)')
+    parser.add_argument('--state', help='Forecast state JSON; refreshed incrementally when it exists')
+    parser.add_argument('--service-level', type=float, default=DEFAULT_SERVICE_LEVEL,
+                        help='Fraction of days each hour\'s warm pool should cover')
+    parser.add_argument('--window-days', type=int,
+                        help=f'Days of rollups kept (default: {DEFAULT_WINDOW_DAYS}, or the saved state\'s)')
+    parser.add_argument('--utc-offset', type=float,
+                        help='Hours added to log timestamps to get local time of day (default: 0, or the saved state\'s)')
+    parser.add_argument('--output', help='Write the schedule JSON to this file')
+    args = parser.parse_args()
+
+    if not 0 < args.service_level <= 1:
+        parser.error('--service-level must be in (0, 1]')
+
+    defaults = {'window_days': DEFAULT_WINDOW_DAYS if args.window_days is None else args.window_days,
+                'utc_offset_hours': 0.0 if args.utc_offset is None else args.utc_offset}
+    forecast = DemandForecast.load(args.state, **defaults) if args.state else DemandForecast(**defaults)
+    for flag, given, saved in (('--window-days', args.window_days, forecast.window_days),
+                               ('--utc-offset', args.utc_offset, forecast.utc_offset_hours)):
+        if given is not None and given != saved:
+            print(f"❌ {flag} {given} conflicts with {saved} in {args.state}; "
+                  f"use a new --state file to change it", file=sys.stderr)
+            sys.exit(1)
+
+    try:
+        if args.log_db:
+            added = forecast.refresh_from_log(args.log_db)
+        else:
+            added = forecast.refresh_from_csv(args.csv)
+    except FileNotFoundError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.state:
+        forecast.save(args.state)
+    print(f"✅ Merged {added} new builds ({len(forecast.days)} days in window)", file=sys.stderr)
+
+    output = json.dumps(forecast.schedule(args.service_level), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Feature Drift Monitor
+=====================
+Detects when production build contexts move away from the data the model
+was trained on (e.g. much larger repo_size_mb or new dependency_count
+ranges), which otherwise degrades predictions silently.
+
+- train_model.py stores a compact reference histogram per feature in
+  features.json ('drift_reference': fixed bin edges + training counts)
+- The predictor bins each request's features into the same edges
+  (O(1) per feature) and the counts are persisted per day by the
+  prediction log, so memory stays bounded by features x bins. Counts are
+  tagged with a hash of the edges, so bins from before a retrain are never
+  compared against the new reference
+- PSI and a binned KS statistic are computed per feature on demand, and
+  alerts fire past configurable thresholds
+
+Usage:
+    python drift_monitor.py --db prediction_log.db --manifest features.json --days 7
+    (exits with status 2 when any feature is past a threshold)
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+from bisect import bisect_right
+
+
+DEFAULT_PSI_THRESHOLD = 0.2     # > 0.2 is conventionally a significant shift
+DEFAULT_KS_THRESHOLD = 0.1
+DEFAULT_MIN_SAMPLES = 100       # don't alert on a handful of requests
+
+PSI_EPSILON = 1e-4
+
+
+# =============================================================================
+# STREAMING SKETCHES
+# =============================================================================
+
+def reference_id(reference):
+    """Short hash of a drift reference's bin edges (what a stored bin index means)."""
+    edges = {f: spec['edges'] for f, spec in reference['features'].items()}
+    return hashlib.sha1(json.dumps(edges, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class DriftMonitor:
+    """
+    Bins live feature vectors into the reference histogram edges.
+
+    Counts accumulate in a small pending dict keyed by (feature, bin) until
+    the prediction log drains them into its drift table.
+    """
+
+    def __init__(self, reference):
+        self.reference = reference
+        self.reference_id = reference_id(reference)
+        self.edges = {f: spec['edges'] for f, spec in reference['features'].items()}
+        self.pending = {}
+
+    @classmethod
+    def from_manifest(cls, manifest_path):
+        """Load from a features.json; returns None if it has no drift reference."""
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        reference = manifest.get('drift_reference')
+        return cls(reference) if reference else None
+
+    def update(self, features):
+        """Add one feature vector (a dict keyed by feature name)."""
+        for feature, edges in self.edges.items():
+            key = (feature, bisect_right(edges, features.get(feature, 0)))
+            self.pending[key] = self.pending.get(key, 0) + 1
+
+    def drain(self):
+        """Return and reset the pending (feature, bin) -> count increments."""
+        pending, self.pending = self.pending, {}
+        return pending
+
+
+# =============================================================================
+# DRIFT SCORES
+# =============================================================================
+
+def psi(reference_counts, observed_counts):
+    """Population Stability Index between two histograms over the same bins."""
+    ref_total = sum(reference_counts) or 1
+    obs_total = sum(observed_counts) or 1
+    score = 0.0
+    for r, o in zip(reference_counts, observed_counts):
+        r = max(r / ref_total, PSI_EPSILON)
+        o = max(o / obs_total, PSI_EPSILON)
+        score += (o - r) * math.log(o / r)
+    return score
+
+
+def ks(reference_counts, observed_counts):
+    """Kolmogorov-Smirnov statistic evaluated at the bin edges."""
+    ref_total = sum(reference_counts) or 1
+    obs_total = sum(observed_counts) or 1
+    ref_cdf = obs_cdf = 0.0
+    stat = 0.0
+    for r, o in zip(reference_counts, observed_counts):
+        ref_cdf += r / ref_total
+        obs_cdf += o / obs_total
+        stat = max(stat, abs(ref_cdf - obs_cdf))
+    return stat
+
+
+def drift_scores(reference, observed):
+    """
+    Score every reference feature against observed bin counts.
+
+    observed maps feature -> {bin: count}. Returns feature -> {'psi', 'ks', 'n'}.
+    """
+    scores = {}
+    for feature, spec in reference['features'].items():
+        bins = observed.get(feature, {})
+        counts = [bins.get(i, 0) for i in range(len(spec['counts']))]
+        scores[feature] = {
+            'psi': round(psi(spec['counts'], counts), 4),
+            'ks': round(ks(spec['counts'], counts), 4),
+            'n': sum(counts),
+        }
+    return scores
+
+
+def find_alerts(scores, psi_threshold=DEFAULT_PSI_THRESHOLD,
+                ks_threshold=DEFAULT_KS_THRESHOLD, min_samples=DEFAULT_MIN_SAMPLES):
+    """Features whose PSI or KS is past its threshold, worst PSI first."""
+    alerts = [
+        {'feature': feature, **score}
+        for feature, score in scores.items()
+        if score['n'] >= min_samples and (score['psi'] > psi_threshold or score['ks'] > ks_threshold)
+    ]
+    return sorted(alerts, key=lambda a: -a['psi'])
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    from prediction_log import PredictionLog
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Report feature drift against the training distribution')
+    parser.add_argument('--db', required=True, help='Prediction log SQLite database')
+    parser.add_argument('--manifest', default=os.path.join(script_dir, 'features.json'),
+                        help='features.json written by train_model.py')
+    parser.add_argument('--days', type=int, default=7, help='Days of traffic to compare')
+    parser.add_argument('--psi-threshold', type=float, default=DEFAULT_PSI_THRESHOLD)
+    parser.add_argument('--ks-threshold', type=float, default=DEFAULT_KS_THRESHOLD)
+    parser.add_argument('--min-samples', type=int, default=DEFAULT_MIN_SAMPLES)
+    args = parser.parse_args()
+
+    monitor = DriftMonitor.from_manifest(args.manifest)
+    if monitor is None:
+        print(f"❌ No drift reference in {args.manifest} (retrain with train_model.py)", file=sys.stderr)
+        sys.exit(1)
+
+    log = PredictionLog(args.db)
+    try:
+        observed = log.drift_counts(monitor.reference_id, days=args.days)
+    finally:
+        log.close()
+
+    scores = drift_scores(monitor.reference, observed)
+    alerts = find_alerts(scores, args.psi_threshold, args.ks_threshold, args.min_samples)
+    print(json.dumps({'days': args.days, 'scores': scores, 'alerts': alerts}, indent=2))
+
+    for alert in alerts:
+        print(f"⚠️ Drift in {alert['feature']}: PSI {alert['psi']:.3f}, KS {alert['ks']:.3f} "
+              f"(n={alert['n']})", file=sys.stderr)
+    sys.exit(2 if alerts else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Flattened Forest Arrays
+=======================
+The trained RandomForestRegressor as a handful of flat numpy arrays (all
+trees' nodes concatenated), plus a batch traversal that walks every row
+down every tree at once, one depth level per step.
+
+Leaves point at themselves (threshold +inf), so after max_depth steps every
+(row, tree) sits on its leaf and no per-node masking is needed.
+
+Feature contributions use the path decomposition (Saabas): a tree's output
+is its root value plus, for each split on the path, the change in node
+value, credited to the split feature. Averaged over trees:
+
+    prediction = bias + sum(contributions)
+
+where bias is the mean root value. A leaf's path is fixed, so each leaf's
+contribution vector is tabulated once; explaining a batch is then the
+prediction traversal plus one table gather per tree.
+
+Usage:
+    python forest_arrays.py --model model.pkl --data ../resources/enhanced_training_data.csv --rows 1000
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+
+ROW_CHUNK = 4096        # rows per traversal step (bounds the (rows, trees, outputs) gathers)
+
+
+class FlatForest:
+    """Concatenated node arrays of a fitted sklearn forest (or single tree)."""
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, n_features):
+        self.feature = feature          # (nodes,) int32, 0 on leaves
+        self.threshold = threshold      # (nodes,) float64, +inf on leaves
+        self.left = left                # (nodes,) int64 global index; leaves point to themselves
+        self.right = right
+        self.value = value              # (nodes, outputs) mean target at each node
+        self.roots = roots              # (trees,) global index of each tree's root
+        self.max_depth = max_depth
+        self.n_features = n_features
+        self._leaf_contrib = None       # lazily built by _leaf_table()
+        self._node_lists = None         # lazily built by row_leaves()
+
+    @classmethod
+    def from_model(cls, model):
+        estimators = getattr(model, 'estimators_', [model])
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            n = tree.node_count
+            leaf = tree.children_left < 0
+            own = np.arange(offset, offset + n)
+            feature.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+            threshold.append(np.where(leaf, np.inf, tree.threshold))
+            left.append(np.where(leaf, own, tree.children_left + offset))
+            right.append(np.where(leaf, own, tree.children_right + offset))
+            value.append(tree.value[:, :, 0])
+            roots.append(offset)
+            offset += n
+        return cls(
+            np.concatenate(feature), np.concatenate(threshold),
+            np.concatenate(left).astype(np.int64), np.concatenate(right).astype(np.int64),
+            np.concatenate(value).astype(np.float64), np.array(roots, dtype=np.int64),
+            max(estimator.tree_.max_depth for estimator in estimators),
+            int(model.n_features_in_),
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_outputs(self):
+        return self.value.shape[1]
+
+    def arrays(self):
+        """Name -> array, e.g. for np.savez or copying into shared memory."""
+        return {
+            'feature': self.feature, 'threshold': self.threshold, 'left': self.left,
+            'right': self.right, 'value': self.value, 'roots': self.roots,
+            'meta': np.array([self.max_depth, self.n_features], dtype=np.int64),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        max_depth, n_features = (int(v) for v in arrays['meta'])
+        return cls(arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+                   arrays['value'], arrays['roots'], max_depth, n_features)
+
+    # ------------------------------------------------------------- traversal
+
+    def leaves(self, X, trees=None):
+        """(rows, trees) leaf index of every row in every tree (or the given tree subset)."""
+        X = np.asarray(X, dtype=np.float32)       # sklearn compares float32 features
+        roots = self.roots if trees is None else self.roots[trees]
+        out = np.empty((len(X), len(roots)), dtype=np.int64)
+        for start in range(0, len(X), ROW_CHUNK):
+            chunk = X[start:start + ROW_CHUNK]
+            rows = np.arange(len(chunk))[:, None]
+            idx = np.broadcast_to(roots, (len(chunk), len(roots))).copy()
+            for _ in range(self.max_depth):
+                go_left = chunk[rows, self.feature[idx]] <= self.threshold[idx]
+                idx = np.where(go_left, self.left[idx], self.right[idx])
+            out[start:start + ROW_CHUNK] = idx
+        return out
+
+    def row_leaves(self, x, trees=None):
+        """
+        Leaf index of one row in each tree (or the given trees), walking
+        tree by tree in plain Python until each leaf.
+
+        leaves() pays max_depth numpy steps whatever the batch size, which
+        dominates for a single row; this costs only the nodes on the row's
+        actual paths, so it is the faster choice for one row and a few trees.
+        """
+        if self._node_lists is None:
+            self._node_lists = (self.feature.tolist(), self.threshold.tolist(),
+                                self.left.tolist(), self.right.tolist(), self.roots.tolist())
+        feature, threshold, left, right, roots = self._node_lists
+        x = np.asarray(x, dtype=np.float32).tolist()
+        trees = range(len(roots)) if trees is None else np.asarray(trees).tolist()
+        out = []
+        for t in trees:
+            i = roots[t]
+            while left[i] != i:
+                i = left[i] if x[feature[i]] <= threshold[i] else right[i]
+            out.append(i)
+        return out
+
+    def tree_predictions(self, X, trees=None):
+        """(rows, trees, outputs) per-tree outputs."""
+        return self.value[self.leaves(X, trees)]
+
+    def predict(self, X):
+        return self.tree_predictions(X).mean(axis=1)
+
+    def _leaf_table(self):
+        """
+        Per-leaf path contributions, built once: (slot of each node, (leaves, features * outputs)).
+
+        Filled top-down one depth level at a time: a child inherits its
+        parent's row plus the value change, credited to the parent's split feature.
+        """
+        if self._leaf_contrib is None:
+            n_outputs = self.n_outputs
+            nodes = np.arange(len(self.feature))
+            table = np.zeros((len(nodes), self.n_features * n_outputs))
+            frontier = self.roots
+            while len(frontier):
+                frontier = frontier[self.left[frontier] != frontier]      # internal nodes only
+                for children in (self.left[frontier], self.right[frontier]):
+                    table[children] = table[frontier]
+                    cols = (self.feature[frontier] * n_outputs)[:, None] + np.arange(n_outputs)
+                    table[children[:, None], cols] += self.value[children] - self.value[frontier]
+                frontier = np.concatenate([self.left[frontier], self.right[frontier]])
+            leaf = self.left == nodes
+            slot = np.full(len(nodes), -1, dtype=np.int64)
+            slot[leaf] = np.arange(leaf.sum())
+            self._leaf_contrib = (slot, table[leaf])
+        return self._leaf_contrib
+
+    def contributions(self, X):
+        """
+        Path contributions: (bias (outputs,), contributions (rows, features, outputs)).
+
+        bias + contributions.sum(axis=1) equals the forest prediction. After
+        the one-off leaf table, this is the prediction traversal plus one
+        (rows, features * outputs) gather per tree.
+        """
+        slot, table = self._leaf_table()
+        leaf_slots = slot[self.leaves(X)]
+        contrib = np.zeros((len(leaf_slots), table.shape[1]))
+        for t in range(self.n_trees):
+            contrib += table[leaf_slots[:, t]]
+        contrib /= self.n_trees
+        bias = self.value[self.roots].mean(axis=0)
+        return bias, contrib.reshape(len(leaf_slots), self.n_features, self.n_outputs)
+
+
+def top_contributors(contributions, feature_names, values, top=5):
+    """Top |contribution| features of one row for one output, largest first."""
+    order = np.argsort(-np.abs(contributions))[:top]
+    return [
+        {'feature': feature_names[j], 'value': float(values[j]),
+         'contribution': round(float(contributions[j]), 4)}
+        for j in order if contributions[j] != 0
+    ]
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    import joblib
+    import pandas as pd
+    from predict import FEATURE_COLUMNS
+
+    parser = argparse.ArgumentParser(description='Benchmark flattened-forest prediction and contributions')
+    parser.add_argument('--model', required=True, help='Path to trained model.pkl')
+    parser.add_argument('--data', required=True, help='CSV with the 27 feature columns')
+    parser.add_argument('--rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    try:
+        model = joblib.load(args.model)
+        X = pd.read_csv(args.data, usecols=FEATURE_COLUMNS)[FEATURE_COLUMNS].to_numpy(dtype=float)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    X = X[np.arange(args.rows) % len(X)]
+
+    started = time.perf_counter()
+    forest = FlatForest.from_model(model)
+    flatten_s = time.perf_counter() - started
+    started = time.perf_counter()
+    forest._leaf_table()
+    table_s = time.perf_counter() - started
+
+    timings = {}
+    for name, fn in [('sklearn_predict', lambda: model.predict(X)),
+                     ('flat_predict', lambda: forest.predict(X)),
+                     ('contributions', lambda: forest.contributions(X))]:
+        started = time.perf_counter()
+        result = fn()
+        timings[name] = time.perf_counter() - started
+        if name == 'sklearn_predict':
+            expected = result
+        elif name == 'contributions':
+            bias, contrib = result
+            max_error = float(np.abs(bias + contrib.sum(axis=1) - expected).max())
+
+    print(f"✅ {forest.n_trees} trees, {len(forest.feature)} nodes, depth {forest.max_depth} "
+          f"(flattened in {flatten_s * 1000:.0f} ms, leaf contribution table {table_s * 1000:.0f} ms)")
+    for name, seconds in timings.items():
+        print(f"   {name:16s} {seconds * 1000:8.1f} ms  ({seconds / len(X) * 1e6:.1f} us/row)")
+    print(f"   max |bias + sum(contributions) - predict| = {max_error:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Git Metrics Extractor
+=====================
+All git-derived features from one streaming `git diff` pass.
+
+GitAnalyzer spawns git once per metric (name-only twice, numstat twice)
+and estimates source_files_pct / test_files_changed from the file count.
+Here a single `git diff --raw --numstat -z -M <base> <head>` is parsed as
+it streams: the --raw records carry each file's status (A/M/D/R...), the
+--numstat records its added/deleted lines, and every path is classified
+once with precompiled rules:
+- deps:   basename in GitAnalyzer's dependency file list
+- test:   test directories / file naming conventions
+- source: code file extensions (test code included)
+
+Output uses the context keys predict.py reads (filesChanged, linesAdded,
+linesDeleted, sourceFilesPct, depsChanged, testFilesChanged), so it can be
+merged straight into ml_input.json.
+
+Results are cached per (base SHA, head SHA) under the repository's git dir,
+so re-running a build for the same commits costs one `git rev-parse`.
+
+Usage:
+    python git_metrics.py --repo . --base HEAD~1 --head HEAD
+    python git_metrics.py --repo . --base origin/main --output git_metrics.json
+    python git_metrics.py --benchmark 100000
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Git's empty tree, used as the base when head is a root commit
+EMPTY_TREE = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+
+CACHE_DIRNAME = 'ml-git-metrics'
+CACHE_VERSION = 1
+READ_SIZE = 1 << 20
+
+# Same list GitAnalyzer.checkDependencyChanges() looks for
+DEPENDENCY_FILES = frozenset([
+    'build.gradle', 'build.gradle.kts',
+    'pom.xml',
+    'package.json', 'package-lock.json',
+    'requirements.txt', 'Pipfile',
+    'Gemfile', 'Gemfile.lock',
+    'go.mod', 'go.sum',
+    'Cargo.toml',
+])
+
+SOURCE_EXTENSIONS = frozenset([
+    'java', 'kt', 'kts', 'groovy', 'scala',
+    'py', 'js', 'jsx', 'ts', 'tsx', 'mjs', 'cjs', 'vue',
+    'c', 'cc', 'cpp', 'cxx', 'h', 'hpp', 'm', 'mm', 'swift',
+    'go', 'rs', 'rb', 'php', 'cs', 'fs', 'dart',
+    'sh', 'sql',
+])
+
+TEST_PATH_RE = re.compile(
+    r'(?:^|/)(?:tests?|__tests__|spec|androidTest|testFixtures)/'     # test directories
+    r'|(?:^|/)test_[^/]*\.py$|_test\.(?:py|go)$'                    # python / go
+    r'|(?:Test|Tests|IT|Spec)\.(?:java|kt|groovy|scala|swift)$'      # JVM / swift
+    r'|\.(?:test|spec)\.(?:js|jsx|ts|tsx|mjs)$'                      # JS / TS
+)
+
+
+# =============================================================================
+# CLASSIFICATION
+# =============================================================================
+
+class DiffTotals:
+    """Running totals over the diff stream; each path is classified once in add_numstat()."""
+
+    def __init__(self):
+        self.files = 0
+        self.lines_added = 0
+        self.lines_deleted = 0
+        self.binary_files = 0
+        self.source_files = 0
+        self.test_files = 0
+        self.deps_files = 0
+        self.status_counts = {}
+
+    def add_status(self, status):
+        key = status[:1]
+        self.status_counts[key] = self.status_counts.get(key, 0) + 1
+
+    def add_numstat(self, added, deleted, path):
+        self.files += 1
+        if added == '-':
+            self.binary_files += 1
+        else:
+            self.lines_added += int(added)
+            self.lines_deleted += int(deleted)
+
+        name = path.rpartition('/')[2]
+        if name in DEPENDENCY_FILES:
+            self.deps_files += 1
+        if name.rpartition('.')[2] in SOURCE_EXTENSIONS:
+            self.source_files += 1
+        if TEST_PATH_RE.search(path):
+            self.test_files += 1
+
+    def context(self):
+        """Keys as predict.py reads them."""
+        return {
+            'filesChanged': self.files,
+            'linesAdded': self.lines_added,
+            'linesDeleted': self.lines_deleted,
+            'sourceFilesPct': round(self.source_files / self.files, 4) if self.files else 0.0,
+            # Training data has deps_file_changed as 0/1
+            'depsChanged': 1 if self.deps_files else 0,
+            'testFilesChanged': self.test_files,
+            'gitDetails': {
+                'depsFilesChanged': self.deps_files,
+                'binaryFiles': self.binary_files,
+                'status': dict(sorted(self.status_counts.items())),
+            },
+        }
+
+
+# =============================================================================
+# STREAMING PARSER
+# =============================================================================
+
+def iter_tokens(stream):
+    """NUL-separated tokens from a binary stream, decoded, read in large blocks."""
+    pending = b''
+    while True:
+        block = stream.read(READ_SIZE)
+        if not block:
+            break
+        parts = (pending + block).split(b'\0')
+        pending = parts.pop()
+        for part in parts:
+            yield part.decode('utf-8', 'surrogateescape')
+    if pending:
+        yield pending.decode('utf-8', 'surrogateescape')
+
+
+def parse_diff(tokens):
+    """
+    Fold `git diff --raw --numstat -z` tokens into DiffTotals.
+
+    --raw:     ':<modes> <shas> <status>' then one path (two for R/C)
+    --numstat: '<added>\\t<deleted>\\t<path>', or '<added>\\t<deleted>\\t'
+               followed by old and new path for renames/copies
+    """
+    totals = DiffTotals()
+    tokens = iter(tokens)
+    for token in tokens:
+        if token.startswith(':'):
+            status = token.rpartition(' ')[2]
+            totals.add_status(status)
+            next(tokens, None)
+            if status[:1] in 'RC':
+                next(tokens, None)
+        elif token:
+            added, deleted, path = token.split('\t', 2)
+            if not path:
+                next(tokens, None)                  # old path
+                path = next(tokens, '')             # new path
+            totals.add_numstat(added, deleted, path)
+    return totals
+
+
+# =============================================================================
+# GIT
+# =============================================================================
+
+def git(repo, *args):
+    result = subprocess.run(['git', '-C', repo, *args], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+def resolve(repo, base, head):
+    """
+    (git_dir, base_sha, head_sha) in one rev-parse.
+
+    The base falls back to the empty tree only when it is head's parent
+    (the default HEAD~1) and head is a root commit. Any other base that
+    does not resolve (a typo, a ref missing from a shallow clone) is an
+    error rather than a diff of the whole repository.
+    """
+    try:
+        git_dir, base_sha, head_sha = git(repo, 'rev-parse', '--absolute-git-dir',
+                                          f'{base}^{{commit}}', f'{head}^{{commit}}').split()
+    except RuntimeError as e:
+        git_dir, head_sha = git(repo, 'rev-parse', '--absolute-git-dir', f'{head}^{{commit}}').split()
+        parents = git(repo, 'rev-list', '--parents', '-n', '1', head_sha).split()[1:]
+        if base not in (f'{head}~1', f'{head}^') or parents:
+            raise RuntimeError(f"Cannot resolve base revision '{base}': {e}") from e
+        base_sha = EMPTY_TREE
+    return git_dir, base_sha, head_sha
+
+
+def diff_totals(repo, base_sha, head_sha):
+    """Run the single diff process and parse it as it streams."""
+    proc = subprocess.Popen(
+        ['git', '-C', repo, 'diff', '--raw', '--numstat', '-z', '-M', '--no-color', '--no-ext-diff',
+         base_sha, head_sha],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        totals = parse_diff(iter_tokens(proc.stdout))
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read().decode(errors='replace')
+        proc.stderr.close()
+        code = proc.wait()
+    if code != 0:
+        raise RuntimeError(f"git diff failed: {stderr.strip()}")
+    return totals
+
+
+# =============================================================================
+# CACHED EXTRACTION
+# =============================================================================
+
+def extract(repo='.', base='HEAD~1', head='HEAD', use_cache=True):
+    """Git context keys for base..head, cached by the resolved commit SHAs."""
+    git_dir, base_sha, head_sha = resolve(repo, base, head)
+    cache_path = os.path.join(git_dir, CACHE_DIRNAME, f'{base_sha}_{head_sha}.json')
+
+    if use_cache:
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+            if cached.get('version') == CACHE_VERSION:
+                return cached['metrics']
+        except (FileNotFoundError, ValueError):
+            pass
+
+    metrics = diff_totals(repo, base_sha, head_sha).context()
+    metrics['gitDetails'].update({'baseSha': base_sha, 'headSha': head_sha})
+
+    if use_cache:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp = f'{cache_path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'metrics': metrics}, f)
+            os.replace(tmp, cache_path)
+        except OSError as e:
+            print(f"⚠️ Could not cache git metrics: {e}", file=sys.stderr)
+    return metrics
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+def make_benchmark_repo(path, n_files):
+    """Two commits touching n_files files, written with git fast-import."""
+    git(path, 'init', '-q')
+    # Bucketed into directories of ~250 entries; huge flat trees slow fast-import down
+    kinds = ['src/main/java/app/p{0}/Service{1}.java', 'src/test/java/app/p{0}/Service{1}Test.java',
+             'web/src/components/p{0}/Widget{1}.tsx', 'docs/p{0}/page{1}.md']
+    lines = []
+
+    def commit(mark, message, contents, parent=None):
+        lines.append('commit refs/heads/main')
+        lines.append(f'mark :{mark}')
+        lines.append('committer Bench <bench@example.com> 0 +0000')
+        lines.append(f'data {len(message)}\n{message}')
+        if parent:
+            lines.append(f'from :{parent}')
+        for i in range(n_files):
+            body = contents(i)
+            path = 'pom.xml' if i == 0 else kinds[i % len(kinds)].format(i // 1000, i)
+            lines.append(f'M 644 inline {path}')
+            lines.append(f'data {len(body)}\n{body}')
+
+    commit(1, 'base', lambda i: 'line\n' * 3)
+    commit(2, 'head', lambda i: 'line\n' * 2 + 'changed\n' * (i % 7 + 1), parent=1)
+    stream = ('\n'.join(lines) + '\n').encode()
+    subprocess.run(['git', '-C', path, 'fast-import', '--quiet'], input=stream, check=True)
+    return 'main~1', 'main'
+
+
+def benchmark(n_files):
+    workdir = tempfile.mkdtemp(prefix='git-metrics-bench-')
+    try:
+        started = time.perf_counter()
+        base, head = make_benchmark_repo(workdir, n_files)
+        setup_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        metrics = extract(workdir, base, head)
+        cold_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        extract(workdir, base, head)
+        cached_s = time.perf_counter() - started
+
+        # Parse cost alone, without git producing the diff
+        _, base_sha, head_sha = resolve(workdir, base, head)
+        raw = subprocess.run(['git', '-C', workdir, 'diff', '--raw', '--numstat', '-z', '-M',
+                              base_sha, head_sha], capture_output=True, check=True).stdout
+        started = time.perf_counter()
+        parse_diff(token.decode('utf-8', 'surrogateescape') for token in raw.split(b'\0'))
+        parse_s = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'files': n_files,
+        'metrics': {k: v for k, v in metrics.items() if k != 'gitDetails'},
+        'setup_s': round(setup_s, 2),
+        'cold_s': round(cold_s, 3),
+        'parse_only_s': round(parse_s, 3),
+        'cached_s': round(cached_s, 4),
+    }
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract git features for predict.py in one diff pass')
+    parser.add_argument('--repo', default='.', help='Repository path')
+    parser.add_argument('--base', default='HEAD~1', help='Base revision (default: HEAD~1, as GitAnalyzer)')
+    parser.add_argument('--head', default='HEAD', help='Head revision')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore and do not write the SHA cache')
+    parser.add_argument('--output', help='Write the JSON here (merged into it if the file exists)')
+    parser.add_argument('--benchmark', type=int, metavar='N', help='Time extraction on a synthetic N-file diff')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.benchmark), indent=2))
+        return
+
+    try:
+        metrics = extract(args.repo, args.base, args.head, use_cache=not args.no_cache)
+    except (RuntimeError, FileNotFoundError) as e:
+        print(json.dumps({'error': str(e)}), file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        # Merge into an existing context file (e.g. ml_input.json)
+        context = {}
+        if os.path.exists(args.output):
+            with open(args.output) as f:
+                context = json.load(f)
+        context.update(metrics)
+        with open(args.output, 'w') as f:
+            json.dump(context, f, indent=2)
+    print(json.dumps(metrics, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Jenkinsfile Parser
+==================
+Parses a declarative Jenkinsfile once into a small stage tree and derives
+the pipeline features predict.py uses from it.
+
+PipelineAnalyzer.analyzePipelineStructure lowercases the whole file and
+runs a dozen regexes over it on every build, comments included (a
+"// deploy later" comment turns hasDeployStage on). Here:
+- one regex tokenizer pass drops comments and yields strings, identifiers
+  and braces
+- the tokens are folded into a tree: stage('name') { ... } nodes,
+  parallel { } groups (nested to any depth), other blocks, and step calls
+  with their string arguments, plus @Library names and shared-library
+  (non-builtin) calls
+- the feature rules (PipelineAnalyzer's keyword patterns, precompiled) run
+  per stage over its name and step text only
+
+Features: stagesCount, hasBuildStage, hasUnitTests, hasIntegrationTests,
+hasE2ETests, hasDeployStage, hasDockerBuild, usesEmulator, parallelStages,
+plus detectedTemplate and sharedLibrary like PipelineAnalyzer.
+parallelStages is the widest parallel group (1 for a sequential pipeline),
+which is what parallel_stages means in the training data.
+
+Results are cached by the SHA-256 of the file content (in memory and on
+disk), so an unchanged Jenkinsfile costs one hash and one lookup.
+
+Usage:
+    python jenkinsfile_parser.py --jenkinsfile ../Jenkinsfile
+    python jenkinsfile_parser.py --jenkinsfile ../Jenkinsfile --tree
+    python jenkinsfile_parser.py --jenkinsfile ../Jenkinsfile --compare   # vs the regex rules
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+
+PARSER_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ml-node-selector', 'jenkinsfile')
+
+TOKEN_RE = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>'''.*?'''|\"\"\".*?\"\"\"|'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*")
+  | (?P<newline>\n)
+  | (?P<ident>@?[A-Za-z_][\w.]*)
+  | (?P<punct>[{}()\[\];:,])
+  | (?P<other>[^\s])
+""", re.VERBOSE | re.DOTALL)
+
+# Same builtins list PipelineAnalyzer uses to spot template calls
+JENKINS_BUILTINS = frozenset([
+    'pipeline', 'stage', 'steps', 'script', 'node', 'agent',
+    'echo', 'sh', 'bat', 'checkout', 'sleep', 'error', 'timeout',
+    'readFile', 'writeFile', 'fileExists', 'readJSON', 'writeJSON',
+    'dir', 'pwd', 'input', 'parallel', 'retry', 'catchError',
+    'archiveArtifacts', 'junit', 'stash', 'unstash',
+    'withCredentials', 'withEnv', 'build', 'wrap', 'mail',
+    'properties', 'library', 'choice', 'string', 'booleanParam',
+    'post', 'always', 'success', 'failure', 'unstable',
+    'environment', 'parameters', 'tools', 'when', 'expression',
+    'def', 'return', 'new', 'import', 'try', 'catch', 'finally',
+    'if', 'else', 'for', 'while', 'switch', 'case',
+    'collectMetadata', 'mlPredict', 'selectNode',
+])
+
+# This library's own steps: listed as library calls, never as the template
+NODE_SELECTOR_STEPS = frozenset(['collectMetadata', 'mlPredict', 'selectNode'])
+
+# Statement keywords that are not step calls
+NON_STEPS = frozenset(['def', 'return', 'new', 'import', 'if', 'else', 'for', 'while',
+                       'switch', 'case', 'try', 'catch', 'finally', 'true', 'false', 'null'])
+
+# PipelineAnalyzer's keyword rules, applied per stage to its name + step text
+FEATURE_RULES = {
+    'hasBuildStage': re.compile(
+        r'mvn\s|maven|gradle\s|npm run build|npm install|pip install|go build|make |cmake|ant |msbuild'
+        r'|dotnet build|cargo build|\bcompile\b|\bbuild\b|\bpackage\b|\bassemble'),
+    'hasUnitTests': re.compile(
+        r'unit\s*test|mvn\s+test|gradle test|pytest|npm test|npm run test|go test|jest|mocha|junit|nunit'
+        r'|xunit|rspec|phpunit|cargo test'),
+    'hasIntegrationTests': re.compile(
+        r'integration\s*test|mvn\s+verify|failsafe|integration-test|integrationtest'),
+    'hasE2ETests': re.compile(
+        r'e2e|end.to.end|appium|selenium|detox|cypress|playwright|puppeteer|nightwatch|testcafe'),
+    'hasDockerBuild': re.compile(
+        r'docker\s+build|docker\.build|docker-compose|dockerfile|docker push|docker tag|podman'),
+    'usesEmulator': re.compile(
+        r'emulator|simulator|\bavd\b|xctest|xcrun|instruments'),
+    'hasDeployStage': re.compile(
+        r'deploy|publish|release|upload|aws\s|kubectl|helm|ansible|terraform|s3\s|\becr\b|\becs\b|gcloud'
+        r'|\baz\s|heroku|netlify|vercel'),
+}
+# Declarative sections whose entries are settings rather than steps
+SETTINGS_BLOCKS = frozenset(['tools', 'environment', 'parameters', 'options', 'triggers', 'when', 'agent'])
+BUILD_TOOLS = frozenset(['maven', 'gradle', 'jdk', 'nodejs', 'go', 'python'])
+
+# Template config flags (e.g. javaMaven_template(runUnitTests: false))
+CONFIG_FLAGS = {
+    'hasUnitTests': re.compile(r'runUnitTests\s*:\s*(true|false)', re.IGNORECASE),
+    'hasIntegrationTests': re.compile(r'runIntegrationTests\s*:\s*(true|false)', re.IGNORECASE),
+    'hasE2ETests': re.compile(r'runE2E\s*:\s*(true|false)', re.IGNORECASE),
+    'hasDockerBuild': re.compile(r'dockerBuild\s*:\s*(true|false)', re.IGNORECASE),
+    'hasDeployStage': re.compile(r'deployEnabled\s*:\s*(true|false)', re.IGNORECASE),
+}
+
+_MEMORY_CACHE = {}
+
+
+# =============================================================================
+# TOKENIZER + TREE
+# =============================================================================
+
+def tokenize(text):
+    """(kind, value) tokens with comments dropped; string values are unquoted."""
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == 'comment':
+            continue
+        value = match.group()
+        if kind == 'string':
+            quote = 3 if value[:3] in ("'''", '"""') else 1
+            value = value[quote:-quote]
+        tokens.append((kind, value))
+    return tokens
+
+
+def new_node(kind, name=None):
+    return {'type': kind, 'name': name, 'children': [], 'steps': []}
+
+
+def build_tree(tokens):
+    """
+    Fold tokens into {'libraries', 'root'}: a tree of pipeline / stage /
+    parallel / block nodes, each with its step calls ({'name', 'args'}).
+    """
+    root = new_node('pipeline', 'pipeline')
+    stack = [root]
+    libraries = []
+    statement_start = True
+    after_assign = False
+    i, n = 0, len(tokens)
+
+    def peek(offset):
+        return tokens[i + offset] if i + offset < n else (None, None)
+
+    while i < n:
+        kind, value = tokens[i]
+
+        if kind == 'newline' or value == ';':
+            statement_start = True
+            after_assign = False
+            i += 1
+            continue
+
+        if value == '=' and peek(1)[1] != '=' and tokens[i - 1][0] == 'ident':
+            # def result = mlPredict(...): the right-hand call is a step too
+            statement_start = after_assign = True
+            i += 1
+            continue
+
+        if kind == 'ident' and value == '@Library':
+            # @Library('name') or @Library(['a', 'b'])
+            j = i + 1
+            while j < n and tokens[j][1] != ')':
+                if tokens[j][0] == 'string':
+                    libraries.append(tokens[j][1].split('@')[0])
+                j += 1
+            i = j + 1
+            if i < n and tokens[i][1] == '_':
+                i += 1
+            continue
+
+        if value == '}':
+            if len(stack) > 1:
+                stack.pop()
+            statement_start = True
+            i += 1
+            continue
+
+        if value == '{':
+            # A bare brace (closure or map literal) still nests
+            node = new_node('block')
+            stack[-1]['children'].append(node)
+            stack.append(node)
+            statement_start = True
+            i += 1
+            continue
+
+        if kind == 'ident':
+            # stage('Name') {
+            if (value == 'stage' and peek(1)[1] == '(' and peek(2)[0] == 'string'
+                    and peek(3)[1] == ')' and peek(4)[1] == '{'):
+                node = new_node('stage', peek(2)[1])
+                stack[-1]['children'].append(node)
+                stack.append(node)
+                i += 5
+                statement_start = True
+                continue
+            # name {   (stages, steps, parallel, post, script, ...)
+            if peek(1)[1] == '{':
+                node = new_node('parallel' if value == 'parallel' else 'block', value)
+                stack[-1]['children'].append(node)
+                stack.append(node)
+                i += 2
+                statement_start = True
+                continue
+            # Step call at statement start: name(args) / name 'arg' / name arg
+            is_call = peek(1)[1] == '('
+            if (statement_start and value not in NON_STEPS and peek(1)[1] != '='
+                    and (is_call or not (after_assign or '.' in value))):
+                args = []
+                depth = 0
+                j = i + 1
+                while j < n:
+                    k, v = tokens[j]
+                    if v in ('(', '['):
+                        depth += 1
+                    elif v in (')', ']'):
+                        depth -= 1
+                    elif (k == 'newline' and depth <= 0) or v in ('{', '}') and depth <= 0:
+                        break
+                    elif k == 'string':
+                        args.append(v)
+                    elif k == 'ident' and depth > 0 and j + 1 < n and tokens[j + 1][1] == ':':
+                        args.append(f'{v}:{tokens[j + 2][1] if j + 2 < n else ""}')
+                    j += 1
+                stack[-1]['steps'].append({'name': value, 'args': args})
+                i = j
+                statement_start = after_assign = False
+                continue
+
+        statement_start = after_assign = False
+        i += 1
+
+    return {'libraries': libraries, 'root': root}
+
+
+# =============================================================================
+# FEATURES
+# =============================================================================
+
+def iter_nodes(node, kind=None, skip=()):
+    if kind is None or node['type'] == kind:
+        yield node
+    for child in node['children']:
+        if child['name'] not in skip:
+            yield from iter_nodes(child, kind, skip)
+
+
+def stage_text(stage):
+    """Lowercased name + step names/args of a stage, excluding nested stages."""
+    parts = [stage['name'] or '']
+    pending = [stage]
+    while pending:
+        node = pending.pop()
+        for step in node['steps']:
+            parts.append(step['name'])
+            parts.extend(step['args'])
+        pending.extend(child for child in node['children'] if child['type'] != 'stage')
+    return ' '.join(parts).lower()
+
+
+def parallel_width(group):
+    """Concurrent branches of a parallel group: its direct (or block-wrapped) stages."""
+    width = 0
+    pending = list(group['children'])
+    while pending:
+        node = pending.pop()
+        if node['type'] == 'stage':
+            width += 1
+        elif node['type'] == 'block':
+            pending.extend(node['children'])
+    return width
+
+
+def derive_features(tree):
+    """Pipeline feature dict (PipelineAnalyzer keys) from a parsed tree."""
+    root = tree['root']
+    stages = list(iter_nodes(root, 'stage'))
+    features = {name: 0 for name in FEATURE_RULES}
+    features['stagesCount'] = len(stages)
+
+    for stage in stages:
+        body = stage_text(stage)
+        for name, rule in FEATURE_RULES.items():
+            if not features[name] and rule.search(body):
+                features[name] = 1
+
+    for block in iter_nodes(root, 'block'):
+        if block['name'] == 'tools':
+            if any(step['name'].lower() in BUILD_TOOLS for step in block['steps']):
+                features['hasBuildStage'] = 1
+
+    # Explicit template flags win over keywords
+    calls = [step for node in iter_nodes(root, skip=SETTINGS_BLOCKS) for step in node['steps']]
+    config_text = ' '.join(arg for step in calls for arg in step['args'] if ':' in arg)
+    for name, rule in CONFIG_FLAGS.items():
+        for match in rule.finditer(config_text):
+            features[name] = 1 if match.group(1).lower() == 'true' else 0
+
+    widths = [parallel_width(group) for group in iter_nodes(root, 'parallel')]
+    features['parallelStages'] = max([1] + widths)
+
+    # vars/*.groovy globals are plain names; dotted calls are methods
+    library_calls = []
+    for step in calls:
+        name = step['name']
+        if '.' not in name and name not in library_calls and (
+                name not in JENKINS_BUILTINS or name in NODE_SELECTOR_STEPS):
+            library_calls.append(name)
+    templates = [c for c in library_calls if len(c) > 2 and c not in NODE_SELECTOR_STEPS]
+
+    features['detectedTemplate'] = templates[0] if templates else 'none'
+    features['sharedLibrary'] = ', '.join(tree['libraries']) if tree['libraries'] else 'none'
+    features['libraryCalls'] = library_calls
+    features['stageNames'] = [stage['name'] for stage in stages]
+    return features
+
+
+def content_hash(text):
+    return hashlib.sha256(f'{PARSER_VERSION}\0{text}'.encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+def analyze_text(text, cache_dir=DEFAULT_CACHE_DIR):
+    """Features for Jenkinsfile content; cached by content hash in memory and on disk."""
+    key = content_hash(text)
+    if key in _MEMORY_CACHE:
+        return _MEMORY_CACHE[key]
+
+    cache_path = os.path.join(cache_dir, f'{key}.json') if cache_dir else None
+    if cache_path:
+        try:
+            with open(cache_path) as f:
+                _MEMORY_CACHE[key] = json.load(f)
+                return _MEMORY_CACHE[key]
+        except (FileNotFoundError, ValueError):
+            pass
+
+    features = derive_features(build_tree(tokenize(text)))
+    _MEMORY_CACHE[key] = features
+    if cache_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f'{cache_path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(features, f)
+            os.replace(tmp, cache_path)
+        except OSError as e:
+            print(f"⚠️ Could not cache Jenkinsfile features: {e}", file=sys.stderr)
+    return features
+
+
+def analyze_file(path, cache_dir=DEFAULT_CACHE_DIR):
+    with open(path, encoding='utf-8', errors='surrogateescape') as f:
+        return analyze_text(f.read(), cache_dir)
+
+
+# =============================================================================
+# LEGACY RULES (for --compare)
+# =============================================================================
+
+def legacy_features(text):
+    """PipelineAnalyzer's whole-file regex rules, ported as-is."""
+    lower = text.lower()
+    rules = {
+        'hasBuildStage': r'(mvn |mvn\s+|maven|gradle |gradle\s+|npm run build|npm install|pip install|go build'
+                         r'|make |cmake|ant |msbuild|dotnet build|cargo build)',
+        'hasUnitTests': r'(unit\s*test|mvn test|mvn\s+test|gradle test|pytest|npm test|npm run test|go test|jest'
+                        r'|mocha|junit|nunit|xunit|rspec|phpunit|cargo test)',
+        'hasIntegrationTests': r'(integration\s*test|mvn verify|mvn\s+verify|failsafe|integration-test'
+                               r'|integrationtest)',
+        'hasE2ETests': r'(e2e|end.to.end|appium|selenium|detox|cypress|playwright|puppeteer|nightwatch|testcafe)',
+        'hasDockerBuild': r'(docker\s+build|docker\.build|docker-compose|dockerfile|docker push|docker tag|podman)',
+        'usesEmulator': r'(emulator|simulator|avd|xctest|xcrun|instruments|android\s*emulator|ios\s*simulator)',
+        'hasDeployStage': r'(deploy|publish|release|upload|aws\s|kubectl|helm|ansible|terraform|s3\s|ecr|ecs'
+                          r'|gcloud|az\s|heroku|netlify|vercel)',
+    }
+    features = {name: int(bool(re.search(rule, lower))) for name, rule in rules.items()}
+    features['stagesCount'] = len(re.findall(r'stage\s*\(', text))
+    features['parallelStages'] = len(re.findall(r'parallel\s*\{', text))
+    return features
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse a Jenkinsfile into pipeline features for predict.py')
+    parser.add_argument('--jenkinsfile', default='Jenkinsfile')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Content-hash cache ('' disables)")
+    parser.add_argument('--tree', action='store_true', help='Print the parsed stage tree instead')
+    parser.add_argument('--compare', action='store_true', help='Show features next to the regex rules')
+    parser.add_argument('--output', help='Write the JSON here (merged into it if the file exists)')
+    args = parser.parse_args()
+
+    try:
+        with open(args.jenkinsfile, encoding='utf-8', errors='surrogateescape') as f:
+            text = f.read()
+    except FileNotFoundError:
+        print(json.dumps({'error': f'No Jenkinsfile at {args.jenkinsfile}'}), file=sys.stderr)
+        sys.exit(1)
+
+    if args.tree:
+        print(json.dumps(build_tree(tokenize(text)), indent=2))
+        return
+
+    started = time.perf_counter()
+    features = analyze_text(text, args.cache_dir or None)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if args.compare:
+        legacy = legacy_features(text)
+        print(json.dumps({
+            key: {'parser': features[key], 'regex': legacy[key]}
+            for key in legacy
+        }, indent=2))
+        print(f"⏱️ {elapsed_ms:.2f} ms", file=sys.stderr)
+        return
+
+    if args.output:
+        merged = {}
+        if os.path.exists(args.output):
+            with open(args.output) as f:
+                merged = json.load(f)
+        merged.update(features)
+        with open(args.output, 'w') as f:
+            json.dump(merged, f, indent=2)
+    print(json.dumps(features, indent=2))
+
+
+if __name__ == "__main__":
+    main()
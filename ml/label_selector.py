@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Cost-Aware Label Selection
+==========================
+Picks the cheapest label that fits each build, using predicted time and
+instance price as well as memory.
+
+LabelMapper.getLabel takes the smallest label covering predicted memory
+x 1.2 and ignores how long the build runs and what the node costs. Here,
+for each build and label:
+- memory:  the memory requirement (a predicted quantile when given,
+           otherwise predicted memory x buffer) must fit the label's
+           per-executor memory share
+- cpu:     predicted cpu% of a reference node (--reference-vcpu) converted
+           to vCPUs must stay under --cpu-target of the per-executor vCPU
+           share
+- cost:    expected cost of one executor slot: predicted hours x hourly
+           price, plus the chance actual memory outgrows the slot
+           (lognormal prediction error, --memory-error) times the wasted
+           partial run and a retry one label up
+
+and the feasible label with the lowest expected cost wins (ties go to the
+smaller node). Builds nothing fits get the largest label, flagged fits=False.
+Because cost scales with predicted time, the OOM-retry term makes long
+builds avoid marginal labels that are still worth the risk for short ones.
+
+The batch API scores a whole array of builds against every label in a few
+NumPy operations (n x labels matrices), so thousands of builds take
+milliseconds.
+
+Memory quantiles: pass 'memoryGbQuantile' per build, or compute them
+from the Random Forest's per-tree predictions with forest_memory_quantile().
+A per-build 'memoryBuffer' (predict.py --buffers, see adaptive_buffer.py)
+replaces --buffer for that build.
+
+Usage:
+    python label_selector.py --input predictions.json
+    python label_selector.py --input predictions.csv --cpu-target 0.8 --instances instances.json --summary
+    python label_selector.py --benchmark 100000
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+
+import numpy as np
+from scipy.special import ndtr
+
+from node_pool import INSTANCES, MEMORY_BUFFER
+
+
+DEFAULT_CPU_TARGET = 1.0        # max fraction of the slot's vCPUs a build may need (< 1 keeps headroom)
+DEFAULT_REFERENCE_VCPU = 1      # vCPUs behind the cpu_avg_pct measurements (one executor slot)
+DEFAULT_MEMORY_ERROR = 0.25     # lognormal sigma of actual / predicted memory
+OOM_AT = 0.5                    # fraction of the run wasted before an OOM kill
+
+
+# =============================================================================
+# INSTANCE TABLE
+# =============================================================================
+
+def instance_table(instances=INSTANCES, per_executor=True):
+    """
+    Per-label arrays of the capacity and price one build gets.
+
+    per_executor=True divides memory, vCPUs and price by the executor count
+    (a slot on a shared node); False treats the whole node as the build's.
+    """
+    labels = list(instances)
+    shares = np.array([instances[label].get('executors', 1) if per_executor else 1 for label in labels],
+                      dtype=float)
+    for label in labels:
+        missing = {'memory', 'vcpu', 'hourly_price'} - set(instances[label])
+        if missing:
+            raise ValueError(f"Instance '{label}' is missing {sorted(missing)}")
+    return {
+        'labels': labels,
+        'memory': np.array([instances[label]['memory'] for label in labels], dtype=float) / shares,
+        'vcpu': np.array([instances[label]['vcpu'] for label in labels], dtype=float) / shares,
+        'price': np.array([instances[label]['hourly_price'] for label in labels], dtype=float) / shares,
+        'node_memory': np.array([instances[label]['memory'] for label in labels], dtype=float),
+        'node_price': np.array([instances[label]['hourly_price'] for label in labels], dtype=float),
+        'executors': shares if per_executor else np.ones(len(labels)),
+    }
+
+
+def load_instances(path):
+    """Read an instance table JSON: {label: {memory, vcpu, hourly_price, executors}}."""
+    with open(path) as f:
+        return json.load(f)
+
+
+# =============================================================================
+# MEMORY QUANTILES
+# =============================================================================
+
+def forest_memory_quantile(model, X, quantile=0.9, memory_output=1):
+    """
+    Per-build memory quantile across the forest's trees.
+
+    Each tree's prediction is a sample from the forest's predictive spread,
+    so the q-th quantile over trees is a cheap upper estimate of memory.
+    """
+    per_tree = np.stack([tree.predict(X)[:, memory_output] for tree in model.estimators_])
+    return np.quantile(per_tree, quantile, axis=0)
+
+
+# =============================================================================
+# SELECTION
+# =============================================================================
+
+def expected_cost(memory_gb, time_min, table, memory_error=DEFAULT_MEMORY_ERROR):
+    """
+    (n, labels) expected USD per build: run cost plus OOM risk x (wasted
+    partial run + retry on the next label up). memory_error=0 drops the risk.
+    """
+    hours = np.asarray(time_min, dtype=float)[:, None] / 60.0
+    price = table['price'][None, :]
+    run = hours * price
+    if not memory_error:
+        return run
+    headroom = np.log(table['memory'][None, :] / np.maximum(np.asarray(memory_gb, dtype=float)[:, None], 1e-6))
+    oom = 1.0 - ndtr(headroom / memory_error)
+    retry_price = np.append(table['price'][1:], table['price'][-1])[None, :]
+    return run + oom * hours * (OOM_AT * price + retry_price)
+
+
+def select_labels(memory_gb, cpu_pct, time_min, table=None, memory_quantile_gb=None,
+                  buffer=MEMORY_BUFFER, cpu_target=DEFAULT_CPU_TARGET,
+                  reference_vcpu=DEFAULT_REFERENCE_VCPU, memory_error=DEFAULT_MEMORY_ERROR):
+    """
+    Batch selection over arrays of predictions.
+
+    memory_quantile_gb, when given, replaces memory_gb x buffer as the
+    requirement (NaN entries fall back to the buffer rule).
+
+    Returns a dict of arrays: 'label' (index into table['labels']),
+    'cost_usd', 'fits', 'memory_required_gb', plus 'baseline_label' and
+    'baseline_cost_usd' for LabelMapper's rule on the same table.
+    """
+    table = table or instance_table()
+    memory_gb = np.asarray(memory_gb, dtype=float)
+    time_min = np.asarray(time_min, dtype=float)
+    required = memory_gb * buffer
+    if memory_quantile_gb is not None:
+        quantile = np.asarray(memory_quantile_gb, dtype=float)
+        required = np.where(np.isnan(quantile), required, quantile)
+    vcpu_needed = np.asarray(cpu_pct, dtype=float) / 100.0 * reference_vcpu
+
+    cost = expected_cost(memory_gb, time_min, table, memory_error)
+    fits = ((required[:, None] <= table['memory'][None, :])
+            & (vcpu_needed[:, None] <= table['vcpu'][None, :] * cpu_target))
+
+    # argmin picks the first minimum, i.e. the smaller node on equal cost
+    label = np.where(fits, cost, np.inf).argmin(axis=1)
+    any_fit = fits.any(axis=1)
+    label = np.where(any_fit, label, len(table['labels']) - 1)
+
+    # LabelMapper: smallest node whose whole memory covers memory x 1.2,
+    # paid as one executor slot of that node
+    baseline = np.minimum(np.searchsorted(table['node_memory'], memory_gb * MEMORY_BUFFER, side='left'),
+                          len(table['labels']) - 1)
+    rows = np.arange(len(label))
+    return {
+        'label': label,
+        'cost_usd': cost[rows, label],
+        'fits': any_fit,
+        'memory_required_gb': required,
+        'baseline_label': baseline,
+        'baseline_cost_usd': cost[rows, baseline],
+    }
+
+
+def select_label(prediction, table=None, **kwargs):
+    """Single build: a predict.py result dict -> selection dict."""
+    return select_batch([prediction], table, **kwargs)[0]
+
+
+def prediction_arrays(predictions):
+    """Arrays for select_labels() from predict.py result dicts."""
+    quantiles = [p.get('memoryGbQuantile') for p in predictions]
+    return {
+        'memory_gb': [float(p['memoryGb']) for p in predictions],
+        'cpu_pct': [float(p['cpu']) for p in predictions],
+        'time_min': [float(p['timeMinutes']) for p in predictions],
+        'memory_quantile_gb': None if all(q in (None, '') for q in quantiles)
+        else [float('nan') if q in (None, '') else float(q) for q in quantiles],
+    }
+
+
+def with_buffers(predictions, options):
+    """Options with 'buffer' as a per-build array when any prediction carries 'memoryBuffer'."""
+    buffers = [p.get('memoryBuffer') for p in predictions]
+    if all(b in (None, '') for b in buffers):
+        return options
+    default = options.get('buffer', MEMORY_BUFFER)
+    return {**options, 'buffer': np.array([default if b in (None, '') else float(b) for b in buffers])}
+
+
+def select_batch(predictions, table=None, **kwargs):
+    """predict.py result dicts ({'cpu', 'memoryGb', 'timeMinutes', optional 'memoryGbQuantile'})."""
+    table = table or instance_table()
+    selected = select_labels(table=table, **prediction_arrays(predictions), **with_buffers(predictions, kwargs))
+    labels = table['labels']
+    results = []
+    for i, prediction in enumerate(predictions):
+        label = labels[selected['label'][i]]
+        results.append({
+            'buildId': prediction.get('buildId', prediction.get('build_id', i)),
+            'label': label,
+            'instance': INSTANCES.get(label, {}).get('instance', 'Unknown'),
+            'fits': bool(selected['fits'][i]),
+            'memoryRequiredGb': round(float(selected['memory_required_gb'][i]), 2),
+            'estimatedCostUsd': round(float(selected['cost_usd'][i]), 5),
+            'baselineLabel': labels[selected['baseline_label'][i]],
+            'baselineCostUsd': round(float(selected['baseline_cost_usd'][i]), 5),
+        })
+    return results
+
+
+def summarize(selected, table):
+    """Totals and label mix for a select_labels() result."""
+    labels = table['labels']
+    cost = float(selected['cost_usd'].sum())
+    baseline = float(selected['baseline_cost_usd'].sum())
+    return {
+        'builds': int(len(selected['label'])),
+        'unfit': int((~selected['fits']).sum()),
+        'estimated_cost_usd': round(cost, 2),
+        'baseline_cost_usd': round(baseline, 2),
+        'savings_pct': round((1 - cost / baseline) * 100, 1) if baseline else 0.0,
+        'labels': dict(zip(labels, np.bincount(selected['label'], minlength=len(labels)).tolist())),
+        'baseline_labels': dict(zip(labels, np.bincount(selected['baseline_label'],
+                                                       minlength=len(labels)).tolist())),
+    }
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def load_predictions(path):
+    """JSON list (predict.py batch output) or CSV with the same keys."""
+    if path.endswith('.csv'):
+        with open(path) as f:
+            return list(csv.DictReader(f))
+    with open(path) as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else [data]
+
+
+def benchmark(n, table, **kwargs):
+    rng = np.random.default_rng(42)
+    memory = np.clip(rng.lognormal(1.3, 0.7, size=n), 0.5, 24)
+    cpu = np.clip(rng.normal(60, 20, size=n), 10, 100)
+    minutes = np.clip(memory * rng.uniform(1.5, 10, size=n), 1, 600)
+    started = time.perf_counter()
+    selected = select_labels(memory, cpu, minutes, table, **kwargs)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return {**summarize(selected, table), 'elapsed_ms': round(elapsed_ms, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cost-aware label selection for predicted builds')
+    parser.add_argument('--input', help='Predictions: JSON object/list or CSV (cpu, memoryGb, timeMinutes)')
+    parser.add_argument('--instances', help='Instance table JSON (default: node_pool.INSTANCES)')
+    parser.add_argument('--whole-node', action='store_true',
+                        help='Give each build a whole node instead of one executor slot')
+    parser.add_argument('--buffer', type=float, default=MEMORY_BUFFER,
+                        help='Memory buffer when no memory quantile is given')
+    parser.add_argument('--cpu-target', type=float, default=DEFAULT_CPU_TARGET)
+    parser.add_argument('--reference-vcpu', type=float, default=DEFAULT_REFERENCE_VCPU)
+    parser.add_argument('--memory-error', type=float, default=DEFAULT_MEMORY_ERROR,
+                        help='Lognormal sigma of memory predictions for OOM risk (0 ignores risk)')
+    parser.add_argument('--summary', action='store_true', help='Print totals instead of per-build results')
+    parser.add_argument('--benchmark', type=int, metavar='N', help='Time selection for N synthetic builds')
+    args = parser.parse_args()
+
+    try:
+        instances = load_instances(args.instances) if args.instances else INSTANCES
+        table = instance_table(instances, per_executor=not args.whole_node)
+    except (ValueError, FileNotFoundError) as e:
+        print(json.dumps({'error': str(e)}), file=sys.stderr)
+        sys.exit(1)
+    options = {'buffer': args.buffer, 'cpu_target': args.cpu_target, 'reference_vcpu': args.reference_vcpu,
+               'memory_error': args.memory_error}
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.benchmark, table, **options)))
+        return
+    if not args.input:
+        parser.error('--input is required')
+
+    predictions = [p for p in load_predictions(args.input) if 'error' not in p]
+    if args.summary:
+        selected = select_labels(table=table, **prediction_arrays(predictions), **with_buffers(predictions, options))
+        print(json.dumps(summarize(selected, table), indent=2))
+    else:
+        print(json.dumps(select_batch(predictions, table, **options), indent=2))
+
+
+if __name__ == "__main__":
+    main()
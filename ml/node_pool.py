@@ -0,0 +1,40 @@
+"""
+Node Pool Definition
+====================
+Python mirror of LabelMapper.INSTANCES (src/org/ml/nodeselection/LabelMapper.groovy),
+shared by the Python scheduling and selection tools.
+
+Keep the two in sync: labels, memory (GB) and executors per node
+(vcpu and hourly_price are Python-only, used for cost-aware selection).
+"""
+
+import numpy as np
+
+# AWS instance configurations (same order as LabelMapper: smallest first).
+# vcpu and hourly_price (on-demand USD/hour, us-east-1) are for the instance type.
+INSTANCES = {
+    'lightweight': {'memory': 1, 'instance': 'T3a Small', 'executors': 1, 'vcpu': 2, 'hourly_price': 0.0188},
+    'executor':    {'memory': 2, 'instance': 'T3a Small', 'executors': 3, 'vcpu': 2, 'hourly_price': 0.0188},
+    'build':       {'memory': 8, 'instance': 'T3a Large', 'executors': 2, 'vcpu': 2, 'hourly_price': 0.0752},
+    'test':        {'memory': 16, 'instance': 'T3a X Large', 'executors': 1, 'vcpu': 4, 'hourly_price': 0.1504},
+    'heavytest':   {'memory': 32, 'instance': 'T3a 2X Large', 'executors': 1, 'vcpu': 8, 'hourly_price': 0.3008},
+}
+
+# LabelMapper.getLabel adds a 20% safety buffer to predicted memory
+MEMORY_BUFFER = 1.2
+
+
+def get_label(predicted_memory_gb, buffer=MEMORY_BUFFER):
+    """Smallest label whose memory covers the buffered prediction (LabelMapper.getLabel)."""
+    required = predicted_memory_gb * buffer
+    for label, config in INSTANCES.items():
+        if required <= config['memory']:
+            return label
+    return 'heavytest'
+
+
+def label_indices(predicted_memory_gb, buffer=MEMORY_BUFFER):
+    """Vectorized get_label: index into INSTANCES for each value of an array."""
+    memory = np.array([config['memory'] for config in INSTANCES.values()], dtype=float)
+    required = np.asarray(predicted_memory_gb, dtype=float) * buffer
+    return np.minimum(np.searchsorted(memory, required, side='left'), len(memory) - 1)
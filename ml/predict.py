@@ -7,6 +7,39 @@ Predicts CPU, Memory, and Build Time using 27 features.
 Input: JSON file with build context (from PipelineAnalyzer.groovy)
 Output: JSON with predictions
 
+Modes:
+- Single: --input context.json (one JSON object in, one out)
+- Batch:  --input contexts.json holding a JSON list (one list out)
+- Server: --serve [HOST:]PORT (POST /predict, model loaded once)
+  add --workers N for pre-forked processes sharing one model (prediction_workers.py)
+
+If the model was trained with --per-project-type, each request is served
+by its project_type's submodel when there is one (global model otherwise).
+
+With --table, contexts matching a precomputed common profile are answered
+from the table (method 'ml_lookup_table') without running the model.
+
+With --shadow CANDIDATE (repeatable), each request is also queued for
+scoring by the candidate models in the background and the paired results
+are recorded for comparison (shadow_scoring.py); the response never waits
+on them.
+
+With --buffers memory_buffers.json (adaptive_buffer.py), each result also
+carries 'memoryBuffer', the learned memory multiplier for its project_type
+and size, which LabelMapper uses instead of 1.2.
+
+With --budget-ms (or a context's "latencyBudgetMs"), trees are evaluated
+progressively and a build stops once its node label is settled or the
+budget runs out (anytime_prediction.py); the result reports treesUsed.
+
+If the model was trained with --stage-data, each result also lists
+per-stage predictions ("stages", each with its own node label) and
+"stageTotals": serial and parallel pipeline time (stage_prediction.py).
+
+A context with "explain": true (or a count) also gets per-target feature
+contributions: the forest's bias plus the top features' share of the raw
+prediction (see forest_arrays.py).
+
 Compatible with both:
 - Basic context (git metrics only) - backward compatible
 - Enhanced context (full pipeline analysis) - full accuracy
@@ -16,6 +49,9 @@ import argparse
 import json
 import os
 import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import joblib
 import numpy as np
 
@@ -185,22 +221,270 @@ def engineer_features(context):
 # PREDICTION
 # =============================================================================
 
-def predict_resources(features, model_path):
-    """Run prediction using trained model."""
+# Models loaded by this process, keyed by path. The CLI loads once per call;
+# batch and server modes reuse the loaded forest across requests.
+_MODEL_CACHE = {}
+_FOREST_CACHE = {}
+
+# Response keys of the model's three outputs, in training target order
+RESPONSE_TARGETS = ['cpu', 'memoryGb', 'timeMinutes']
+DEFAULT_TOP_CONTRIBUTORS = 5
+
+
+# Per-project_type submodels (train_model.py --per-project-type), listed
+# under 'routes' in the model's features.json. They load on first use and
+# stay in an LRU bounded by their total in-memory size: each model's tree
+# arrays plus, once built, its flattened copy in _FOREST_CACHE. The global
+# model is always resident as the fallback.
+SUBMODEL_CACHE_MB = float(os.environ.get('ML_SUBMODEL_CACHE_MB', 512))
+
+# Precomputed answers for common build profiles (prediction_table.py);
+# set by --table or $ML_PREDICTION_TABLE
+PREDICTION_TABLE_PATH = os.environ.get('ML_PREDICTION_TABLE')
+_TABLES = {}                        # (table path, model path) -> PredictionTable or None
+
+# Learned memory buffers (adaptive_buffer.py); set by --buffers or $ML_MEMORY_BUFFERS
+MEMORY_BUFFERS_PATH = os.environ.get('ML_MEMORY_BUFFERS')
+_BUFFERS = {}
+
+# Default latency budget (ms) for anytime prediction; set by --budget-ms or
+# $ML_LATENCY_BUDGET_MS. None evaluates the whole forest.
+LATENCY_BUDGET_MS = (float(os.environ['ML_LATENCY_BUDGET_MS'])
+                     if os.environ.get('ML_LATENCY_BUDGET_MS') else None)
+_STAGE_META = {}                    # model path -> features.json 'stages' entry (None: no stage model)
+_ROUTES = {}                        # model path -> {project_type code: submodel path}
+_SUBMODEL_PATHS = set()
+_SUBMODELS = OrderedDict()          # submodel path -> (model, size in bytes), oldest first
+_SUBMODEL_LOCK = threading.Lock()
+
+
+def load_model(model_path):
+    """Load a trained model, reusing it if this process already loaded it."""
+    
+    if model_path in _SUBMODEL_PATHS:
+        return load_submodel(model_path)
     
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"Model not found: {model_path}")
     
-    # Load model
-    model = joblib.load(model_path)
+    model = _MODEL_CACHE.get(model_path)
+    if model is None:
+        model = joblib.load(model_path)
+        _MODEL_CACHE[model_path] = model
+    return model
+
+
+def load_routes(model_path):
+    """project_type code -> submodel path from the model's features.json (empty if none)."""
     
-    # Build feature vector in correct order
-    X = np.array([[features.get(col, 0) for col in FEATURE_COLUMNS]])
+    routes = _ROUTES.get(model_path)
+    if routes is None:
+        model_dir = os.path.dirname(os.path.abspath(model_path))
+        try:
+            with open(os.path.join(model_dir, 'features.json')) as f:
+                entries = json.load(f).get('routes') or {}
+        except (FileNotFoundError, ValueError):
+            entries = {}
+        routes = {int(code): os.path.join(model_dir, entry['path']) for code, entry in entries.items()}
+        _SUBMODEL_PATHS.update(routes.values())
+        _ROUTES[model_path] = routes
+    return routes
+
+
+def route_model_path(model_path, features):
+    """Submodel for the request's project_type, or the global model."""
+    return load_routes(model_path).get(int(features.get('project_type', 0)), model_path)
+
+
+def add_route(result, model_path, path):
+    """Tag the result with the model that served it, when the model has routes."""
+    routes = load_routes(model_path)
+    if routes:
+        code = next((code for code, route in routes.items() if route == path), None)
+        result['route'] = 'global' if code is None else f'project_type={code}'
+
+
+def load_submodel(path):
+    """Load a submodel through the LRU, evicting least recently used ones past the budget."""
     
-    # Predict
-    prediction = model.predict(X)[0]
+    with _SUBMODEL_LOCK:
+        if path in _SUBMODELS:
+            _SUBMODELS.move_to_end(path)
+            return _SUBMODELS[path][0]
+    
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model not found: {path}")
+    model = joblib.load(path)
+    
+    with _SUBMODEL_LOCK:
+        _SUBMODELS[path] = (model, model_nbytes(model))
+        _SUBMODELS.move_to_end(path)
+        evict_submodels()
+    return model
+
+
+def model_nbytes(model):
+    """Resident size of a fitted forest: every tree's node and value arrays."""
+    from sklearn.tree._tree import NODE_DTYPE
+    
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None:
+        return sys.getsizeof(model)
+    return sum(est.tree_.node_count * NODE_DTYPE.itemsize + est.tree_.value.nbytes for est in estimators)
+
+
+def evict_submodels():
+    """Drop least recently used submodels (and their flat forests) past the budget; caller holds the lock."""
+    budget = SUBMODEL_CACHE_MB * 1024 * 1024
+    total = sum(size for _, size in _SUBMODELS.values())
+    while total > budget and len(_SUBMODELS) > 1:
+        old, (_, old_size) = _SUBMODELS.popitem(last=False)
+        total -= old_size
+        _FOREST_CACHE.pop(old, None)
+
+
+def load_table(model_path):
+    """
+    The prediction table (prediction_table.py) from PREDICTION_TABLE_PATH, if
+    set and built for this exact model file; None otherwise.
+    """
+    if not PREDICTION_TABLE_PATH:
+        return None
+    key = (PREDICTION_TABLE_PATH, model_path)
+    if key not in _TABLES:
+        from prediction_table import PredictionTable
+        from prediction_log import model_id_for
+        
+        table = PredictionTable(PREDICTION_TABLE_PATH)
+        if table.model_id != model_id_for(model_path):
+            print(f"⚠️ Prediction table {PREDICTION_TABLE_PATH} was built for {table.model_id}; "
+                  f"not using it", file=sys.stderr)
+            table = None
+        _TABLES[key] = table
+    return _TABLES[key]
+
+
+def table_lookup(model_path, row):
+    """Table answer [cpu, memory, time] for a feature row, or None (no table / miss)."""
+    table = load_table(model_path)
+    return table.lookup(row) if table is not None else None
+
+
+def load_memory_buffers():
+    """The configured learned buffer table (adaptive_buffer.MemoryBuffers), or None."""
+    if not MEMORY_BUFFERS_PATH:
+        return None
+    buffers = _BUFFERS.get(MEMORY_BUFFERS_PATH)
+    if buffers is None:
+        from adaptive_buffer import MemoryBuffers
+        buffers = _BUFFERS[MEMORY_BUFFERS_PATH] = MemoryBuffers(MEMORY_BUFFERS_PATH)
+    return buffers
+
+
+def add_memory_buffer(result, features):
+    """Attach the learned memory buffer for this build when a buffer table is configured."""
+    buffers = load_memory_buffers()
+    if buffers is not None:
+        result['memoryBuffer'] = buffers.lookup(features.get('project_type', 0), result['memoryGb'])
+
+
+def add_stage_predictions(results, features_list, model_path):
+    """Attach per-stage predictions and pipeline totals when the model has a stage model."""
+    if model_path not in _STAGE_META:
+        from stage_prediction import load_stage_meta
+        _STAGE_META[model_path] = load_stage_meta(model_path)
+    meta = _STAGE_META[model_path]
+    if not meta or not results:
+        return
+    from stage_prediction import predict_stages
+    
+    plans = predict_stages(load_flat_forest(meta['path']), features_list, meta)
+    for result, plan in zip(results, plans):
+        if plan:
+            result.update(plan)
+
+
+def load_flat_forest(model_path):
+    """Flattened node arrays of the model (see forest_arrays.py), built once per process."""
+    from forest_arrays import FlatForest
+    
+    forest = _FOREST_CACHE.get(model_path)
+    if forest is None:
+        forest = FlatForest.from_model(load_model(model_path))
+        _FOREST_CACHE[model_path] = forest
+        # A submodel's flat copy counts against the submodel budget too
+        with _SUBMODEL_LOCK:
+            if model_path in _SUBMODELS:
+                model, size = _SUBMODELS[model_path]
+                _SUBMODELS[model_path] = (model, size + sum(a.nbytes for a in forest.arrays().values()))
+                evict_submodels()
+    return forest
+
+
+def latency_budget(context):
+    """The context's "latencyBudgetMs", else the default; None means the full forest."""
+    budget = context.get('latencyBudgetMs', LATENCY_BUDGET_MS)
+    return None if budget is None else float(budget)
+
+
+def predict_anytime(rows, model_path, budget_ms):
+    """
+    Anytime predictions for rows sharing one deadline: (raw prediction,
+    response fields reporting the trees used) per row.
+
+    With a learned buffer table, early stopping checks label stability
+    under each row's per-label buffers, the ones add_memory_buffer attaches.
+    """
+    from anytime_prediction import AnytimePredictor
+    from node_pool import MEMORY_BUFFER
+    
+    forest = load_flat_forest(model_path)
+    buffers = load_memory_buffers()
+    buffer = MEMORY_BUFFER
+    if buffers is not None:
+        from adaptive_buffer import type_rows
+        buffer = np.array(buffers.rows)[type_rows(rows[:, FEATURE_COLUMNS.index('project_type')])]
+    predictions, used, stopped = AnytimePredictor(forest).predict(rows, budget_ms / 1000, buffer)
+    return [
+        (prediction, {'method': 'ml_anytime_prediction', 'treesUsed': int(n),
+                      'treesTotal': forest.n_trees, 'stoppedBy': reason})
+        for prediction, n, reason in zip(predictions, used, stopped)
+    ]
+
+
+def explain_predictions(rows, model_path, tops):
+    """
+    Per-target bias and top feature contributions for each row, so
+    bias + sum of all contributions = the raw (unclamped) model output.
+    """
+    from forest_arrays import top_contributors
+    
+    bias, contributions = load_flat_forest(model_path).contributions(rows)
+    return [
+        {
+            target: {
+                'bias': round(float(bias[k]), 4),
+                'top': top_contributors(contributions[i, :, k], FEATURE_COLUMNS, rows[i], top),
+            }
+            for k, target in enumerate(RESPONSE_TARGETS)
+        }
+        for i, top in enumerate(tops)
+    ]
+
+
+def explain_top(context):
+    """Contributors requested by 'explain' (true -> default count, an int -> that many)."""
+    explain = context.get('explain', False)
+    if explain is True:
+        return DEFAULT_TOP_CONTRIBUTORS
+    if isinstance(explain, int) and explain > 0:
+        return explain
+    return 0
+
+
+def format_prediction(prediction):
+    """Clamp one raw [cpu, memory, time] model output into the response shape."""
     
-    # Extract predictions
     cpu_pct = max(10, min(100, float(prediction[0])))      # Clamp 10-100%
     memory_gb = max(0.5, float(prediction[1]))             # Min 0.5 GB
     time_min = max(1, float(prediction[2]))                # Min 1 minute
@@ -214,6 +498,137 @@ def predict_resources(features, model_path):
     }
 
 
+def predict_resources(features, model_path):
+    """Run prediction using trained model."""
+    
+    model = load_model(model_path)
+    
+    # Build feature vector in correct order
+    X = np.array([[features.get(col, 0) for col in FEATURE_COLUMNS]])
+    
+    # Predict
+    return format_prediction(model.predict(X)[0])
+
+
+def predict_context(context, model_path, log=None, shadow=None):
+    """Full single-build prediction: features, model output, confidence, debug."""
+    
+    features = engineer_features(context)
+    path = route_model_path(model_path, features)
+    row = [features.get(col, 0) for col in FEATURE_COLUMNS]
+    top = explain_top(context)
+    
+    answer = table_lookup(model_path, row) if not top else None
+    budget = latency_budget(context)
+    if answer is not None:
+        result = format_prediction(answer)
+        result['method'] = 'ml_lookup_table'
+    elif budget is not None:
+        prediction, fields = predict_anytime(np.array([row], dtype=float), path, budget)[0]
+        result = format_prediction(prediction)
+        result.update(fields)
+    else:
+        result = predict_resources(features, path)
+    result['confidence'] = get_confidence(features)
+    add_memory_buffer(result, features)
+    add_route(result, model_path, path)
+    add_stage_predictions([result], [features], model_path)
+    
+    if top:
+        result['contributions'] = explain_predictions(np.array([row], dtype=float), path, [top])[0]
+    
+    if log is not None:
+        log_prediction(log, context, features, result, path)
+    if shadow is not None:
+        shadow_submit(shadow, context, row, result, path)
+    
+    # Add debug info if requested
+    if context.get('debug', False):
+        result['features'] = features
+    
+    return result
+
+
+def predict_batch(contexts, model_path, log=None, shadow=None):
+    """
+    Predict a list of build contexts with one model.predict() call per
+    route (the global model, or a project_type submodel). Rows answered
+    by the prediction table skip the model; rows with a latency budget
+    are predicted progressively, one pass per route and budget.
+    
+    Returns one result per context, in order. A context whose features
+    cannot be engineered gets an {'error': ...} entry instead of failing
+    the whole batch.
+    """
+    load_model(model_path)
+    
+    results = [None] * len(contexts)
+    rows, row_index, row_features = [], [], []
+    for i, context in enumerate(contexts):
+        try:
+            features = engineer_features(context)
+        except Exception as e:
+            results[i] = {'error': str(e)}
+            continue
+        rows.append([features.get(col, 0) for col in FEATURE_COLUMNS])
+        row_index.append(i)
+        row_features.append(features)
+    
+    if rows:
+        X = np.array(rows, dtype=float)
+        paths = [route_model_path(model_path, features) for features in row_features]
+        answers = [None if explain_top(contexts[i]) else table_lookup(model_path, row)
+                   for i, row in zip(row_index, rows)]
+        
+        def finish(j, prediction, path, method=None, fields=None):
+            i, features = row_index[j], row_features[j]
+            result = format_prediction(prediction)
+            if method:
+                result['method'] = method
+            if fields:
+                result.update(fields)
+            result['confidence'] = get_confidence(features)
+            add_memory_buffer(result, features)
+            add_route(result, model_path, path)
+            if log is not None:
+                log_prediction(log, contexts[i], features, result, path)
+            if shadow is not None:
+                shadow_submit(shadow, contexts[i], rows[j], result, path)
+            if contexts[i].get('debug', False):
+                result['features'] = features
+            results[i] = result
+        
+        for j, answer in enumerate(answers):
+            if answer is not None:
+                finish(j, answer, paths[j], 'ml_lookup_table')
+        
+        misses = [j for j, answer in enumerate(answers) if answer is None]
+        for path in dict.fromkeys(paths[j] for j in misses):
+            group = [j for j in misses if paths[j] == path]
+            budgets = [latency_budget(contexts[row_index[j]]) for j in group]
+            for budget in dict.fromkeys(budgets):
+                part = [j for j, b in zip(group, budgets) if b == budget]
+                if budget is None:
+                    for j, prediction in zip(part, load_model(path).predict(X[part])):
+                        finish(j, prediction, path)
+                else:
+                    for j, (prediction, fields) in zip(part, predict_anytime(X[part], path, budget)):
+                        finish(j, prediction, path, fields=fields)
+            
+            # Contributions for every row of this route that asked, in one pass over the forest
+            explain = [(j, explain_top(contexts[row_index[j]])) for j in group]
+            explain = [(j, top) for j, top in explain if top]
+            if explain:
+                explained = explain_predictions(X[[j for j, _ in explain]], path, [top for _, top in explain])
+                for (j, _), contributions in zip(explain, explained):
+                    results[row_index[j]]['contributions'] = contributions
+        
+        # Stages of every build in one pass over the stage model
+        add_stage_predictions([results[i] for i in row_index], row_features, model_path)
+    
+    return results
+
+
 def get_confidence(features):
     """Estimate prediction confidence based on input completeness."""
     
@@ -240,16 +655,180 @@ def get_confidence(features):
         return 'low'
 
 
+# =============================================================================
+# PREDICTION LOG
+# =============================================================================
+
+def open_prediction_log(db_path, model_path, background=False):
+    """
+    Open the prediction log (see prediction_log.py), with drift tracking if
+    the model's features.json carries a drift reference.
+    """
+    from prediction_log import PredictionLog
+    from drift_monitor import DriftMonitor
+    
+    manifest_path = os.path.join(os.path.dirname(os.path.abspath(model_path)), 'features.json')
+    return PredictionLog(db_path, drift_monitor=DriftMonitor.from_manifest(manifest_path),
+                         background=background)
+
+
+def get_build_id(context):
+    """Build id from the context, falling back to Jenkins' BUILD_TAG."""
+    return str(context.get('buildId', context.get('build_id', os.environ.get('BUILD_TAG', 'unknown'))))
+
+
+def log_prediction(log, context, features, result, model_path):
+    """Buffer one prediction; logging problems never fail the prediction itself."""
+    from prediction_log import model_id_for
+    try:
+        log.log_prediction(get_build_id(context), features, result, model_id_for(model_path))
+    except Exception as e:
+        print(f"⚠️ Prediction log write failed: {e}", file=sys.stderr)
+
+
+def open_shadow(candidate_paths, db_path):
+    """Background scorer for candidate models (see shadow_scoring.py)."""
+    from shadow_scoring import ShadowScorer
+    return ShadowScorer(candidate_paths, db_path)
+
+
+def shadow_submit(shadow, context, row, result, model_path):
+    """Queue the request for the shadow models; a full queue drops it, never blocks."""
+    from prediction_log import model_id_for
+    shadow.submit(get_build_id(context), row, result, model_id_for(model_path))
+
+
+# =============================================================================
+# LOCAL SERVER
+# =============================================================================
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    POST /predict with a context object (or a list of them for a batch).
+    GET /health returns {"status": "ok"}.
+    """
+    
+    model_path = None
+    prediction_log = None
+    shadow = None
+    
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path == '/health':
+            health = {'status': 'ok'}
+            table = load_table(self.model_path)
+            if table is not None:
+                health['table'] = table.stats()
+            if self.shadow is not None:
+                health['shadow'] = self.shadow.stats()
+            self._send_json(200, health)
+        else:
+            self._send_json(404, {'error': f'Unknown path: {self.path}'})
+    
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send_json(404, {'error': f'Unknown path: {self.path}'})
+            return
+        
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length))
+        except Exception as e:
+            self._send_json(400, {'error': f'Invalid input JSON: {e}'})
+            return
+        
+        try:
+            if isinstance(payload, list):
+                result = predict_batch(payload, self.model_path, self.prediction_log, self.shadow)
+            else:
+                result = predict_context(payload, self.model_path, self.prediction_log, self.shadow)
+            self._send_json(200, result)
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+    
+    def log_message(self, format, *args):
+        # Keep request logging off the hot path
+        pass
+
+
+def parse_address(address):
+    """Parse '[HOST:]PORT' into (host, port)."""
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def serve(address, model_path, log_db=None, shadow_models=None, shadow_db=None):
+    """Serve predictions over HTTP until interrupted; the model is loaded once."""
+    load_model(model_path)
+    log = open_prediction_log(log_db, model_path, background=True) if log_db else None
+    shadow = open_shadow(shadow_models, shadow_db) if shadow_models else None
+    host, port = parse_address(address)
+    handler = type('BoundPredictionHandler', (PredictionHandler,),
+                   {'model_path': model_path, 'prediction_log': log, 'shadow': shadow})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving predictions on http://{host}:{server.server_port}/predict", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if log is not None:
+            log.close()
+        if shadow is not None:
+            shadow.close()
+
+
 # =============================================================================
 # MAIN
 # =============================================================================
 
 def main():
+    global PREDICTION_TABLE_PATH, MEMORY_BUFFERS_PATH, LATENCY_BUDGET_MS
     parser = argparse.ArgumentParser(description='Enhanced ML Resource Prediction')
-    parser.add_argument('--input', required=True, help='Build context JSON file')
+    parser.add_argument('--input', help='Build context JSON file (an object, or a list for batch mode)')
     parser.add_argument('--model', required=True, help='Path to trained model.pkl')
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help='Run a local HTTP prediction server instead of reading --input')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='With --serve: pre-fork this many worker processes sharing one model')
+    parser.add_argument('--table', default=PREDICTION_TABLE_PATH,
+                        help='Answer common profiles from this prediction table (default: $ML_PREDICTION_TABLE)')
+    parser.add_argument('--buffers', default=MEMORY_BUFFERS_PATH,
+                        help='Learned memory buffer table from adaptive_buffer.py (default: $ML_MEMORY_BUFFERS)')
+    parser.add_argument('--budget-ms', type=float, default=LATENCY_BUDGET_MS,
+                        help='Anytime prediction: stop evaluating trees once the node label is settled '
+                             'or after this many ms (default: $ML_LATENCY_BUDGET_MS, else all trees)')
+    parser.add_argument('--log-db', default=os.environ.get('ML_PREDICTION_LOG'),
+                        help='Record predictions to this SQLite log (default: $ML_PREDICTION_LOG)')
+    parser.add_argument('--shadow', action='append', metavar='MODEL',
+                        help='Also score requests with this candidate model in the background (repeatable)')
+    parser.add_argument('--shadow-db', default=os.environ.get('ML_SHADOW_DB', 'shadow.db'),
+                        help='Where paired shadow results go (default: $ML_SHADOW_DB or shadow.db)')
     args = parser.parse_args()
     
+    PREDICTION_TABLE_PATH = args.table
+    MEMORY_BUFFERS_PATH = args.buffers
+    LATENCY_BUDGET_MS = args.budget_ms
+    
+    if args.serve:
+        if args.workers > 0:
+            from prediction_workers import serve_workers
+            serve_workers(args.serve, args.model, args.workers, args.log_db,
+                          shadow_models=args.shadow, shadow_db=args.shadow_db)
+        else:
+            serve(args.serve, args.model, args.log_db, args.shadow, args.shadow_db)
+        return
+    if not args.input:
+        parser.error('--input is required unless --serve is given')
+    
     try:
         # Load input context
         with open(args.input, 'r') as f:
@@ -259,28 +838,36 @@ def main():
         print(json.dumps(result), file=sys.stderr)
         sys.exit(1)
     
+    log = shadow = None
     try:
-        # Engineer features
-        features = engineer_features(context)
-        
-        # Predict resources
-        result = predict_resources(features, args.model)
+        if args.log_db:
+            log = open_prediction_log(args.log_db, args.model)
+        if args.shadow:
+            shadow = open_shadow(args.shadow, args.shadow_db)
         
-        # Add confidence score
-        result['confidence'] = get_confidence(features)
-        
-        # Add debug info if requested
-        if context.get('debug', False):
-            result['features'] = features
+        if isinstance(context, list):
+            # Batch mode: one JSON list out, one result per context
+            result = predict_batch(context, args.model, log, shadow)
+        else:
+            result = predict_context(context, args.model, log, shadow)
         
         # Output JSON
-        print(json.dumps(result))
+        print(json.dumps(result), flush=True)
         
     except Exception as e:
         result = {'error': str(e)}
         print(json.dumps(result), file=sys.stderr)
         sys.exit(1)
+    finally:
+        # Buffered log rows are committed after the result is already out
+        if log is not None:
+            try:
+                log.close()
+            except Exception as e:
+                print(f"⚠️ Prediction log write failed: {e}", file=sys.stderr)
+        if shadow is not None:
+            shadow.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Prediction / Outcome Log
+========================
+Records what predict.py predicted for each build and what the build
+actually used, so accuracy can be measured in production and the model
+retrained on real outcomes.
+
+Storage is a single SQLite database in WAL mode:
+- predictions: build id, time, model id, the 27 features, predicted CPU/memory/time
+- outcomes:    build id, time, actual CPU/memory/time, status (arrive later)
+- drift_bins:  per-day feature histogram counts for drift_monitor.py, keyed
+               by the drift reference (bin edges) they were binned into
+
+Writes are buffered and committed in batches (one transaction per batch),
+so logging adds almost nothing to prediction latency. predictions and
+outcomes are indexed on build_id and ts, so joins over millions of rows
+take seconds.
+
+Usage:
+    python prediction_log.py --db prediction_log.db outcome --build-id job-42 \\
+        --cpu 63.5 --memory-gb 5.2 --time-min 14.0
+    python prediction_log.py --db prediction_log.db outcome --build-id job-42 \\
+        --from-csv real_builds.csv       # last row written by build_sampler.py
+    python prediction_log.py --db prediction_log.db export --output real_training.csv
+    python prediction_log.py --db prediction_log.db stats
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from predict import FEATURE_COLUMNS
+
+
+TARGET_COLUMNS = ['cpu_avg_pct', 'memory_gb', 'build_time_min']
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_FLUSH_INTERVAL = 1.0     # seconds, background flushing (server mode)
+DEFAULT_DRIFT_RETENTION_DAYS = 30
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    build_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    model_id TEXT,
+    {', '.join(f'{col} NUMERIC' for col in FEATURE_COLUMNS)},
+    pred_cpu_avg_pct REAL,
+    pred_memory_gb REAL,
+    pred_build_time_min REAL
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_build_id ON predictions (build_id);
+CREATE INDEX IF NOT EXISTS idx_predictions_ts ON predictions (ts);
+
+CREATE TABLE IF NOT EXISTS outcomes (
+    id INTEGER PRIMARY KEY,
+    build_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    cpu_avg_pct REAL,
+    memory_gb REAL,
+    build_time_min REAL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outcomes_build_id ON outcomes (build_id);
+CREATE INDEX IF NOT EXISTS idx_outcomes_ts ON outcomes (ts);
+
+CREATE TABLE IF NOT EXISTS drift_bins (
+    reference TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    feature TEXT NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (reference, day, feature, bin)
+) WITHOUT ROWID;
+"""
+
+INSERT_PREDICTION = (
+    f"INSERT INTO predictions (build_id, ts, model_id, {', '.join(FEATURE_COLUMNS)}, "
+    f"pred_cpu_avg_pct, pred_memory_gb, pred_build_time_min) "
+    f"VALUES ({', '.join(['?'] * (len(FEATURE_COLUMNS) + 6))})"
+)
+INSERT_OUTCOME = (
+    "INSERT INTO outcomes (build_id, ts, cpu_avg_pct, memory_gb, build_time_min, status) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+UPSERT_DRIFT = (
+    "INSERT INTO drift_bins (reference, day, feature, bin, count) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (reference, day, feature, bin) DO UPDATE SET count = count + excluded.count"
+)
+
+# Latest prediction per build joined with its latest outcome. Both sides
+# resolve through the build_id indexes, so no full-row sort is needed.
+JOIN_FROM = """
+FROM outcomes o
+JOIN predictions p ON p.build_id = o.build_id
+WHERE p.id = (SELECT MAX(id) FROM predictions WHERE build_id = o.build_id)
+  AND o.id = (SELECT MAX(id) FROM outcomes WHERE build_id = o.build_id)
+"""
+
+JOIN_QUERY = f"""
+SELECT p.build_id, p.ts, p.model_id,
+       {', '.join(f'p.{col}' for col in FEATURE_COLUMNS)},
+       p.pred_cpu_avg_pct, p.pred_memory_gb, p.pred_build_time_min,
+       o.cpu_avg_pct, o.memory_gb, o.build_time_min, o.status
+""" + JOIN_FROM
+
+# Training-schema columns only: 27 features, then actuals as targets.
+# NUMERIC affinity keeps integral features as integers, so rows print
+# exactly like training_features.csv.
+EXPORT_QUERY = (
+    "SELECT " + ", ".join([f'p.{col}' for col in FEATURE_COLUMNS] + [f'o.{col}' for col in TARGET_COLUMNS])
+    + JOIN_FROM
+)
+
+ACCURACY_QUERY = """
+SELECT COUNT(*),
+       AVG(ABS(p.pred_cpu_avg_pct - o.cpu_avg_pct)),
+       AVG(ABS(p.pred_memory_gb - o.memory_gb)),
+       AVG(ABS(p.pred_build_time_min - o.build_time_min))
+""" + JOIN_FROM
+
+
+def model_id_for(model_path):
+    """Cheap model identity: file name plus size and mtime (no hashing on the hot path)."""
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return os.path.basename(model_path)
+    return f"{os.path.basename(model_path)}@{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+class PredictionLog:
+    """
+    Buffered writer/reader for the prediction log.
+
+    log_prediction() and log_outcome() only append to an in-memory buffer;
+    rows are committed when the buffer reaches batch_size, on flush()/close(),
+    or every flush_interval seconds when background=True.
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, drift_monitor=None,
+                 background=False, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 drift_retention_days=DEFAULT_DRIFT_RETENTION_DAYS):
+        self.path = path
+        self.batch_size = batch_size
+        self.drift_monitor = drift_monitor
+        self.drift_retention_days = drift_retention_days
+        self._predictions = []
+        self._outcomes = []
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        # Bins from before they were keyed by reference cannot be attributed; drop them
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(drift_bins)')]
+        if columns and 'reference' not in columns:
+            self.conn.execute('DROP TABLE drift_bins')
+        self.conn.executescript(SCHEMA)
+
+        self._stop = threading.Event()
+        self._flusher = None
+        if background:
+            self._flusher = threading.Thread(target=self._flush_loop, args=(flush_interval,), daemon=True)
+            self._flusher.start()
+
+    # ------------------------------------------------------------------ writes
+
+    def log_prediction(self, build_id, features, result, model_id=None, ts=None):
+        row = (build_id, ts or time.time(), model_id,
+               *[features.get(col, 0) for col in FEATURE_COLUMNS],
+               result['cpu'], result['memoryGb'], result['timeMinutes'])
+        with self._lock:
+            self._predictions.append(row)
+            if self.drift_monitor is not None:
+                self.drift_monitor.update(features)
+            full = len(self._predictions) >= self.batch_size
+        if full:
+            self.flush()
+
+    def log_outcome(self, build_id, cpu_avg_pct, memory_gb, build_time_min, status='success', ts=None):
+        with self._lock:
+            self._outcomes.append((build_id, ts or time.time(), cpu_avg_pct, memory_gb, build_time_min, status))
+            full = len(self._outcomes) >= self.batch_size
+        if full:
+            self.flush()
+
+    def set_drift_monitor(self, drift_monitor):
+        """Track drift against a new reference (a reloaded model); pending bins are written under the old one."""
+        self.flush()
+        with self._lock:
+            self.drift_monitor = drift_monitor
+
+    def flush(self):
+        """Commit everything buffered in one transaction."""
+        with self._lock:
+            predictions, self._predictions = self._predictions, []
+            outcomes, self._outcomes = self._outcomes, []
+            drift = self.drift_monitor.drain() if self.drift_monitor is not None else {}
+            if not (predictions or outcomes or drift):
+                return
+            day = int(time.time() // 86400)
+            with self.conn:
+                if predictions:
+                    self.conn.executemany(INSERT_PREDICTION, predictions)
+                if outcomes:
+                    self.conn.executemany(INSERT_OUTCOME, outcomes)
+                if drift:
+                    reference = self.drift_monitor.reference_id
+                    self.conn.executemany(UPSERT_DRIFT, [(reference, day, f, b, n)
+                                                         for (f, b), n in drift.items()])
+                    # Keep the drift table bounded
+                    self.conn.execute('DELETE FROM drift_bins WHERE day < ?',
+                                      (day - self.drift_retention_days,))
+
+    def _flush_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        self.conn.close()
+
+    # ------------------------------------------------------------------- reads
+
+    def joined(self, since=None):
+        """Iterate (build_id, ts, model_id, *features, *predicted, *actual, status) rows."""
+        query = JOIN_QUERY + (' AND o.ts >= ?' if since else '')
+        return self.conn.execute(query, (since,) if since else ())
+
+    def export_training_csv(self, output_path, since=None, successful_only=True):
+        """Write joined rows in the training_features.csv schema (actuals as targets)."""
+        query = EXPORT_QUERY
+        params = []
+        if successful_only:
+            query += " AND (o.status IS NULL OR o.status IN ('success', 'SUCCESS'))"
+        if since:
+            query += ' AND o.ts >= ?'
+            params.append(since)
+        
+        rows = 0
+        with open(output_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(FEATURE_COLUMNS + TARGET_COLUMNS)
+            cursor = self.conn.execute(query, params)
+            while True:
+                chunk = cursor.fetchmany(10_000)
+                if not chunk:
+                    break
+                writer.writerows(chunk)
+                rows += len(chunk)
+        return rows
+
+    def accuracy(self, since=None):
+        """Row count and mean absolute error per target over joined builds."""
+        query = ACCURACY_QUERY + (' AND o.ts >= ?' if since else '')
+        count, *maes = self.conn.execute(query, (since,) if since else ()).fetchone()
+        return {
+            'joined_builds': count,
+            'mae': {col: round(mae, 4) if mae is not None else None
+                    for col, mae in zip(TARGET_COLUMNS, maes)},
+        }
+
+    def predictions_since(self, last_id=0):
+        """Iterate (id, ts, pred_cpu_avg_pct, pred_memory_gb, pred_build_time_min) after last_id."""
+        return self.conn.execute(
+            'SELECT id, ts, pred_cpu_avg_pct, pred_memory_gb, pred_build_time_min '
+            'FROM predictions WHERE id > ? ORDER BY id', (last_id,))
+
+    def drift_counts(self, reference_id, days=7):
+        """
+        feature -> {bin: count} over the last `days` days, counting only bins
+        taken against this drift reference (a retrain writes new bin edges).
+        """
+        since_day = int(time.time() // 86400) - days + 1
+        observed = {}
+        for feature, bin_index, count in self.conn.execute(
+                'SELECT feature, bin, SUM(count) FROM drift_bins WHERE reference = ? AND day >= ? '
+                'GROUP BY feature, bin', (reference_id, since_day)):
+            observed.setdefault(feature, {})[bin_index] = count
+        return observed
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Prediction/outcome log utilities')
+    parser.add_argument('--db', required=True, help='Prediction log SQLite database')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    outcome = sub.add_parser('outcome', help='Record the actual resources a build used')
+    outcome.add_argument('--build-id', required=True)
+    outcome.add_argument('--cpu', type=float, help='Actual average CPU %%')
+    outcome.add_argument('--memory-gb', type=float, help='Actual peak memory (GB)')
+    outcome.add_argument('--time-min', type=float, help='Actual build time (minutes)')
+    outcome.add_argument('--status', default='success')
+    outcome.add_argument('--from-csv', help='Take the targets from the last row of a build_sampler.py CSV')
+
+    export = sub.add_parser('export', help='Export joined rows as a training CSV')
+    export.add_argument('--output', required=True)
+    export.add_argument('--since', type=float, help='Only outcomes at or after this Unix time')
+    export.add_argument('--include-failed', action='store_true')
+
+    sub.add_parser('stats', help='Print row counts and production MAE')
+    args = parser.parse_args()
+
+    log = PredictionLog(args.db)
+    try:
+        if args.command == 'outcome':
+            values = [args.cpu, args.memory_gb, args.time_min]
+            if args.from_csv:
+                with open(args.from_csv) as f:
+                    last = list(csv.DictReader(f))[-1]
+                values = [float(last[col]) for col in TARGET_COLUMNS]
+            if None in values:
+                parser.error('give --cpu, --memory-gb and --time-min, or --from-csv')
+            log.log_outcome(args.build_id, *values, status=args.status)
+            print(f"✅ Outcome recorded for {args.build_id}")
+        elif args.command == 'export':
+            rows = log.export_training_csv(args.output, args.since, not args.include_failed)
+            print(f"✅ Exported {rows} rows to {args.output}")
+        else:
+            counts = {table: log.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                      for table in ('predictions', 'outcomes')}
+            print(json.dumps({**counts, **log.accuracy()}, indent=2))
+    finally:
+        log.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Prediction Lookup Table
+=======================
+Most builds fall into a few discrete profiles (a python feature branch with
+unit tests and a warm cache, ...) whose continuous features only vary in
+narrow bands. This precomputes the model's predictions for those profiles
+so the predictor can answer them with one dict lookup.
+
+Build (offline):
+- cells are keyed on all features, or with --key-features N on the N most
+  important ones (the rest may vary freely inside a cell)
+- key features with at most MAX_DISCRETE_VALUES distinct values in the data
+  are matched exactly; the others are cut into quantile bins
+- each row falls in one grid cell (the tuple of exact values / bin numbers);
+  a cell is eligible when seen --min-count times and the model's predictions
+  for its rows agree (p90 relative spread within --max-error), and eligible
+  cells are kept most frequent first until --coverage of the rows is covered
+- a cell answers with the mean model output of its rows (project_type
+  submodels included, as predict.py routes); its grid point is the
+  per-feature median of its rows
+- stored as one .npz: cell codes, grid points, predictions, bin edges and the
+  model's identity (the table is ignored if the model file changes)
+
+Lookup: a context hits when its cell is in the table and every continuous
+feature is within --tolerance (relative) of the grid point; anything else
+goes to the model. predict.py uses a table given by --table or
+$ML_PREDICTION_TABLE and counts hits (GET /health in server mode).
+
+Usage:
+    python prediction_table.py build --model model.pkl --data ../resources/enhanced_training_data.csv --output table.npz
+    python prediction_table.py evaluate --model model.pkl --table table.npz --data holdout.csv
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from bisect import bisect_right
+
+import numpy as np
+import pandas as pd
+
+import predict
+from predict import FEATURE_COLUMNS
+
+
+MAX_DISCRETE_VALUES = 16
+DEFAULT_BINS = 6
+DEFAULT_COVERAGE = 0.95
+DEFAULT_MIN_COUNT = 3
+DEFAULT_TOLERANCE = 0.25        # |x - grid point| <= tolerance * max(|grid point|, 1)
+DEFAULT_MAX_ERROR = 0.05        # p90 relative spread of the model's predictions within a cell
+TABLE_VERSION = 1
+
+
+# =============================================================================
+# BUILD
+# =============================================================================
+
+def grid_spec(X, bins=DEFAULT_BINS):
+    """Per feature: None (matched exactly) or the inner quantile bin edges."""
+    spec = []
+    for j in range(X.shape[1]):
+        values = X[:, j]
+        if len(np.unique(values)) <= MAX_DISCRETE_VALUES:
+            spec.append(None)
+        else:
+            spec.append(np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])))
+    return spec
+
+
+def cell_codes(X, spec):
+    """(rows, features) integer cell coordinates."""
+    codes = np.empty(X.shape, dtype=np.int64)
+    for j, edges in enumerate(spec):
+        if edges is None:
+            codes[:, j] = np.round(X[:, j]).astype(np.int64)
+        else:
+            codes[:, j] = np.searchsorted(edges, X[:, j], side='right')
+    return codes
+
+
+def route_predict(model_path, X):
+    """Model predictions for feature rows, routed by project_type like predict.py."""
+    out = np.empty((len(X), 3))
+    paths = [predict.route_model_path(model_path, {'project_type': code})
+             for code in X[:, FEATURE_COLUMNS.index('project_type')]]
+    for path in dict.fromkeys(paths):
+        group = [i for i, p in enumerate(paths) if p == path]
+        out[group] = predict.load_model(path).predict(X[group])
+    return out
+
+
+def key_features(model_path, n=None):
+    """Indices of the features cells are keyed on: the n most important (all by default)."""
+    importances = getattr(predict.load_model(model_path), 'feature_importances_', None)
+    if not n or n >= len(FEATURE_COLUMNS) or importances is None:
+        return list(range(len(FEATURE_COLUMNS)))
+    return sorted(np.argsort(-importances)[:n].tolist())
+
+
+def build_table(model_path, X, bins=DEFAULT_BINS, coverage=DEFAULT_COVERAGE, min_count=DEFAULT_MIN_COUNT,
+                max_error=DEFAULT_MAX_ERROR, n_key_features=None):
+    """
+    Frequency-ranked grid cells whose model predictions are stable, with
+    their grid points and predictions (the mean model output of the cell's rows).
+    """
+    keys = key_features(model_path, n_key_features)
+    spec = grid_spec(X[:, keys], bins)
+    codes = cell_codes(X[:, keys], spec)
+    cells, inverse, counts = np.unique(codes, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+
+    # A cell answers for all its rows only if they agree: p90 relative
+    # deviation from the cell's mean prediction within max_error, every target
+    rows_pred = route_predict(model_path, X)
+    grouped = pd.DataFrame(rows_pred).groupby(inverse)
+    mean_pred = grouped.mean().sort_index().to_numpy()
+    deviation = np.abs(rows_pred - mean_pred[inverse]) / np.maximum(np.abs(mean_pred[inverse]), 1.0)
+    spread = pd.DataFrame(deviation).groupby(inverse).quantile(0.9).sort_index().max(axis=1).to_numpy()
+    eligible = (counts >= min_count) & (spread <= max_error)
+
+    order = np.argsort(-counts, kind='stable')
+    order = order[eligible[order]]
+    covered = np.cumsum(counts[order]) / len(X)
+    keep = order[:int(np.searchsorted(covered, coverage)) + 1]
+
+    # Grid point = per-feature median of the cell's rows
+    slot = np.full(len(cells), -1)
+    slot[keep] = np.arange(len(keep))
+    rows = slot[inverse] >= 0
+    points = (pd.DataFrame(X[rows][:, keys]).groupby(slot[inverse][rows]).median()
+              .sort_index().to_numpy(dtype=float))
+
+    from prediction_log import model_id_for
+    return {
+        'version': TABLE_VERSION,
+        'model_id': model_id_for(model_path),
+        'keys': keys,
+        'spec': spec,
+        'cells': cells[keep],
+        'counts': counts[keep],
+        'points': points.reshape(len(keep), len(keys)),
+        'predictions': mean_pred[keep],
+        'coverage': float(counts[keep].sum() / len(X)),
+    }
+
+
+def save_table(table, path):
+    continuous = [j for j, edges in enumerate(table['spec']) if edges is not None]
+    meta = {
+        'version': table['version'],
+        'model_id': table['model_id'],
+        'features': FEATURE_COLUMNS,
+        'keys': table['keys'],
+        'continuous': continuous,
+        'coverage': table['coverage'],
+    }
+    tmp = f'{path}.tmp.npz'
+    np.savez_compressed(
+        tmp,
+        meta=np.array(json.dumps(meta)),
+        edges=np.concatenate([table['spec'][j] for j in continuous]) if continuous else np.zeros(0),
+        edge_counts=np.array([len(table['spec'][j]) for j in continuous], dtype=np.int64),
+        cells=table['cells'].astype(np.int32),
+        counts=table['counts'].astype(np.int64),
+        points=table['points'].astype(np.float32),
+        predictions=table['predictions'].astype(np.float32),
+    )
+    os.replace(tmp, path)
+
+
+# =============================================================================
+# LOOKUP
+# =============================================================================
+
+class PredictionTable:
+    """In-memory table: cell tuple -> row, answering single rows in microseconds."""
+
+    def __init__(self, path, tolerance=DEFAULT_TOLERANCE):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['version'] != TABLE_VERSION or meta['features'] != FEATURE_COLUMNS:
+                raise ValueError(f"Incompatible prediction table: {path}")
+            splits = np.cumsum(data['edge_counts'])[:-1]
+            edges = np.split(data['edges'], splits) if len(data['edge_counts']) else []
+            cells = data['cells']
+            self.points = data['points'].astype(float).tolist()
+            self.predictions = data['predictions'].astype(float)
+        self.model_id = meta['model_id']
+        self.coverage = meta['coverage']
+        self.keys = meta['keys']
+        self.continuous = meta['continuous']        # positions within keys
+        self.edges = {j: [float(e) for e in edge] for j, edge in zip(self.continuous, edges)}
+        self.bins = [(k, self.edges.get(j)) for j, k in enumerate(self.keys)]
+        self.tolerance = tolerance
+        self.index = {tuple(cell): i for i, cell in enumerate(cells.tolist())}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def lookup(self, row):
+        """Table prediction [cpu, memory, time] for one feature row, or None."""
+        key = tuple(
+            int(round(row[k])) if edges is None else bisect_right(edges, row[k])
+            for k, edges in self.bins
+        )
+        i = self.index.get(key)
+        if i is not None:
+            point = self.points[i]
+            for j in self.continuous:
+                if abs(row[self.keys[j]] - point[j]) > self.tolerance * max(abs(point[j]), 1.0):
+                    i = None
+                    break
+        if i is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.predictions[i]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'cells': len(self), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None}
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def load_feature_rows(path):
+    return pd.read_csv(path, usecols=FEATURE_COLUMNS)[FEATURE_COLUMNS].fillna(0).to_numpy(dtype=float)
+
+
+def evaluate(model_path, table_path, X, tolerance):
+    """Hit rate, table-vs-model error on hits, and per-row lookup vs model latency."""
+    table = PredictionTable(table_path, tolerance)
+    started = time.perf_counter()
+    answers = [table.lookup(row) for row in X.tolist()]
+    lookup_us = (time.perf_counter() - started) / len(X) * 1e6
+
+    hit = np.array([a is not None for a in answers])
+    model_pred = route_predict(model_path, X)
+    single = X[:50]
+    started = time.perf_counter()
+    for row in single:
+        route_predict(model_path, row[None, :])
+    model_us = (time.perf_counter() - started) / len(single) * 1e6
+
+    report = {'rows': len(X), **table.stats(), 'lookup_us_per_row': round(lookup_us, 2),
+              'model_us_per_row': round(model_us, 1)}
+    if hit.any():
+        table_pred = np.array([a for a in answers if a is not None])
+        error = np.abs(table_pred - model_pred[hit]).mean(axis=0)
+        report['hit_mae_vs_model'] = dict(zip(predict.RESPONSE_TARGETS, np.round(error, 4).tolist()))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precomputed prediction table for common build profiles')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help='Build a table from observed feature rows')
+    build.add_argument('--model', required=True)
+    build.add_argument('--data', required=True, help='CSV with the feature columns (training data or a log export)')
+    build.add_argument('--output', required=True, help='Table .npz path')
+    build.add_argument('--bins', type=int, default=DEFAULT_BINS, help='Quantile bins per continuous feature')
+    build.add_argument('--coverage', type=float, default=DEFAULT_COVERAGE,
+                       help='Fraction of rows the kept cells should cover')
+    build.add_argument('--min-count', type=int, default=DEFAULT_MIN_COUNT)
+    build.add_argument('--max-error', type=float, default=DEFAULT_MAX_ERROR,
+                       help='Largest p90 relative spread of model predictions inside a kept cell')
+    build.add_argument('--key-features', type=int, default=None,
+                       help='Key cells on the N most important features only (default: all)')
+
+    check = sub.add_parser('evaluate', help='Hit rate and error of a table on feature rows')
+    check.add_argument('--model', required=True)
+    check.add_argument('--table', required=True)
+    check.add_argument('--data', required=True)
+    check.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    try:
+        X = load_feature_rows(args.data)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.command == 'build':
+        started = time.perf_counter()
+        table = build_table(args.model, X, args.bins, args.coverage, args.min_count,
+                            args.max_error, args.key_features)
+        save_table(table, args.output)
+        print(f"✅ {len(table['cells'])} cells covering {table['coverage']:.1%} of {len(X)} rows "
+              f"→ {args.output} ({os.path.getsize(args.output) / 1024:.0f} KB, "
+              f"{time.perf_counter() - started:.1f}s)")
+    else:
+        print(json.dumps(evaluate(args.model, args.table, X, args.tolerance), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Pre-fork Prediction Workers
+===========================
+Multi-process serving for `predict.py --serve ADDR --workers N`.
+
+The threaded server shares one model but runs feature engineering, JSON
+and clamping under one GIL; separate server processes would each unpickle
+their own forest. Here:
+- the parent loads the model (and any per-project-type submodels and
+  stage model), flattens them (forest_arrays.py) into one read-only segment file in
+  /dev/shm, and drops the sklearn objects
+- N forked workers mmap the segment; every worker's node arrays are views
+  onto the same physical pages, so a worker costs its interpreter plus
+  request state, not another model copy
+- workers accept() on one inherited listening socket, so the kernel hands
+  each connection to an idle worker
+- predictions go through predict.py's normal path (routing, explain,
+  logging) with the flattened forests installed in its model caches
+
+Hot reload: the parent polls model.pkl / features.json (or gets SIGHUP),
+and once the files are stable it writes the new generation's segment and
+bumps a shared generation counter. Each worker remaps before its next
+request and switches its prediction log to the new drift reference. The old segment is unlinked right away: workers still mapping it
+keep their pages until they remap, and a worker that races the unlink just
+rereads the counter. A failed reload keeps serving the current model.
+
+The prediction log and shadow DB are opened once in the parent before
+forking, so a bad path fails at startup as with the threaded server. A
+worker that dies prints its traceback and is re-forked; if workers keep
+dying within STARTUP_GRACE_S of starting, the parent gives up with exit 1.
+Stop with SIGINT/SIGTERM; the segment is removed.
+
+Usage:
+    python predict.py --model model.pkl --serve 8080 --workers 4
+    kill -HUP <parent pid>      # reload now instead of waiting for the poll
+"""
+
+import json
+import mmap
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+from http.server import HTTPServer
+
+import numpy as np
+
+import predict
+from forest_arrays import FlatForest
+
+
+SEGMENT_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+RELOAD_POLL_S = 2.0
+ALIGN = 64
+LISTEN_BACKLOG = 128
+STARTUP_GRACE_S = 10.0          # a worker dying sooner than this counts as a failed start
+MAX_FAILED_STARTS = 5           # consecutive failed starts before the parent gives up
+
+
+# =============================================================================
+# SEGMENTS
+# =============================================================================
+
+def model_signature(model_path):
+    """(mtime_ns, size) of model.pkl and its features.json; a change means reload."""
+    manifest = os.path.join(os.path.dirname(os.path.abspath(model_path)), 'features.json')
+    signature = []
+    for path in (model_path, manifest):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def flatten_models(model_path):
+    """
+    Flattened global model, submodels and stage model:
+    ({model path: FlatForest}, {code: submodel path}).
+    """
+    import joblib
+    from stage_prediction import load_stage_meta
+
+    manifest = os.path.join(os.path.dirname(os.path.abspath(model_path)), 'features.json')
+    try:
+        with open(manifest) as f:
+            entries = json.load(f).get('routes') or {}
+    except (FileNotFoundError, ValueError):
+        entries = {}
+    model_dir = os.path.dirname(os.path.abspath(model_path))
+    routes = {int(code): os.path.join(model_dir, entry['path']) for code, entry in entries.items()}
+
+    forests = {model_path: FlatForest.from_model(joblib.load(model_path))}
+    stages = load_stage_meta(model_path)
+    for path in [*routes.values(), *([stages['path']] if stages else [])]:
+        forests[path] = FlatForest.from_model(joblib.load(path))
+    return forests, routes
+
+
+def write_segment(path, forests, routes):
+    """
+    One file: 8-byte header length, JSON header (routes + per-array offset,
+    dtype, shape), then every array 64-byte aligned. Written atomically.
+    """
+    layout, blobs, offset = {}, [], 0
+    for key, forest in forests.items():
+        layout[key] = {}
+        for name, array in forest.arrays().items():
+            array = np.ascontiguousarray(array)
+            offset = -(-offset // ALIGN) * ALIGN
+            layout[key][name] = [offset, array.dtype.str, list(array.shape)]
+            blobs.append((offset, array))
+            offset += array.nbytes
+    header = json.dumps({'routes': {str(c): p for c, p in routes.items()}, 'layout': layout}).encode()
+    base = -(-(8 + len(header)) // ALIGN) * ALIGN
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for array_offset, array in blobs:
+            f.seek(base + array_offset)
+            f.write(array.tobytes())
+        f.truncate(base + offset)
+    os.replace(tmp, path)
+
+
+def attach_segment(path):
+    """Read-only FlatForests viewing the mmapped segment, plus its routes."""
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header_len = int.from_bytes(mapped[:8], 'little')
+    header = json.loads(mapped[8:8 + header_len])
+    base = -(-(8 + header_len) // ALIGN) * ALIGN
+
+    forests = {}
+    for key, arrays in header['layout'].items():
+        views = {}
+        for name, (offset, dtype, shape) in arrays.items():
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape, dtype=np.int64))
+            views[name] = np.frombuffer(mapped, dtype, count, base + offset).reshape(shape)
+        forests[key] = FlatForest.from_arrays(views)
+    routes = {int(code): path for code, path in header['routes'].items()}
+    return forests, routes
+
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+class WorkerHTTPServer(HTTPServer):
+    """Single-threaded server on the parent's listening socket; remaps on new generations."""
+
+    def __init__(self, sock, handler, model_path, generation, segment_path, prediction_log=None):
+        HTTPServer.__init__(self, sock.getsockname(), handler, bind_and_activate=False)
+        self.socket = sock
+        self.model_path = model_path
+        self.generation = generation
+        self.segment_path = segment_path
+        self.prediction_log = prediction_log
+        self.attached = 0
+
+    def refresh(self):
+        """
+        Install the current generation's forests into predict.py's caches if
+        it changed, and bin drift against its features.json reference.
+        """
+        while self.attached != self.generation.value:
+            gen = self.generation.value
+            try:
+                forests, routes = attach_segment(self.segment_path(gen))
+            except FileNotFoundError:
+                continue            # superseded while we looked; reread the counter
+            predict._MODEL_CACHE.clear()
+            predict._FOREST_CACHE.clear()
+            predict._SUBMODEL_PATHS.clear()
+            predict._STAGE_META.clear()
+            predict._TABLES.clear()             # tables are checked against the model they were built for
+            predict._MODEL_CACHE.update(forests)
+            predict._FOREST_CACHE.update(forests)
+            predict._ROUTES[self.model_path] = routes
+            if self.prediction_log is not None:
+                from drift_monitor import DriftMonitor
+                manifest = os.path.join(os.path.dirname(os.path.abspath(self.model_path)), 'features.json')
+                self.prediction_log.set_drift_monitor(DriftMonitor.from_manifest(manifest))
+            self.attached = gen
+
+
+class WorkerHandler(predict.PredictionHandler):
+    """PredictionHandler that picks up a reloaded model before each request."""
+
+    def do_POST(self):
+        self.server.refresh()
+        super().do_POST()
+
+
+def run_worker(sock, model_path, generation, segment_path, log_db, shadow_models=None, shadow_db=None):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    log = predict.open_prediction_log(log_db, model_path, background=True) if log_db else None
+    # Each worker runs its own shadow thread (threads do not survive fork)
+    shadow = predict.open_shadow(shadow_models, shadow_db) if shadow_models else None
+    handler = type('BoundWorkerHandler', (WorkerHandler,),
+                   {'model_path': model_path, 'prediction_log': log, 'shadow': shadow})
+    server = WorkerHTTPServer(sock, handler, model_path, generation, segment_path, log)
+    server.refresh()
+    try:
+        server.serve_forever()
+    finally:
+        if log is not None:
+            log.close()
+        if shadow is not None:
+            shadow.close()
+
+
+# =============================================================================
+# PARENT
+# =============================================================================
+
+def serve_workers(address, model_path, workers, log_db=None, poll_s=RELOAD_POLL_S,
+                  shadow_models=None, shadow_db=None):
+    """Pre-fork `workers` processes serving one shared, hot-reloadable model segment."""
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model not found: {model_path}")
+    # Fail fast on log / shadow config errors; workers reopen their own after fork
+    if log_db:
+        predict.open_prediction_log(log_db, model_path).close()
+    if shadow_models:
+        predict.open_shadow(shadow_models, shadow_db).close()
+
+    prefix = os.path.join(SEGMENT_DIR, f'ml-forest-{os.getpid()}')
+
+    def segment_path(gen):
+        return f'{prefix}-{gen}'
+
+    generation = multiprocessing.RawValue('q', 0)
+
+    def publish():
+        forests, routes = flatten_models(model_path)
+        gen = generation.value + 1
+        write_segment(segment_path(gen), forests, routes)
+        generation.value = gen
+        if gen > 1:
+            try:
+                os.unlink(segment_path(gen - 1))
+            except FileNotFoundError:
+                pass
+        return sum(len(f.feature) for f in forests.values()), len(forests)
+
+    signature = model_signature(model_path)
+    nodes, models = publish()
+
+    host, port = predict.parse_address(address)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(LISTEN_BACKLOG)
+
+    def fork_worker():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(sock, model_path, generation, segment_path, log_db, shadow_models, shadow_db)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stderr.flush()
+                os._exit(code)
+        started[pid] = time.monotonic()
+        return pid
+
+    started = {}            # worker pid -> monotonic start time
+    failed_starts = 0
+    children = {fork_worker() for _ in range(workers)}
+    print(f"Serving predictions on http://{host}:{sock.getsockname()[1]}/predict "
+          f"({workers} workers, {models} models, {nodes} nodes shared)", file=sys.stderr)
+
+    reload_now = False
+
+    def on_hup(signum, frame):
+        nonlocal reload_now
+        reload_now = True
+
+    def on_term(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGHUP, on_hup)
+    signal.signal(signal.SIGTERM, on_term)
+
+    seen = signature
+    try:
+        while True:
+            time.sleep(poll_s)
+
+            # Re-fork workers that died
+            for pid in list(children):
+                done, status = os.waitpid(pid, os.WNOHANG)
+                if done:
+                    children.discard(pid)
+                    lived = time.monotonic() - started.pop(pid)
+                    failed_starts = failed_starts + 1 if lived < STARTUP_GRACE_S else 0
+                    if failed_starts >= MAX_FAILED_STARTS:
+                        print(f"❌ Workers keep exiting right after start ({failed_starts} in a row); "
+                              f"stopping", file=sys.stderr)
+                        sys.exit(1)
+                    children.add(fork_worker())
+                    print(f"⚠️ Worker {pid} exited (status {os.waitstatus_to_exitcode(status)}) "
+                          f"after {lived:.1f}s; restarted", file=sys.stderr)
+
+            # Reload once the model files have stopped changing
+            current = model_signature(model_path)
+            if reload_now or (current != signature and current == seen):
+                reload_now = False
+                try:
+                    nodes, models = publish()
+                    signature = current
+                    print(f"✅ Reloaded model (generation {generation.value}, {nodes} nodes)", file=sys.stderr)
+                except Exception as e:
+                    signature = current
+                    print(f"⚠️ Reload failed, still serving generation {generation.value}: {e}",
+                          file=sys.stderr)
+            seen = current
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sock.close()
+        try:
+            os.unlink(segment_path(generation.value))
+        except FileNotFoundError:
+            pass
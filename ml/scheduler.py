@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Build Bin-Packing Scheduler
+===========================
+Assigns a queue of pending builds to the labeled node pool.
+
+LabelMapper picks one label per build from predicted memory alone and
+ignores executor counts; this engine packs several light builds onto a
+shared node when memory, executors and CPU allow.
+
+Each build needs:
+- memory:   predicted memory x buffer (GB) free on the node
+- executor: one free executor slot
+- cpu:      predicted cpu% / 100 of the node's CPU capacity
+
+Builds are placed largest first (first-fit / best-fit decreasing). Each
+placement is one vectorized NumPy pass over the candidate nodes: nodes
+already hosting builds plus one unused node per node type (unused nodes of
+a type are interchangeable), so cost does not grow with idle pool size.
+
+Objectives:
+- pack (default): fewest / tightest nodes (best-fit or first-fit)
+- cost:           prefer nodes already in use, then the cheapest node
+- makespan:       longest builds first, onto the node that finishes earliest
+
+Usage:
+    python scheduler.py --queue queue.json --pool-counts executor=4 build=6 test=2 heavytest=1
+    python scheduler.py --benchmark 10000
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+
+import numpy as np
+
+from node_pool import INSTANCES, MEMORY_BUFFER
+
+
+STRATEGIES = ('best_fit', 'first_fit')
+OBJECTIVES = ('pack', 'cost', 'makespan')
+
+# Fraction of a node's CPU that co-located builds may use in total
+DEFAULT_CPU_CAPACITY = 1.0
+
+# Builds placed between sweeps that drop full nodes and open nodes no
+# remaining build fits
+PRUNE_EVERY = 32
+
+
+# =============================================================================
+# INPUTS
+# =============================================================================
+
+def expand_pool(pool, instances=INSTANCES):
+    """
+    Expand a pool spec into per-node arrays.
+
+    pool is {label: count} or a list of {'label', 'count', optional
+    'memory', 'executors'} overrides. Nodes are ordered smallest first, so
+    first-fit prefers small nodes.
+    """
+    if isinstance(pool, dict):
+        pool = [{'label': label, 'count': count} for label, count in pool.items()]
+
+    specs = []
+    for entry in pool:
+        base = instances.get(entry['label'], {})
+        memory = entry.get('memory', base.get('memory'))
+        executors = entry.get('executors', base.get('executors', 1))
+        if memory is None:
+            raise ValueError(f"Unknown label without memory: {entry['label']}")
+        cost = entry.get('hourly_price', base.get('hourly_price', memory))
+        specs.append((memory, entry['label'], executors, cost, int(entry.get('count', 1))))
+    specs.sort(key=lambda s: s[0])
+
+    names, labels, groups, memory, executors, cost = [], [], [], [], [], []
+    for group, (mem, label, execs, price, count) in enumerate(specs):
+        for i in range(count):
+            names.append(f'{label}-{i + 1}')
+            labels.append(label)
+            groups.append(group)
+            memory.append(mem)
+            executors.append(execs)
+            cost.append(price)
+    return {
+        'names': names,
+        'labels': labels,
+        'groups': groups,
+        'memory': np.asarray(memory, dtype=float),
+        'executors': np.asarray(executors, dtype=np.int64),
+        'cost': np.asarray(cost, dtype=float),
+    }
+
+
+def builds_to_arrays(builds):
+    """Accept a list of predict.py-style dicts ({'buildId', 'cpu', 'memoryGb', 'timeMinutes'})."""
+    return {
+        'ids': [str(b.get('buildId', b.get('build_id', i))) for i, b in enumerate(builds)],
+        'cpu': np.asarray([float(b.get('cpu', b.get('cpu_avg_pct', 0))) for b in builds]),
+        'memory': np.asarray([float(b.get('memoryGb', b.get('memory_gb', 0))) for b in builds]),
+        'time': np.asarray([float(b.get('timeMinutes', b.get('build_time_min', 0))) for b in builds]),
+    }
+
+
+def load_queue(path):
+    """Read pending builds from a JSON list or a CSV with the same keys."""
+    if path.endswith('.csv'):
+        with open(path) as f:
+            return list(csv.DictReader(f))
+    with open(path) as f:
+        return json.load(f)
+
+
+# =============================================================================
+# SCHEDULING
+# =============================================================================
+
+def schedule(builds, pool, strategy='best_fit', objective='pack',
+             memory_buffer=MEMORY_BUFFER, cpu_capacity=DEFAULT_CPU_CAPACITY):
+    """
+    Run one scheduling round.
+
+    builds: output of builds_to_arrays() (or a list of dicts)
+    pool:   output of expand_pool() (or a pool spec)
+    cpu_capacity: None disables the CPU constraint.
+
+    Returns {'assignments': [...per used node...], 'unassigned': [...ids...], 'summary': {...}}.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy}")
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective: {objective}")
+    if not isinstance(builds, dict):
+        builds = builds_to_arrays(builds)
+    if 'names' not in pool:
+        pool = expand_pool(pool)
+
+    started = time.perf_counter()
+    need_mem = builds['memory'] * memory_buffer
+    need_cpu = builds['cpu'] / 100.0
+    durations = builds['time']
+
+    n_nodes = len(pool['names'])
+    load_min = np.zeros(n_nodes)            # assigned build-minutes per node
+    node_of = np.full(len(need_mem), -1, dtype=np.int64)
+
+    # Decreasing order: biggest memory first (longest first for makespan)
+    order = np.argsort(-(durations if objective == 'makespan' else need_mem), kind='stable')
+
+    # Candidate nodes live in compact parallel arrays: nodes already hosting
+    # builds plus the first unused node of each type (unused nodes of a type
+    # are interchangeable, so the next one is only added once that one is
+    # used). Full nodes are deactivated and swept out periodically, so each
+    # placement scans open nodes only, never the whole pool.
+    cand_node = np.empty(n_nodes, dtype=np.int64)
+    cand_mem = np.empty(n_nodes)
+    cand_cpu = np.empty(n_nodes)
+    cand_slots = np.empty(n_nodes, dtype=np.int64)
+    cand_load = np.empty(n_nodes)
+    cand_exec = np.empty(n_nodes)
+    cand_cost = np.empty(n_nodes)
+    cand_used = np.zeros(n_nodes, dtype=bool)
+    cand_active = np.zeros(n_nodes, dtype=bool)
+    n = 0
+    cpu_start = np.inf if cpu_capacity is None else float(cpu_capacity)
+
+    def add_candidate(node, at):
+        cand_node[at] = node
+        cand_mem[at] = pool['memory'][node]
+        cand_cpu[at] = cpu_start
+        cand_slots[at] = pool['executors'][node]
+        cand_load[at] = 0.0
+        cand_exec[at] = pool['executors'][node]
+        cand_cost[at] = pool['cost'][node]
+        cand_used[at] = False
+        cand_active[at] = True
+
+    unused = {}
+    for node, group in enumerate(pool['groups']):
+        unused.setdefault(group, []).append(node)
+    for nodes in unused.values():
+        nodes.reverse()
+        add_candidate(nodes.pop(), n)
+        n += 1
+
+    # Smallest memory / CPU still to be placed after each position; open
+    # nodes that cannot fit even those are swept out with the full ones
+    min_mem_after = np.minimum.accumulate(need_mem[order][::-1])[::-1]
+    min_cpu_after = np.minimum.accumulate(need_cpu[order][::-1])[::-1]
+
+    for k, i in enumerate(order):
+        if k % PRUNE_EVERY == 0 and n:
+            keep = cand_active[:n] & (~cand_used[:n] | (
+                (cand_mem[:n] >= min_mem_after[k]) & (cand_cpu[:n] >= min_cpu_after[k])))
+            if not keep.all():
+                kept = int(keep.sum())
+                for arr in (cand_node, cand_mem, cand_cpu, cand_slots, cand_load,
+                            cand_exec, cand_cost, cand_used, cand_active):
+                    arr[:kept] = arr[:n][keep]
+                n = kept
+            if n == 0:
+                break
+
+        feasible = cand_active[:n] & (cand_mem[:n] >= need_mem[i]) & (cand_cpu[:n] >= need_cpu[i])
+        if not feasible.any():
+            continue
+
+        if objective == 'makespan':
+            score = (cand_load[:n] + durations[i]) / cand_exec[:n]
+        elif objective == 'cost':
+            # Open nodes are already paid for; otherwise the cheapest node,
+            # with leftover memory as the tie-break
+            score = np.where(cand_used[:n], 0.0, cand_cost[:n]) * 1e6 + cand_mem[:n]
+        elif strategy == 'best_fit':
+            score = cand_mem[:n]
+        else:
+            # First fit: lowest node index, i.e. smallest node type first
+            score = cand_node[:n]
+        pos = int(np.where(feasible, score, np.inf).argmin())
+
+        node = int(cand_node[pos])
+        node_of[i] = node
+        load_min[node] += durations[i]
+        cand_mem[pos] -= need_mem[i]
+        cand_cpu[pos] -= need_cpu[i]
+        cand_slots[pos] -= 1
+        cand_load[pos] += durations[i]
+        if cand_slots[pos] == 0:
+            cand_active[pos] = False
+
+        if not cand_used[pos]:
+            cand_used[pos] = True
+            fresh = unused[pool['groups'][node]]
+            if fresh:
+                add_candidate(fresh.pop(), n)
+                n += 1
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return _format_result(builds, pool, node_of, need_mem, load_min, elapsed_ms)
+
+
+def _format_result(builds, pool, node_of, need_mem, load_min, elapsed_ms):
+    ids = builds['ids']
+    assigned = node_of >= 0
+    by_node = {}
+    for i in np.flatnonzero(assigned):
+        by_node.setdefault(int(node_of[i]), []).append(i)
+
+    assignments = []
+    for node, members in sorted(by_node.items()):
+        assignments.append({
+            'node': pool['names'][node],
+            'label': pool['labels'][node],
+            'builds': [ids[i] for i in members],
+            'memory_used_gb': round(float(need_mem[members].sum()), 2),
+            'memory_gb': float(pool['memory'][node]),
+            'executors_used': len(members),
+            'est_finish_min': round(float(load_min[node] / pool['executors'][node]), 1),
+        })
+
+    used_nodes = list(by_node)
+    used_memory = float(pool['memory'][used_nodes].sum()) if used_nodes else 0.0
+    return {
+        'assignments': assignments,
+        'unassigned': [ids[i] for i in np.flatnonzero(~assigned)],
+        'summary': {
+            'builds': len(ids),
+            'assigned': int(assigned.sum()),
+            'nodes_used': len(used_nodes),
+            'nodes_available': len(pool['names']),
+            'memory_utilization': round(float(need_mem[assigned].sum()) / used_memory, 3) if used_memory else 0.0,
+            'makespan_min': round(float(max(a['est_finish_min'] for a in assignments)), 1) if assignments else 0.0,
+            'elapsed_ms': round(elapsed_ms, 1),
+        },
+    }
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+def synthetic_queue(n, seed=42):
+    """Pending builds with a memory mix similar to the training data."""
+    rng = np.random.default_rng(seed)
+    memory = np.clip(rng.lognormal(mean=1.3, sigma=0.7, size=n), 0.5, 24)
+    return {
+        'ids': [f'queued-{i + 1}' for i in range(n)],
+        'cpu': np.clip(rng.normal(55, 20, size=n), 10, 100),
+        'memory': memory,
+        'time': np.clip(memory * rng.uniform(1.5, 5, size=n), 1, 240),
+    }
+
+
+def benchmark(n_builds, strategy, objective):
+    # Pool sized so the whole queue fits
+    pool = expand_pool({'lightweight': n_builds // 10, 'executor': n_builds // 4,
+                        'build': n_builds // 2, 'test': n_builds // 4, 'heavytest': n_builds // 10})
+    result = schedule(synthetic_queue(n_builds), pool, strategy, objective)
+    return {'strategy': strategy, 'objective': objective, **result['summary']}
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def parse_pool_counts(values):
+    pool = {}
+    for value in values:
+        label, _, count = value.partition('=')
+        if label not in INSTANCES:
+            raise ValueError(f"Unknown label: {label} (expected one of {list(INSTANCES)})")
+        pool[label] = int(count or 1)
+    return pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack pending builds onto the labeled node pool')
+    parser.add_argument('--queue', help='Pending builds: JSON list or CSV (buildId, cpu, memoryGb, timeMinutes)')
+    parser.add_argument('--pool', help='Pool JSON: {label: count} or [{label, count, memory?, executors?}]')
+    parser.add_argument('--pool-counts', nargs='*', default=[], metavar='LABEL=N',
+                        help='Pool as label=count pairs (alternative to --pool)')
+    parser.add_argument('--strategy', choices=STRATEGIES, default='best_fit')
+    parser.add_argument('--objective', choices=OBJECTIVES, default='pack')
+    parser.add_argument('--memory-buffer', type=float, default=MEMORY_BUFFER)
+    parser.add_argument('--cpu-capacity', type=float, default=DEFAULT_CPU_CAPACITY,
+                        help='Total CPU fraction co-located builds may use per node (0 disables the check)')
+    parser.add_argument('--benchmark', type=int, metavar='N', help='Time one round of N synthetic builds')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for objective in OBJECTIVES:
+            print(json.dumps(benchmark(args.benchmark, args.strategy, objective)))
+        return
+
+    if not args.queue or not (args.pool or args.pool_counts):
+        parser.error('--queue and one of --pool / --pool-counts are required')
+
+    if args.pool:
+        with open(args.pool) as f:
+            pool = json.load(f)
+    else:
+        pool = parse_pool_counts(args.pool_counts)
+
+    try:
+        result = schedule(load_queue(args.queue), pool, args.strategy, args.objective,
+                          args.memory_buffer, args.cpu_capacity or None)
+    except Exception as e:
+        print(json.dumps({'error': str(e)}), file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
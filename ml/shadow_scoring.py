@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Shadow Model Scoring
+====================
+Runs candidate models on live traffic next to the primary model without
+touching the response path:
+
+- predict.py answers with the primary model as usual, then hands the
+  request's feature row and primary result to ShadowScorer.submit()
+- submit() is a non-blocking put into a bounded queue; when the queue is
+  full the row is dropped (and counted), never waited on
+- one background thread collects batches (up to DEFAULT_BATCH_SIZE rows or
+  LINGER_S seconds), scores each batch with every candidate, and writes
+  the paired primary/candidate results to SQLite
+
+To keep the shadow thread from slowing the request threads, candidates
+are flattened (forest_arrays.py) so each batch is a few vectorized numpy
+steps instead of sklearn's per-call overhead, and on Linux the thread
+runs at the lowest CPU priority (nice 19).
+
+Candidates are served the way predict.py would serve them once promoted:
+a candidate with per-project-type submodels (its features.json 'routes')
+scores each row with the matching submodel, and its outputs get the same
+clamping/rounding as the primary response, so differences are what a
+promotion would actually change.
+
+The report summarizes divergence per candidate and target (mean and p95
+absolute difference, signed bias), node label agreement, and, given the
+prediction log, accuracy of both models against actual outcomes.
+
+Usage:
+    python predict.py --model model.pkl --serve 8080 --shadow candidate/model.pkl --shadow-db shadow.db
+    python shadow_scoring.py --db shadow.db report
+    python shadow_scoring.py --db shadow.db report --log-db prediction_log.db
+"""
+
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from forest_arrays import FlatForest
+from node_pool import INSTANCES, get_label
+from predict import FEATURE_COLUMNS, RESPONSE_TARGETS, format_prediction, load_routes
+from prediction_log import model_id_for
+
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 64
+LINGER_S = 0.25                 # how long a partial batch waits for more rows
+PROJECT_TYPE = FEATURE_COLUMNS.index('project_type')
+SHADOW_NICE = 19
+NODE_MEMORY = {label: config['memory'] for label, config in INSTANCES.items()}
+LABEL_ORDER = {label: i for i, label in enumerate(INSTANCES)}
+
+# Response key -> column suffix
+TARGET_SUFFIXES = {'cpu': 'cpu', 'memoryGb': 'memory_gb', 'timeMinutes': 'time_min'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shadow_predictions (
+    id INTEGER PRIMARY KEY,
+    build_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    primary_model TEXT,
+    candidate_model TEXT NOT NULL,
+    primary_cpu REAL, primary_memory_gb REAL, primary_time_min REAL, primary_label TEXT,
+    candidate_cpu REAL, candidate_memory_gb REAL, candidate_time_min REAL, candidate_label TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_shadow_candidate ON shadow_predictions (candidate_model, ts);
+CREATE INDEX IF NOT EXISTS idx_shadow_build_id ON shadow_predictions (build_id);
+"""
+
+INSERT_SHADOW = (
+    "INSERT INTO shadow_predictions (build_id, ts, primary_model, candidate_model, "
+    "primary_cpu, primary_memory_gb, primary_time_min, primary_label, "
+    "candidate_cpu, candidate_memory_gb, candidate_time_min, candidate_label) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+# =============================================================================
+# SCORER
+# =============================================================================
+
+class ShadowScorer:
+    """Bounded, drop-on-overflow queue feeding one background scoring thread."""
+
+    def __init__(self, candidate_paths, db_path, queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        # (model id, global forest, {project_type code: submodel forest})
+        self.candidates = [(model_id_for(path), FlatForest.from_model(joblib.load(path)),
+                            {code: FlatForest.from_model(joblib.load(route))
+                             for code, route in load_routes(path).items()})
+                           for path in candidate_paths]
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.submitted = self.dropped = self.scored = self.errors = 0
+
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, build_id, row, result, primary_model=None):
+        """Queue one request for shadow scoring; never blocks. False if dropped."""
+        self.submitted += 1
+        try:
+            self.queue.put_nowait((build_id, time.time(), primary_model, row,
+                                   [result[key] for key in RESPONSE_TARGETS]))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stats(self):
+        return {'candidates': [model_id for model_id, _, _ in self.candidates],
+                'submitted': self.submitted, 'dropped': self.dropped, 'scored': self.scored,
+                'errors': self.errors, 'queued': self.queue.qsize()}
+
+    def _run(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), SHADOW_NICE)
+        except (AttributeError, OSError):
+            pass                # per-thread nice is Linux-only
+        while not (self._stop.is_set() and self.queue.empty()):
+            try:
+                batch = [self.queue.get(timeout=0.2)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + LINGER_S
+            while len(batch) < self.batch_size:
+                remaining = 0 if self._stop.is_set() else deadline - time.monotonic()
+                try:
+                    batch.append(self.queue.get(timeout=remaining) if remaining > 0
+                                 else self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._score(batch)
+                self.scored += len(batch)
+            except Exception as e:
+                self.errors += len(batch)
+                print(f"Shadow scoring failed: {e}", file=sys.stderr)
+
+    def _score(self, batch):
+        X = np.array([item[3] for item in batch], dtype=float)
+        codes = X[:, PROJECT_TYPE].astype(int)
+        rows = []
+        for candidate_id, forest, routes in self.candidates:
+            predictions = np.empty((len(X), forest.n_outputs))
+            routed = np.isin(codes, list(routes))
+            if (~routed).any():
+                predictions[~routed] = forest.predict(X[~routed])
+            for code in set(codes[routed].tolist()):
+                group = codes == code
+                predictions[group] = routes[code].predict(X[group])
+            for item, prediction in zip(batch, predictions):
+                build_id, ts, primary_model, _, primary = item
+                candidate = format_prediction(prediction)
+                rows.append((build_id, ts, primary_model, candidate_id,
+                             *primary, get_label(primary[1]),
+                             *[candidate[key] for key in RESPONSE_TARGETS],
+                             get_label(candidate['memoryGb'])))
+        with self.conn:
+            self.conn.executemany(INSERT_SHADOW, rows)
+
+    def close(self):
+        """Score whatever is still queued, then stop."""
+        self._stop.set()
+        self._thread.join()
+        self.conn.close()
+
+
+# =============================================================================
+# REPORT
+# =============================================================================
+
+# Latest outcome per build from an attached prediction log
+OUTCOME_JOIN = """
+LEFT JOIN log.outcomes o
+  ON o.id = (SELECT MAX(id) FROM log.outcomes WHERE build_id = s.build_id)
+"""
+
+
+def divergence_report(db_path, log_db=None, since=None):
+    """Per-candidate divergence from the primary model (and accuracy when outcomes exist)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        columns = 's.*'
+        join = ''
+        if log_db:
+            conn.execute('ATTACH DATABASE ? AS log', (log_db,))
+            columns += ', o.cpu_avg_pct AS actual_cpu, o.memory_gb AS actual_memory_gb, ' \
+                       'o.build_time_min AS actual_time_min'
+            join = OUTCOME_JOIN
+        query = f'SELECT {columns} FROM shadow_predictions s {join}'
+        params = ()
+        if since:
+            query += ' WHERE s.ts >= ?'
+            params = (since,)
+        df = pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+    report = {}
+    for candidate, rows in df.groupby('candidate_model'):
+        entry = {'n': len(rows), 'primary_models': sorted(rows['primary_model'].dropna().unique().tolist())}
+        for key, suffix in TARGET_SUFFIXES.items():
+            diff = rows[f'candidate_{suffix}'] - rows[f'primary_{suffix}']
+            entry[key] = {
+                'mean_abs_diff': round(float(diff.abs().mean()), 4),
+                'p95_abs_diff': round(float(diff.abs().quantile(0.95)), 4),
+                'mean_diff': round(float(diff.mean()), 4),
+            }
+        primary_rank = rows['primary_label'].map(LABEL_ORDER)
+        candidate_rank = rows['candidate_label'].map(LABEL_ORDER)
+        entry['label'] = {
+            'agreement': round(float((primary_rank == candidate_rank).mean()), 4),
+            'upsized': int((candidate_rank > primary_rank).sum()),
+            'downsized': int((candidate_rank < primary_rank).sum()),
+        }
+
+        if log_db:
+            known = rows.dropna(subset=['actual_memory_gb'])
+            entry['with_outcome'] = len(known)
+            if len(known):
+                for side in ('primary', 'candidate'):
+                    node_memory = known[f'{side}_label'].map(NODE_MEMORY)
+                    entry[f'{side}_accuracy'] = {
+                        **{f'{key}_mae': round(float((known[f'{side}_{suffix}']
+                                                     - known[f'actual_{suffix}']).abs().mean()), 4)
+                           for key, suffix in TARGET_SUFFIXES.items()},
+                        'under_provisioned_rate': round(float((node_memory < known['actual_memory_gb']).mean()), 4),
+                    }
+        report[candidate] = entry
+    return report
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Shadow model comparison report')
+    parser.add_argument('--db', required=True, help='Shadow results SQLite database')
+    sub = parser.add_subparsers(dest='command', required=True)
+    report = sub.add_parser('report', help='Divergence of each candidate from the primary model')
+    report.add_argument('--log-db', help='Prediction log with outcomes, for accuracy against actuals')
+    report.add_argument('--since', type=float, help='Only shadow rows at or after this Unix time')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Shadow database not found: {args.db}", file=sys.stderr)
+        sys.exit(1)
+    result = divergence_report(args.db, args.log_db, args.since)
+    print(json.dumps(result, indent=2))
+    if not result:
+        print("⚠️ No shadow predictions recorded yet", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
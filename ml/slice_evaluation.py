@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Sliced Accuracy Gate
+====================
+Scores a candidate model against the currently promoted one on a golden
+holdout, per slice, and fails the promotion when any slice regresses.
+An overall R² can improve while android/emulator builds get much worse;
+this catches that.
+
+Slices: every value of project_type, branch_type, build_type,
+uses_emulator and is_first_build, plus 'all'. Per slice and target:
+- mae, r2
+- over_rate:  prediction above actual by more than --tolerance (relative)
+- under_rate: prediction below actual by more than --tolerance
+and for the node label picked from predicted memory (1.2x buffer):
+- label_under_rate: node memory below the actual peak (OOM)
+- label_over_rate:  bigger node than the actual peak needed
+
+Each row's error terms are stacked into one (rows, stats) matrix, and a
+sparse (slices, rows) membership matrix sums them for every slice in one
+product, so the whole gate is two model.predict calls plus one matmul.
+
+Both models are scored the way predict.py serves them: rows are routed
+to a model's per-project-type submodels when it has them.
+
+The holdout must not be part of the training data (e.g. keep a fixed
+slice of enhanced_training_data.csv out of train_model.py's input).
+
+A missing --baseline fails the gate; pass --no-baseline to score a first
+model on its own.
+
+Usage:
+    python slice_evaluation.py --holdout golden.csv --candidate new/model.pkl --baseline model.pkl
+    python slice_evaluation.py --holdout golden.csv --candidate model.pkl --no-baseline
+    (exits with status 2 when any slice regresses)
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from node_pool import INSTANCES, MEMORY_BUFFER, label_indices
+from predict import BRANCH_TYPES, FEATURE_COLUMNS, PROJECT_TYPES
+from prediction_table import route_predict
+
+
+TARGET_COLUMNS = ['cpu_avg_pct', 'memory_gb', 'build_time_min']
+SLICE_COLUMNS = ['project_type', 'branch_type', 'build_type', 'uses_emulator', 'is_first_build']
+
+# Readable slice values (first name for each code)
+SLICE_VALUE_NAMES = {
+    'project_type': {code: name for name, code in reversed(list(PROJECT_TYPES.items()))},
+    'branch_type': {code: name for name, code in reversed(list(BRANCH_TYPES.items()))},
+    'build_type': {0: 'debug', 1: 'release'},
+}
+
+DEFAULT_TOLERANCE = 0.2             # relative band for over/under provisioning
+DEFAULT_MIN_ROWS = 20               # smaller slices are reported but never gate
+DEFAULT_MAX_MAE_INCREASE = 0.05     # relative
+DEFAULT_MAX_R2_DROP = 0.02          # absolute
+DEFAULT_MAX_RATE_INCREASE = 0.02    # absolute, for every *_rate metric
+
+NODE_MEMORY = np.array([config['memory'] for config in INSTANCES.values()], dtype=float)
+
+# Per-row stats for each target, then the label stats
+TARGET_STATS = ['abs_err', 'sq_err', 'over', 'under']
+LABEL_STATS = ['label_under', 'label_over']
+
+
+# =============================================================================
+# SLICES
+# =============================================================================
+
+def slice_membership(df):
+    """Slice names and a sparse (slices, rows) 0/1 membership matrix (first slice is 'all')."""
+    n = len(df)
+    names = ['all']
+    group_rows = [np.zeros(n, dtype=np.int64)]
+    for column in SLICE_COLUMNS:
+        values, inverse = np.unique(df[column].to_numpy(), return_inverse=True)
+        value_names = SLICE_VALUE_NAMES.get(column, {})
+        group_rows.append(inverse + len(names))
+        names.extend(f'{column}={value_names.get(int(v), int(v))}' for v in values)
+    groups = np.concatenate(group_rows)
+    rows = np.tile(np.arange(n), len(group_rows))
+    membership = sparse.csr_matrix((np.ones(len(groups)), (groups, rows)), shape=(len(names), n))
+    return names, membership
+
+
+def row_stats(y, pred, tolerance, buffer):
+    """(rows, stats) matrix of per-row error terms for one model's predictions."""
+    columns = []
+    for k in range(len(TARGET_COLUMNS)):
+        err = pred[:, k] - y[:, k]
+        band = tolerance * np.abs(y[:, k])
+        columns += [np.abs(err), err ** 2, err > band, err < -band]
+    memory = TARGET_COLUMNS.index('memory_gb')
+    label = label_indices(pred[:, memory], buffer)
+    columns += [NODE_MEMORY[label] < y[:, memory], label > label_indices(y[:, memory], 1.0)]
+    return np.column_stack(columns).astype(float)
+
+
+def slice_metrics(names, membership, y, pred, tolerance=DEFAULT_TOLERANCE, buffer=MEMORY_BUFFER):
+    """{slice: {'n', target: {mae, r2, over_rate, under_rate}, 'label': {...}}} in one pass."""
+    stats = np.hstack([row_stats(y, pred, tolerance, buffer), y, y ** 2, np.ones((len(y), 1))])
+    sums = np.asarray(membership @ stats)
+    n = sums[:, -1]
+    n_targets = len(TARGET_COLUMNS)
+    offset = len(TARGET_STATS) * n_targets + len(LABEL_STATS)
+    y_sum, y_sq = sums[:, offset:offset + n_targets], sums[:, offset + n_targets:offset + 2 * n_targets]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_row = sums / n[:, None]
+        ss_tot = y_sq - y_sum ** 2 / n[:, None]
+
+    report = {}
+    for g, name in enumerate(names):
+        entry = {'n': int(n[g])}
+        for k, target in enumerate(TARGET_COLUMNS):
+            abs_err, sq_err, over, under = per_row[g, k * 4:(k + 1) * 4]
+            r2 = 1 - sums[g, k * 4 + 1] / ss_tot[g, k] if ss_tot[g, k] > 1e-12 else None
+            entry[target] = {
+                'mae': round(float(abs_err), 4),
+                'r2': round(float(r2), 4) if r2 is not None else None,
+                'over_rate': round(float(over), 4),
+                'under_rate': round(float(under), 4),
+            }
+        label_under, label_over = per_row[g, len(TARGET_STATS) * n_targets:offset]
+        entry['label'] = {'label_under_rate': round(float(label_under), 4),
+                          'label_over_rate': round(float(label_over), 4)}
+        report[name] = entry
+    return report
+
+
+# =============================================================================
+# REGRESSION CHECK
+# =============================================================================
+
+def find_regressions(candidate, baseline, min_rows=DEFAULT_MIN_ROWS,
+                     max_mae_increase=DEFAULT_MAX_MAE_INCREASE, max_r2_drop=DEFAULT_MAX_R2_DROP,
+                     max_rate_increase=DEFAULT_MAX_RATE_INCREASE):
+    """Slice/metric pairs where the candidate is worse than the baseline past a threshold."""
+    regressions = []
+
+    def flag(slice_name, target, metric, old, new):
+        regressions.append({'slice': slice_name, 'target': target, 'metric': metric,
+                            'baseline': old, 'candidate': new, 'n': candidate[slice_name]['n']})
+
+    for slice_name, entry in candidate.items():
+        if entry['n'] < min_rows:
+            continue
+        for target in TARGET_COLUMNS + ['label']:
+            new, old = entry[target], baseline[slice_name][target]
+            for metric, value in new.items():
+                before = old[metric]
+                if value is None or before is None:
+                    continue
+                if metric == 'mae':
+                    worse = value > before * (1 + max_mae_increase) and value - before > 1e-6
+                elif metric == 'r2':
+                    worse = value < before - max_r2_drop
+                else:
+                    worse = value > before + max_rate_increase
+                if worse:
+                    flag(slice_name, target, metric, before, value)
+    return regressions
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def load_holdout(path):
+    """Holdout features and targets, filtered to successful builds like train_model.load_data."""
+    df = pd.read_csv(path)
+    missing = [c for c in FEATURE_COLUMNS + TARGET_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing holdout columns: {missing}")
+    if 'status' in df.columns:
+        df = df[df['status'].isin(['success', 'SUCCESS'])]
+    if not len(df):
+        raise ValueError(f"No usable rows in holdout: {path}")
+    return df[FEATURE_COLUMNS].fillna(0), df[TARGET_COLUMNS].fillna(0).to_numpy(dtype=float)
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Per-slice accuracy gate for model promotion')
+    parser.add_argument('--holdout', required=True, help='Golden holdout CSV (features + targets)')
+    parser.add_argument('--candidate', required=True, help='Model to promote')
+    baseline = parser.add_mutually_exclusive_group()
+    baseline.add_argument('--baseline', default=os.path.join(script_dir, 'model.pkl'),
+                          help='Currently promoted model (default: model.pkl next to this script)')
+    baseline.add_argument('--no-baseline', action='store_true',
+                          help='No model is promoted yet; report the candidate without gating')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--min-rows', type=int, default=DEFAULT_MIN_ROWS)
+    parser.add_argument('--max-mae-increase', type=float, default=DEFAULT_MAX_MAE_INCREASE)
+    parser.add_argument('--max-r2-drop', type=float, default=DEFAULT_MAX_R2_DROP)
+    parser.add_argument('--max-rate-increase', type=float, default=DEFAULT_MAX_RATE_INCREASE)
+    parser.add_argument('--output', help='Write the full JSON report here')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if not args.no_baseline and not os.path.exists(args.baseline):
+        print(f"❌ No promoted model at {args.baseline} (use --no-baseline if there is none yet)",
+              file=sys.stderr)
+        sys.exit(1)
+    try:
+        X, y = load_holdout(args.holdout)
+        rows = X.to_numpy(dtype=float)
+        predictions = {'candidate': route_predict(args.candidate, rows)}
+        if not args.no_baseline:
+            predictions['baseline'] = route_predict(args.baseline, rows)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    names, membership = slice_membership(X)
+    metrics = {name: slice_metrics(names, membership, y, p, args.tolerance) for name, p in predictions.items()}
+
+    regressions = []
+    if 'baseline' in metrics:
+        regressions = find_regressions(metrics['candidate'], metrics['baseline'], args.min_rows,
+                                       args.max_mae_increase, args.max_r2_drop, args.max_rate_increase)
+    else:
+        print("⚠️ --no-baseline: reporting the candidate without gating", file=sys.stderr)
+
+    report = {
+        'holdout_rows': len(X),
+        'slices': len(names),
+        'seconds': round(time.perf_counter() - started, 3),
+        'regressions': regressions,
+        **metrics,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    summary = {key: report[key] for key in ('holdout_rows', 'slices', 'seconds')}
+    summary['overall'] = {name: m['all'] for name, m in metrics.items()}
+    print(json.dumps(summary, indent=2))
+
+    for r in regressions:
+        print(f"❌ {r['slice']} {r['target']} {r['metric']}: {r['baseline']} → {r['candidate']} "
+              f"(n={r['n']})", file=sys.stderr)
+    if regressions:
+        sys.exit(2)
+    print(f"✅ No slice regressions across {len(names)} slices", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
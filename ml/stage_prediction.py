@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Per-Stage Prediction
+====================
+CPU, memory and time for each pipeline stage of a build, from the stage
+model train_model.py --stage-data trains on stage records
+(generate_enhanced_dataset.py --stage-records): one forest over the 27
+build features plus the stage's code.
+
+The stages a build runs come from its pipeline flags (STAGE_FLAGS),
+limited to the stages its project_type had in training (e.g. no separate
+emulator stage for nodejs). Each stage also gets the node label for its
+own memory, so light stages can go to small nodes and only the heavy one
+(usually the emulator) needs a large node.
+
+Total time is reported two ways:
+
+- serial: stage times added up in pipeline order
+- parallel: each run of consecutive test stages (PARALLEL_STAGES) shares
+  parallel_stages lanes, longest stage first; other stages run alone
+
+The evaluation scores the stage model on held-out stage records: MAE per
+stage, label accuracy per stage, and the node memory-minutes a build
+would reserve with per-stage labels instead of one label for the whole
+build.
+
+Usage:
+    python predict.py --model model.pkl --input context.json      # adds "stages"
+    python stage_prediction.py --model model.pkl --data ../resources/stage_records.csv
+"""
+
+import argparse
+import heapq
+import json
+import os
+import sys
+
+import numpy as np
+
+from node_pool import INSTANCES, get_label, label_indices
+
+
+# Stage -> pipeline flag that turns it on, in pipeline order
+# (mirrors PIPELINE_STAGES in resources/generate_enhanced_dataset.py)
+STAGE_FLAGS = {
+    'build': 'has_build_stage',
+    'unit_tests': 'has_unit_tests',
+    'integration': 'has_integration_tests',
+    'e2e': 'has_e2e_tests',
+    'emulator': 'uses_emulator',
+    'docker': 'has_docker_build',
+    'deploy': 'has_deploy_stage',
+}
+
+# Test stages that may run side by side, up to parallel_stages at once
+PARALLEL_STAGES = {'unit_tests', 'integration', 'e2e', 'emulator'}
+
+NODE_MEMORY = np.array([config['memory'] for config in INSTANCES.values()], dtype=float)
+
+
+def load_stage_meta(model_path):
+    """The 'stages' entry of the model's features.json (None without a stage model)."""
+    model_dir = os.path.dirname(os.path.abspath(model_path))
+    try:
+        with open(os.path.join(model_dir, 'features.json')) as f:
+            meta = json.load(f).get('stages')
+    except (FileNotFoundError, ValueError):
+        return None
+    if meta:
+        meta = dict(meta, path=os.path.join(model_dir, meta['path']))
+    return meta
+
+
+# =============================================================================
+# STAGE PLAN
+# =============================================================================
+
+def build_stages(features, meta):
+    """Stages this build runs, in pipeline order."""
+    seen = meta.get('seen', {}).get(str(int(features.get('project_type', 0))), meta['stages'])
+    return [stage for stage, flag in STAGE_FLAGS.items()
+            if features.get(flag, 0) and stage in seen]
+
+
+def stage_matrix(features_list, meta):
+    """One model row per (build, stage): (X, [(build index, stage)])."""
+    build_features = meta['features'][:-1]
+    rows, owners = [], []
+    for i, features in enumerate(features_list):
+        for stage in build_stages(features, meta):
+            rows.append([features.get(col, 0) for col in build_features] + [meta['stages'].index(stage)])
+            owners.append((i, stage))
+    return np.array(rows, dtype=float).reshape(len(rows), len(meta['features'])), owners
+
+
+def lanes_makespan(minutes, lanes):
+    """Finish time of stages packed onto `lanes` parallel lanes, longest first."""
+    if not minutes:
+        return 0.0
+    finish = [0.0] * max(1, min(lanes, len(minutes)))
+    for m in sorted(minutes, reverse=True):
+        heapq.heapreplace(finish, finish[0] + m)
+    return max(finish)
+
+
+def parallel_minutes(stages, minutes, lanes):
+    """Pipeline time when consecutive PARALLEL_STAGES share `lanes` lanes."""
+    total, group = 0.0, []
+    for stage, m in zip(stages, minutes):
+        if stage in PARALLEL_STAGES:
+            group.append(m)
+            continue
+        total += lanes_makespan(group, lanes) + m
+        group = []
+    return total + lanes_makespan(group, lanes)
+
+
+def predict_stages(forest, features_list, meta):
+    """
+    Per-stage predictions for several builds with one forest pass.
+
+    Returns, per build, {'stages': [...], 'stageTotals': {...}}; builds
+    without any known stage get None.
+    """
+    from predict import RESPONSE_TARGETS, format_prediction
+
+    X, owners = stage_matrix(features_list, meta)
+    plans = [[] for _ in features_list]
+    if len(X):
+        for (i, stage), prediction in zip(owners, forest.predict(X)):
+            result = format_prediction(prediction)
+            plans[i].append({'stage': stage, **{key: result[key] for key in RESPONSE_TARGETS},
+                             'label': get_label(result['memoryGb'])})
+
+    out = []
+    for features, plan in zip(features_list, plans):
+        if not plan:
+            out.append(None)
+            continue
+        stages = [entry['stage'] for entry in plan]
+        minutes = [entry['timeMinutes'] for entry in plan]
+        out.append({
+            'stages': plan,
+            'stageTotals': {
+                'serialMinutes': round(sum(minutes), 1),
+                'parallelMinutes': round(parallel_minutes(stages, minutes,
+                                                          features.get('parallel_stages', 1)), 1),
+                'peakMemoryGb': max(entry['memoryGb'] for entry in plan),
+            },
+        })
+    return out
+
+
+# =============================================================================
+# EVALUATION
+# =============================================================================
+
+def evaluate(forest, meta, df):
+    """Stage model vs actual stage records (and per-stage vs whole-build node sizing)."""
+    df = df.copy()
+    df['stage_code'] = df['stage'].map({stage: i for i, stage in enumerate(meta['stages'])})
+    df = df.dropna(subset=['stage_code'])
+    predictions = np.maximum(forest.predict(df[meta['features']].fillna(0).to_numpy(dtype=float)), 0)
+    targets = meta['targets']
+    actual = df[targets].to_numpy(dtype=float)
+
+    memory_col = targets.index('memory_gb')
+    time_col = len(targets) - 1
+    stage_label = label_indices(np.maximum(predictions[:, memory_col], 0.5))
+    true_label = label_indices(actual[:, memory_col])
+    report = {'rows': len(df), 'builds': int(df['build_id'].nunique()), 'stages': {}}
+    stages = df['stage'].to_numpy()
+    for stage in dict.fromkeys(stages):
+        rows = stages == stage
+        report['stages'][stage] = {
+            'rows': int(rows.sum()),
+            **{f'{col}_mae': round(float(np.abs(predictions[rows, k] - actual[rows, k]).mean()), 3)
+               for k, col in enumerate(targets)},
+            'label_accuracy': round(float((stage_label[rows] == true_label[rows]).mean()), 4),
+            'under_provisioned_rate': round(float((NODE_MEMORY[stage_label[rows]]
+                                                   < actual[rows, memory_col]).mean()), 4),
+        }
+
+    # Whole build on the label of its largest predicted stage vs each stage on its own label
+    minutes = actual[:, time_col]
+    stage_gb = NODE_MEMORY[stage_label]
+    build_memory = df.assign(pred=predictions[:, memory_col]).groupby('build_id')['pred'].transform('max')
+    build_gb = NODE_MEMORY[label_indices(np.maximum(build_memory.to_numpy(), 0.5))]
+    whole = float((build_gb * minutes).sum())
+    staged = float((stage_gb * minutes).sum())
+    report['node_gb_minutes'] = {
+        'whole_build_label': round(whole, 1),
+        'per_stage_labels': round(staged, 1),
+        'reduction': round(1 - staged / whole, 4) if whole else 0.0,
+        'stage_minutes_on_smaller_node': round(float(minutes[stage_gb < build_gb].sum()
+                                                     / max(minutes.sum(), 1e-9)), 4),
+    }
+    return report
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    import pandas as pd
+    from forest_arrays import FlatForest
+    import joblib
+
+    parser = argparse.ArgumentParser(description='Evaluate per-stage predictions against stage records')
+    parser.add_argument('--model', required=True, help='Path to trained model.pkl (trained with --stage-data)')
+    parser.add_argument('--data', required=True, help='Stage records CSV (stage_records.csv)')
+    args = parser.parse_args()
+
+    meta = load_stage_meta(args.model)
+    if not meta:
+        print(f"❌ No stage model next to {args.model}; train with train_model.py --stage-data", file=sys.stderr)
+        sys.exit(1)
+    try:
+        forest = FlatForest.from_model(joblib.load(meta['path']))
+        df = pd.read_csv(args.data)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    if 'status' in df.columns:
+        df = df[df['status'].isin(['success', 'SUCCESS'])]
+
+    report = evaluate(forest, meta, df.reset_index(drop=True))
+    print(json.dumps(report, indent=2))
+    sizing = report['node_gb_minutes']
+    print(f"✅ {report['rows']} stage records; per-stage labels reserve {sizing['reduction']:.1%} "
+          f"fewer node GB-minutes than one label per build", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Anytime early stopping judged against the learned memory buffers when configured."""
+
+import json
+
+import numpy as np
+
+import predict
+from forest_arrays import FlatForest
+from predict import FEATURE_COLUMNS
+
+
+def leaf_forest(memory):
+    """One single-leaf tree per memory value (cpu and time fixed)."""
+    n = len(memory)
+    value = np.column_stack([np.ones(n), memory, np.full(n, 10.0)])
+    nodes = np.arange(n, dtype=np.int64)
+    return FlatForest(np.zeros(n, dtype=np.int32), np.full(n, np.inf), nodes, nodes.copy(),
+                      value, nodes.copy(), 0, len(FEATURE_COLUMNS))
+
+
+def anytime(monkeypatch, tmp_path, rows, buffers=None):
+    # Trees alternate 5 and 7 GB: mean 6, standard error ~0.22 after 20 trees.
+    # x1.2 the band stays on 'build' (8 GB); x1.35 it straddles 'build'/'test' until the last step.
+    forest = leaf_forest(np.tile([5.0, 7.0], 50))
+    monkeypatch.setattr(predict, 'load_flat_forest', lambda path: forest)
+    path = None
+    if buffers is not None:
+        path = tmp_path / 'buffers.json'
+        path.write_text(json.dumps({'oom_risk': 0.01, 'default': 1.2, 'buffers': buffers}))
+        path = str(path)
+    monkeypatch.setattr(predict, 'MEMORY_BUFFERS_PATH', path)
+    X = np.zeros((len(rows), len(FEATURE_COLUMNS)))
+    X[:, FEATURE_COLUMNS.index('project_type')] = rows
+    return [fields for _, fields in predict.predict_anytime(X, 'model.pkl', 1000)]
+
+
+def test_default_buffer_stops_early(monkeypatch, tmp_path):
+    for fields in anytime(monkeypatch, tmp_path, [1]) + anytime(monkeypatch, tmp_path, [1, 2]):
+        assert fields['stoppedBy'] == 'stable'
+        assert fields['treesUsed'] == 20
+
+
+def test_learned_buffer_keeps_boundary_rows_going(monkeypatch, tmp_path):
+    buffers = {'1': {'build': 1.35}}
+    single = anytime(monkeypatch, tmp_path, [1], buffers)
+    batch = anytime(monkeypatch, tmp_path, [1, 2], buffers)
+    assert single[0]['stoppedBy'] == 'all' and single[0]['treesUsed'] == 100
+    assert batch[0]['stoppedBy'] == 'all' and batch[0]['treesUsed'] == 100
+    # project_type 2 has no learned entry and falls back to the table default
+    assert batch[1]['stoppedBy'] == 'stable' and batch[1]['treesUsed'] == 20
+
+
+def test_buffer_is_picked_by_the_unbuffered_label(monkeypatch, tmp_path):
+    # 6 GB unbuffered is a 'build' prediction, so a 'test' buffer must not apply
+    fields = anytime(monkeypatch, tmp_path, [1], {'1': {'test': 1.35}})
+    assert fields[0]['stoppedBy'] == 'stable'
@@ -0,0 +1,60 @@
+"""TreeSampler CPU accounting across processes that exit between samples."""
+
+import build_sampler
+from build_sampler import TreeSampler
+
+
+def fake_proc(monkeypatch, snapshots):
+    """Replay /proc snapshots: each is {pid: (cpu seconds, parent pid or None)}."""
+    state = {}
+
+    def process_tree(root):
+        procs = state['procs']
+        if root not in procs:
+            return [(root, None)]
+        tree, stack = [], [(root, procs[root][1] if procs[root][1] in procs else None)]
+        while stack:
+            pid, parent = stack.pop()
+            tree.append((pid, parent))
+            stack.extend((child, pid) for child, (_, p) in procs.items() if p == pid)
+        return tree
+
+    def read_stat(pid):
+        procs = state['procs']
+        return (procs[pid][0], 0) if pid in procs else None
+
+    monkeypatch.setattr(build_sampler, 'process_tree', process_tree)
+    monkeypatch.setattr(build_sampler, 'read_stat', read_stat)
+    sampler = TreeSampler(1)
+    for procs in snapshots:
+        state['procs'] = procs
+        sampler.sample()
+    return sampler
+
+
+def test_parent_and_child_exit_in_one_interval(monkeypatch):
+    # 1 -> 2 -> 3; 3 and 2 both exit and are reaped, so 1's cutime holds all of it
+    sampler = fake_proc(monkeypatch, [
+        {1: (1.0, None), 2: (2.0, 1), 3: (3.0, 2)},
+        {1: (6.0, None)},
+    ])
+    assert sampler.cpu_seconds == 6.0
+
+
+def test_root_exit_credits_last_seen_cpu(monkeypatch):
+    sampler = fake_proc(monkeypatch, [
+        {1: (1.0, None), 2: (2.0, 1)},
+        {},
+    ])
+    assert sampler.cpu_seconds == 3.0
+
+
+def test_orphan_keeps_being_sampled(monkeypatch):
+    # 2 exits without reaping 3, which is reparented to init (pid 99, outside the tree)
+    sampler = fake_proc(monkeypatch, [
+        {1: (1.0, None), 2: (2.0, 1), 3: (3.0, 2)},
+        {1: (3.0, None), 3: (4.0, 99)},
+        {1: (3.0, None), 3: (5.0, 99)},
+        {1: (3.0, None)},
+    ])
+    assert sampler.cpu_seconds == 8.0
@@ -0,0 +1,87 @@
+"""Worker hot reload: caches and drift tracking tied to the old model are dropped."""
+
+import json
+import os
+from types import SimpleNamespace
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+import predict
+from drift_monitor import reference_id
+from predict import FEATURE_COLUMNS
+from prediction_log import PredictionLog
+from prediction_table import build_table, save_table
+from prediction_workers import WorkerHTTPServer, flatten_models, write_segment
+
+
+def fit(path, targets, n_estimators):
+    X = np.zeros((30, len(FEATURE_COLUMNS)))
+    model = RandomForestRegressor(n_estimators=n_estimators, random_state=0)
+    model.fit(X, np.tile(targets, (len(X), 1)))
+    joblib.dump(model, path)
+    return X
+
+
+def publisher(tmp_path, model_path, prediction_log=None):
+    """(publish(gen), worker stand-in for WorkerHTTPServer.refresh)."""
+    segments = {}
+
+    def publish(gen):
+        segments[gen] = str(tmp_path / f'segment-{gen}')
+        write_segment(segments[gen], *flatten_models(model_path))
+        worker.generation.value = gen
+
+    worker = SimpleNamespace(model_path=model_path, generation=SimpleNamespace(value=0),
+                             segment_path=lambda gen: segments[gen], prediction_log=prediction_log,
+                             attached=0)
+    return publish, worker
+
+
+def test_reload_drops_table_built_for_old_model(monkeypatch, tmp_path):
+    model_path = str(tmp_path / 'model.pkl')
+    table_path = str(tmp_path / 'table.npz')
+    X = fit(model_path, [10.0, 4.0, 20.0], 2)
+    save_table(build_table(model_path, X), table_path)
+    monkeypatch.setattr(predict, 'PREDICTION_TABLE_PATH', table_path)
+
+    publish, worker = publisher(tmp_path, model_path)
+    publish(1)
+    WorkerHTTPServer.refresh(worker)
+    assert np.allclose(predict.table_lookup(model_path, X[0]), [10.0, 4.0, 20.0])
+
+    # Retrain in place: a new file identity, so the old table no longer applies
+    fit(model_path, [50.0, 12.0, 60.0], 3)
+    os.utime(model_path, ns=(1, 1))
+    publish(2)
+    WorkerHTTPServer.refresh(worker)
+    assert predict.table_lookup(model_path, X[0]) is None
+    assert np.allclose(predict.load_model(model_path).predict(X[:1]), [[50.0, 12.0, 60.0]])
+
+
+def test_reload_switches_drift_reference(tmp_path):
+    model_path = str(tmp_path / 'model.pkl')
+    manifest = tmp_path / 'features.json'
+    fit(model_path, [10.0, 4.0, 20.0], 2)
+    old = {'features': {'project_type': {'edges': [0.5, 1.5]}}}
+    new = {'features': {'project_type': {'edges': [2.5]}}}
+    log = PredictionLog(str(tmp_path / 'log.db'))
+    publish, worker = publisher(tmp_path, model_path, log)
+    result = {'cpu': 1.0, 'memoryGb': 2.0, 'timeMinutes': 3.0}
+
+    manifest.write_text(json.dumps({'drift_reference': old}))
+    publish(1)
+    WorkerHTTPServer.refresh(worker)
+    log.log_prediction('b1', {'project_type': 1}, result)
+
+    # Retrain: features.json now carries new bin edges
+    manifest.write_text(json.dumps({'drift_reference': new}))
+    publish(2)
+    WorkerHTTPServer.refresh(worker)
+    log.log_prediction('b2', {'project_type': 3}, result)
+    log.flush()
+
+    assert log.drift_counts(reference_id(old)) == {'project_type': {1: 1}}
+    assert log.drift_counts(reference_id(new)) == {'project_type': {1: 1}}
+    log.close()
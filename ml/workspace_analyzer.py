@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Workspace Analyzer
+==================
+Fast Python replacement for PipelineAnalyzer's workspace scans
+(repoSizeMb, dependencyCount, isMonorepo, projectType, cacheAvailable).
+
+PipelineAnalyzer sizes the workspace with a recursive PowerShell / du
+listing and reads each manifest separately; on multi-GB Android and
+monorepo workspaces the sizing dominates. Here:
+- the tree is walked with os.scandir, one directory level at a time across
+  a thread pool (scandir/stat release the GIL)
+- per-directory results (own file bytes, subdirectories, manifests) are
+  cached keyed on the directory's mtime. Adding, removing or renaming an
+  entry (which is how git checkout writes files) changes the mtime, so an
+  unchanged directory costs one stat on repeat builds instead of a stat
+  per file. In-place edits that keep the entry are not seen until the
+  directory changes; --no-cache forces a full rescan.
+- root manifests are read once each and parsed in a single pass
+
+The output keys and values match PipelineAnalyzer's context (the training
+features come from it), so the JSON can be merged into ml_input.json:
+- repoSizeMb counts every file, build outputs and caches included, as
+  `Get-ChildItem -Recurse -File` does; only VCS metadata is skipped
+  (Get-ChildItem leaves out the hidden .git directory)
+- dependencyCount applies countDependencies' own patterns, including its
+  quirks (only build.gradle is read; setup.py counts every quoted name once
+  install_requires appears; Podfile counts `pod '`)
+
+Usage:
+    python workspace_analyzer.py --workspace . --output ml_input.json
+    python workspace_analyzer.py --workspace /var/jenkins/ws/app --workers 16 --no-cache
+    python workspace_analyzer.py --benchmark 200000
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 4) * 4)
+CACHE_VERSION = 1
+CACHE_FILENAME = 'ml-workspace-cache.json'
+
+# Never descended into: VCS metadata (hidden, so Get-ChildItem skips it too)
+SKIP_DIRS = frozenset(['.git', '.hg', '.svn'])
+
+# Files whose presence or content PipelineAnalyzer inspects
+MANIFESTS = frozenset([
+    'package.json', 'pom.xml', 'build.gradle', 'build.gradle.kts',
+    'requirements.txt', 'setup.py', 'pyproject.toml', 'Podfile',
+    'lerna.json', 'pnpm-workspace.yaml', 'AndroidManifest.xml',
+])
+
+# PipelineAnalyzer.countDependencies' patterns
+GRADLE_DEPENDENCY_RE = re.compile(r'implementation |compile |api |testImplementation ')
+QUOTED_RE = re.compile(r'[\'"][a-zA-Z]')
+POD_RE = re.compile(r"pod '")
+
+
+# =============================================================================
+# TREE WALK
+# =============================================================================
+
+def scan_directory(path):
+    """(mtime_ns, own file bytes, subdirectory names, manifest names) for one directory."""
+    own_bytes = 0
+    subdirs, manifests = [], []
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIP_DIRS:
+                            subdirs.append(entry.name)
+                    else:
+                        own_bytes += entry.stat(follow_symlinks=False).st_size
+                        if entry.name in MANIFESTS:
+                            manifests.append(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        return None
+    return [mtime_ns, own_bytes, subdirs, manifests]
+
+
+class WorkspaceWalker:
+    """Parallel, mtime-cached directory sizing over one workspace."""
+
+    def __init__(self, root, workers=DEFAULT_WORKERS, cache=None):
+        self.root = os.path.abspath(root)
+        self.workers = workers
+        self.cache = cache if cache is not None else {}
+        self.rescanned = 0
+        self.reused = 0
+
+    def _visit(self, rel):
+        path = os.path.join(self.root, rel) if rel else self.root
+        cached = self.cache.get(rel)
+        if cached is not None:
+            try:
+                if os.stat(path).st_mtime_ns == cached[0]:
+                    return rel, cached, False
+            except OSError:
+                return rel, None, False
+        return rel, scan_directory(path), True
+
+    def walk(self):
+        """Scan the tree; returns {relative dir: [mtime_ns, bytes, subdirs, manifests]}."""
+        result = {}
+        level = ['']
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while level:
+                next_level = []
+                visits = pool.map(self._visit, level, chunksize=64) if len(level) > 1 else [self._visit(level[0])]
+                for rel, info, rescanned in visits:
+                    if info is None:
+                        continue
+                    result[rel] = info
+                    if rescanned:
+                        self.rescanned += 1
+                    else:
+                        self.reused += 1
+                    next_level.extend(os.path.join(rel, name) if rel else name for name in info[2])
+                level = next_level
+        # Directories that disappeared drop out of the cache with the new result
+        self.cache = result
+        return result
+
+
+# =============================================================================
+# MANIFEST PARSERS
+# =============================================================================
+
+def read_text(path):
+    try:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except OSError:
+        return ''
+
+
+def parse_package_json(path):
+    """(dependency count, has react-native, has workspaces) from one read."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            pkg = json.load(f)
+    except (OSError, ValueError):
+        return 0, False, False
+    deps = pkg.get('dependencies') or {}
+    dev = pkg.get('devDependencies') or {}
+    return len(deps) + len(dev), 'react-native' in deps or 'react-native' in dev, bool(pkg.get('workspaces'))
+
+
+def count_requirements(text):
+    # Indented comments and option lines (-r, -e) count, as in the Groovy
+    return sum(1 for line in text.split('\n') if line.strip() and not line.startswith('#'))
+
+
+def count_setup_py(text):
+    return len(QUOTED_RE.findall(text)) if 'install_requires' in text else 0
+
+
+def count_dependencies(root, project_type, root_manifests, package_info):
+    """Same per-project-type rules as PipelineAnalyzer.countDependencies."""
+    def path(name):
+        return os.path.join(root, name)
+
+    if project_type in ('nodejs', 'react-native'):
+        return package_info[0] if package_info else 0
+    if project_type == 'python':
+        if 'requirements.txt' in root_manifests:
+            return count_requirements(read_text(path('requirements.txt')))
+        if 'setup.py' in root_manifests:
+            return count_setup_py(read_text(path('setup.py')))
+        return 0
+    if project_type in ('java', 'android'):
+        if 'pom.xml' in root_manifests:
+            return read_text(path('pom.xml')).count('<dependency>')
+        if 'build.gradle' in root_manifests:
+            return len(GRADLE_DEPENDENCY_RE.findall(read_text(path('build.gradle'))))
+        return 0
+    if project_type == 'ios' and 'Podfile' in root_manifests:
+        return len(POD_RE.findall(read_text(path('Podfile'))))
+    return 0
+
+
+def detect_project_type(root, root_entries, root_manifests, package_info):
+    """PipelineAnalyzer.detectProjectType over the already-scanned root."""
+    if package_info is not None:
+        if 'android' in root_entries or 'ios' in root_entries or package_info[1]:
+            return 'react-native'
+        return 'nodejs'
+    if 'build.gradle' in root_manifests or 'build.gradle.kts' in root_manifests:
+        if 'android' in root_entries or 'AndroidManifest.xml' in root_manifests:
+            return 'android'
+        if 'com.android' in read_text(os.path.join(root, 'build.gradle')):
+            return 'android'
+        return 'java'
+    if 'pom.xml' in root_manifests:
+        return 'java'
+    if 'Podfile' in root_manifests or any(e.endswith(('.xcodeproj', '.xcworkspace')) for e in root_entries):
+        return 'ios'
+    return 'python'
+
+
+def detect_cache(root_entries, project_type):
+    """PipelineAnalyzer.checkCacheState's directory checks."""
+    markers = {
+        'nodejs': ['node_modules'], 'react-native': ['node_modules'],
+        'python': ['.venv', '__pycache__'],
+        'java': ['.gradle', 'build'], 'android': ['.gradle', 'build'],
+        'ios': ['Pods'],
+    }.get(project_type, [])
+    return int(any(m in root_entries for m in markers + ['.cache']) or os.environ.get('CACHE_HIT') == 'true')
+
+
+# =============================================================================
+# ANALYSIS
+# =============================================================================
+
+def default_cache_path(root):
+    """Inside .git when there is one (never sized); else the user cache dir."""
+    git_dir = os.path.join(root, '.git')
+    if os.path.isdir(git_dir):
+        return os.path.join(git_dir, CACHE_FILENAME)
+    digest = hashlib.sha1(os.path.abspath(root).encode()).hexdigest()[:16]
+    return os.path.join(os.path.expanduser('~'), '.cache', 'ml-node-selector', f'workspace-{digest}.json')
+
+
+def load_cache(path, root):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if data.get('version') != CACHE_VERSION or data.get('root') != os.path.abspath(root):
+        return {}
+    return data['dirs']
+
+
+def save_cache(path, root, dirs):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'root': os.path.abspath(root), 'dirs': dirs}, f,
+                      separators=(',', ':'))
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"⚠️ Could not save workspace cache: {e}", file=sys.stderr)
+
+
+def analyze(root='.', workers=DEFAULT_WORKERS, cache_path=None, use_cache=True):
+    """Workspace context keys, as PipelineAnalyzer emits them."""
+    started = time.perf_counter()
+    root = os.path.abspath(root)
+    cache_path = cache_path or default_cache_path(root)
+    walker = WorkspaceWalker(root, workers, load_cache(cache_path, root) if use_cache else {})
+    dirs = walker.walk()
+    if use_cache:
+        save_cache(cache_path, root, dirs)
+
+    total_bytes = sum(info[1] for info in dirs.values())
+    package_jsons = sum(info[3].count('package.json') for info in dirs.values())
+
+    root_info = dirs.get('', [0, 0, [], []])
+    root_manifests = set(root_info[3])
+    try:
+        root_entries = set(os.listdir(root))
+    except OSError:
+        root_entries = set()
+
+    package_info = parse_package_json(os.path.join(root, 'package.json')) if 'package.json' in root_manifests else None
+    project_type = detect_project_type(root, root_entries, root_manifests, package_info)
+    is_monorepo = int(bool(root_manifests & {'lerna.json', 'pnpm-workspace.yaml'})
+                      or (package_info is not None and package_info[2])
+                      or package_jsons > 2)
+
+    return {
+        'projectType': project_type,
+        'repoSizeMb': int(total_bytes / 1024 ** 2 + 0.5),     # Math.round
+        'isMonorepo': is_monorepo,
+        'dependencyCount': count_dependencies(root, project_type, root_manifests, package_info),
+        'cacheAvailable': detect_cache(root_entries, project_type),
+        'workspaceDetails': {
+            'directories': len(dirs),
+            'rescanned': walker.rescanned,
+            'reused': walker.reused,
+            'packageJsonFiles': package_jsons,
+            'elapsedMs': round((time.perf_counter() - started) * 1000, 1),
+        },
+    }
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+def make_synthetic_tree(root, n_files, files_per_dir=20, fanout=8):
+    """An Android-like monorepo: nested modules, many small files, VCS metadata to skip."""
+    with open(os.path.join(root, 'settings.gradle'), 'w') as f:
+        f.write("include ':app'\n")
+    with open(os.path.join(root, 'build.gradle'), 'w') as f:
+        f.write("apply plugin: 'com.android.application'\ndependencies {\n"
+                + ''.join(f"    implementation 'lib:dep{i}:1.0'\n" for i in range(40)) + '}\n')
+    os.makedirs(os.path.join(root, '.git', 'objects'))
+    os.makedirs(os.path.join(root, 'build', 'intermediates'))
+
+    dirs = ['']
+    created = 0
+    next_dir = 0
+    payload = b'x' * 2048
+    while created < n_files:
+        parent = dirs[next_dir % len(dirs)]
+        next_dir += 1
+        for _ in range(fanout):
+            name = f'module{len(dirs)}'
+            rel = os.path.join(parent, name) if parent else name
+            os.makedirs(os.path.join(root, rel), exist_ok=True)
+            dirs.append(rel)
+            for k in range(files_per_dir):
+                with open(os.path.join(root, rel, f'F{k}.kt'), 'wb') as f:
+                    f.write(payload)
+            created += files_per_dir
+            if created >= n_files:
+                break
+    return dirs
+
+
+def benchmark(n_files, workers):
+    root = tempfile.mkdtemp(prefix='workspace-bench-')
+    cache_path = os.path.join(root, '.git', CACHE_FILENAME)
+    try:
+        started = time.perf_counter()
+        dirs = make_synthetic_tree(root, n_files)
+        setup_s = time.perf_counter() - started
+
+        def timed(**kwargs):
+            started = time.perf_counter()
+            result = analyze(root, cache_path=cache_path, **kwargs)
+            return result, round(time.perf_counter() - started, 3)
+
+        _, serial_s = timed(workers=1, use_cache=False)
+        result, cold_s = timed(workers=workers, use_cache=True)
+        _, warm_s = timed(workers=workers, use_cache=True)
+
+        # A checkout touching a few directories
+        for rel in dirs[1::len(dirs) // 10][:10]:
+            with open(os.path.join(root, rel, 'New.kt'), 'w') as f:
+                f.write('changed')
+        changed, changed_s = timed(workers=workers, use_cache=True)
+
+        started = time.perf_counter()
+        subprocess.run(['du', '-sm', root], capture_output=True)
+        du_s = round(time.perf_counter() - started, 3)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        'files': n_files,
+        'directories': len(dirs),
+        'workers': workers,
+        'context': {k: v for k, v in result.items() if k != 'workspaceDetails'},
+        'setup_s': round(setup_s, 1),
+        'serial_s': serial_s,
+        'parallel_cold_s': cold_s,
+        'warm_cached_s': warm_s,
+        'after_change_s': changed_s,
+        'after_change_rescanned': changed['workspaceDetails']['rescanned'],
+        'du_s': du_s,
+    }
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Workspace size / dependency analysis for predict.py')
+    parser.add_argument('--workspace', default='.', help='Workspace root')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--cache', help='Per-directory cache file (default: inside .git or ~/.cache)')
+    parser.add_argument('--no-cache', action='store_true', help='Full rescan; do not read or write the cache')
+    parser.add_argument('--output', help='Write the JSON here (merged into it if the file exists)')
+    parser.add_argument('--benchmark', type=int, metavar='FILES', help='Time analysis of a synthetic tree')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.benchmark, args.workers), indent=2))
+        return
+
+    if not os.path.isdir(args.workspace):
+        print(json.dumps({'error': f'Not a directory: {args.workspace}'}), file=sys.stderr)
+        sys.exit(1)
+
+    context = analyze(args.workspace, args.workers, args.cache, use_cache=not args.no_cache)
+    if args.output:
+        merged = {}
+        if os.path.exists(args.output):
+            with open(args.output) as f:
+                merged = json.load(f)
+        merged.update(context)
+        with open(args.output, 'w') as f:
+            json.dump(merged, f, indent=2)
+    print(json.dumps(context, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Training Data Compaction
+========================
+Bounds retraining cost as real build rows accumulate. Most new rows are
+near-repeats of the same pipeline (same project, stages and cache state,
+a similar diff), so:
+
+1. Age downsampling: rows older than --keep-days (relative to the newest
+   row) are kept with probability 0.5 ** (extra age / --half-life-days),
+   never below --min-keep. Recent behaviour dominates; old history thins out.
+2. Quantize: binary/categorical features are kept exact, counts and sizes
+   go into log buckets (--resolution buckets per doubling), the changed
+   source fraction into tenths, the hour into 3-hour blocks.
+3. Hash each quantized row and merge rows with the same hash into one
+   representative: the weighted mean of the raw features, the mean (or
+   median) of the targets, and sample_weight = the number of builds merged.
+
+A compacted file can be compacted again together with new rows; existing
+sample_weight values are carried over. train_model.py uses sample_weight as
+the fit weight.
+
+--compare splits the successful rows 80/20 first, compacts only the 80%,
+trains the same forest on both versions and scores both on the untouched
+20%, reporting the row reduction, fit speedup and accuracy change.
+
+Usage:
+    python compact_training_data.py --input enhanced_training_data.csv --output compacted.csv
+    python compact_training_data.py --input enhanced_training_data.csv --output compacted.csv --compare
+    python train_model.py --data-path compacted.csv --model-path ../ml
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import train_test_split
+
+from train_model import FEATURE_COLUMNS, TARGET_COLUMNS, WEIGHT_COLUMN, create_model
+
+
+DEFAULT_RESOLUTION = 4          # log buckets per doubling (~19% wide)
+DEFAULT_KEEP_DAYS = 90
+DEFAULT_HALF_LIFE_DAYS = 90
+DEFAULT_MIN_KEEP = 0.1
+SEED = 42
+
+# Quantization per continuous feature; every other feature is matched exactly
+LOG_FEATURES = ['repo_size_mb', 'files_changed', 'lines_added', 'lines_deleted',
+                'dependency_count', 'test_files_changed']
+FRACTION_FEATURES = ['source_files_pct']
+HOUR_BLOCK = 3
+
+
+# =============================================================================
+# COMPACTION
+# =============================================================================
+
+def successful_rows(df):
+    """Rows train_model.load_data would keep, with a sample_weight column."""
+    missing = [c for c in FEATURE_COLUMNS + TARGET_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+    if 'status' in df.columns:
+        df = df[df['status'].isin(['success', 'SUCCESS'])]
+    df = df.copy()
+    df[FEATURE_COLUMNS + TARGET_COLUMNS] = df[FEATURE_COLUMNS + TARGET_COLUMNS].fillna(0)
+    if WEIGHT_COLUMN in df.columns:
+        df[WEIGHT_COLUMN] = df[WEIGHT_COLUMN].fillna(1)
+    else:
+        df[WEIGHT_COLUMN] = 1.0
+    return df
+
+
+def age_downsample(df, keep_days=DEFAULT_KEEP_DAYS, half_life_days=DEFAULT_HALF_LIFE_DAYS,
+                   min_keep=DEFAULT_MIN_KEEP, seed=SEED):
+    """Drop old rows at random, keeping 0.5 ** (age past keep_days / half_life) of them."""
+    if 'timestamp' not in df.columns or half_life_days <= 0:
+        return df
+    stamps = pd.to_datetime(df['timestamp'], errors='coerce')
+    age_days = ((stamps.max() - stamps).dt.total_seconds() / 86400).fillna(0).to_numpy()
+    keep_prob = np.maximum(min_keep, 0.5 ** (np.maximum(age_days - keep_days, 0) / half_life_days))
+    rng = np.random.default_rng(seed)
+    return df[rng.random(len(df)) < keep_prob]
+
+
+def quantize(df, resolution=DEFAULT_RESOLUTION):
+    """Integer bucket per feature; rows with equal buckets are treated as repeats."""
+    q = pd.DataFrame(index=df.index)
+    for col in FEATURE_COLUMNS:
+        values = df[col].to_numpy(dtype=float)
+        if col in LOG_FEATURES:
+            q[col] = np.floor(np.log2(1 + np.maximum(values, 0)) * resolution).astype(np.int64)
+        elif col in FRACTION_FEATURES:
+            q[col] = np.floor(values * 10).astype(np.int64)
+        elif col == 'time_of_day_hour':
+            q[col] = (values // HOUR_BLOCK).astype(np.int64)
+        else:
+            q[col] = np.round(values).astype(np.int64)
+    return q
+
+
+def compact(df, resolution=DEFAULT_RESOLUTION, targets='mean'):
+    """
+    Merge rows with the same quantized-feature hash into weighted representatives.
+
+    Features are weight-averaged within each group; targets use the weighted
+    mean or the plain median; sample_weight is the group's total weight.
+    """
+    keys = pd.util.hash_pandas_object(quantize(df, resolution), index=False).to_numpy()
+    weights = df[WEIGHT_COLUMN].to_numpy(dtype=float)
+
+    weighted = df[FEATURE_COLUMNS + TARGET_COLUMNS].mul(weights, axis=0)
+    weighted[WEIGHT_COLUMN] = weights
+    grouped = weighted.groupby(keys, sort=False).sum()
+    total = grouped[WEIGHT_COLUMN]
+    out = grouped[FEATURE_COLUMNS + TARGET_COLUMNS].div(total, axis=0)
+    if targets == 'median':
+        out[TARGET_COLUMNS] = df[TARGET_COLUMNS].groupby(keys, sort=False).median()
+
+    # Exact-match features are constant within a group; keep them integral
+    exact = [c for c in FEATURE_COLUMNS if c not in LOG_FEATURES + FRACTION_FEATURES
+             and pd.api.types.is_integer_dtype(df[c])]
+    out[exact] = out[exact].round().astype(np.int64)
+    out[WEIGHT_COLUMN] = total
+    if 'timestamp' in df.columns:
+        out['timestamp'] = df['timestamp'].groupby(keys, sort=False).max()
+    out['status'] = 'success'
+    return out.reset_index(drop=True)
+
+
+def compact_dataset(df, resolution=DEFAULT_RESOLUTION, targets='mean', keep_days=DEFAULT_KEEP_DAYS,
+                    half_life_days=DEFAULT_HALF_LIFE_DAYS, min_keep=DEFAULT_MIN_KEEP):
+    """Successful rows → age-downsampled → merged. Returns (compacted, stats)."""
+    rows = successful_rows(df)
+    recent = age_downsample(rows, keep_days, half_life_days, min_keep)
+    out = compact(recent, resolution, targets)
+    stats = {
+        'input_rows': len(df),
+        'successful_rows': len(rows),
+        'after_age_downsampling': len(recent),
+        'output_rows': len(out),
+        'represented_builds': round(float(out[WEIGHT_COLUMN].sum()), 1),
+        'row_reduction': round(1 - len(out) / max(len(rows), 1), 4),
+    }
+    return out, stats
+
+
+# =============================================================================
+# COMPARISON
+# =============================================================================
+
+def fit_and_score(train, test):
+    """Fit the train_model.py forest on one training frame; seconds and test metrics."""
+    model = create_model()
+    started = time.perf_counter()
+    model.fit(train[FEATURE_COLUMNS], train[TARGET_COLUMNS],
+              sample_weight=train[WEIGHT_COLUMN].to_numpy(dtype=float))
+    fit_s = time.perf_counter() - started
+    predictions = model.predict(test[FEATURE_COLUMNS])
+    y = test[TARGET_COLUMNS].to_numpy(dtype=float)
+    metrics = {'fit_seconds': round(fit_s, 3), 'rows': len(train),
+               'r2': round(float(r2_score(y, predictions)), 4)}
+    for k, target in enumerate(TARGET_COLUMNS):
+        metrics[f'{target}_mae'] = round(float(mean_absolute_error(y[:, k], predictions[:, k])), 4)
+    return metrics
+
+
+def compare(df, **options):
+    """Original vs compacted training on a shared untouched 20% test split."""
+    rows = successful_rows(df)
+    train, test = train_test_split(rows, test_size=0.2, random_state=SEED)
+    compacted, stats = compact_dataset(train, **options)
+    original = fit_and_score(train, test)
+    reduced = fit_and_score(compacted, test)
+    return {
+        'test_rows': len(test),
+        'compaction': stats,
+        'original': original,
+        'compacted': reduced,
+        'fit_speedup': round(original['fit_seconds'] / max(reduced['fit_seconds'], 1e-9), 2),
+        'r2_change': round(reduced['r2'] - original['r2'], 4),
+    }
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Deduplicate and compact build training data')
+    parser.add_argument('--input', required=True, help='Training CSV (raw or previously compacted)')
+    parser.add_argument('--output', required=True, help='Compacted CSV with a sample_weight column')
+    parser.add_argument('--resolution', type=float, default=DEFAULT_RESOLUTION,
+                        help='Log buckets per doubling for counts and sizes (higher = finer)')
+    parser.add_argument('--targets', choices=['mean', 'median'], default='mean',
+                        help='How merged rows combine their targets')
+    parser.add_argument('--keep-days', type=float, default=DEFAULT_KEEP_DAYS,
+                        help='Rows newer than this are never age-downsampled')
+    parser.add_argument('--half-life-days', type=float, default=DEFAULT_HALF_LIFE_DAYS,
+                        help='Keep probability halves every this many days past --keep-days (0 = off)')
+    parser.add_argument('--min-keep', type=float, default=DEFAULT_MIN_KEEP)
+    parser.add_argument('--compare', action='store_true',
+                        help='Also train on original vs compacted data and report speedup and accuracy')
+    args = parser.parse_args()
+
+    options = dict(resolution=args.resolution, targets=args.targets, keep_days=args.keep_days,
+                   half_life_days=args.half_life_days, min_keep=args.min_keep)
+    try:
+        df = pd.read_csv(args.input)
+        compacted, stats = compact_dataset(df, **options)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    tmp = f'{args.output}.tmp'
+    compacted.to_csv(tmp, index=False)
+    os.replace(tmp, args.output)
+
+    report = {'compaction': stats}
+    if args.compare:
+        report['comparison'] = compare(df, **options)
+    print(json.dumps(report, indent=2))
+    print(f"✅ {stats['successful_rows']} → {stats['output_rows']} rows "
+          f"({stats['row_reduction']:.1%} fewer): {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,12 +11,16 @@ Author: ML-Node-Selector Team
 Based on: AI-Driven CI/CD Pipeline Logs Dataset (Kaggle)
 """
 
+import argparse
+from contextlib import nullcontext
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import random
 import hashlib
+import json
 import os
+import re
 
 # Set random seed for reproducibility
 np.random.seed(42)
@@ -96,6 +100,20 @@ RESOURCE_PROFILES = {
     },
 }
 
+# Stage records (--stage-records): the stages a build runs, in pipeline order, as
+# (stage, RESOURCE_PROFILES key, pipeline flag). A stage whose profile the project
+# type lacks is not run, as in calculate_resources(); deploy uses DEPLOY_PROFILE.
+PIPELINE_STAGES = [
+    ('build', 'base', 'has_build_stage'),
+    ('unit_tests', 'unit_tests', 'has_unit_tests'),
+    ('integration', 'integration', 'has_integration_tests'),
+    ('e2e', 'e2e', 'has_e2e_tests'),
+    ('emulator', 'emulator', 'uses_emulator'),
+    ('docker', 'docker', 'has_docker_build'),
+    ('deploy', 'deploy', 'has_deploy_stage'),
+]
+DEPLOY_PROFILE = {'memory_gb': (0.5, 2), 'cpu_pct': (10, 35), 'time_min': (2, 10)}
+
 # Git metrics ranges by project type (realistic based on typical repos)
 GIT_METRICS = {
     'python': {'files': (1, 40), 'lines_add': (5, 800), 'deps': 50},
@@ -106,6 +124,14 @@ GIT_METRICS = {
     'ios': {'files': (1, 60), 'lines_add': (10, 1200), 'deps': 60},
 }
 
+# Build arrival weights by hour of day
+# More builds during work hours (9-18), fewer at night
+HOUR_WEIGHTS = [0.01, 0.01, 0.01, 0.01, 0.02, 0.02, 0.03, 0.05,  # 0-7
+                0.08, 0.10, 0.10, 0.10, 0.08, 0.10, 0.10, 0.08,  # 8-15
+                0.05, 0.03, 0.02, 0.01, 0.01, 0.01, 0.01, 0.01]  # 16-23
+# Normalize to ensure sum = 1
+HOUR_WEIGHTS = [w / sum(HOUR_WEIGHTS) for w in HOUR_WEIGHTS]
+
 REPO_SIZES = {
     'python': (10, 500),      # MB
     'java': (50, 2000),
@@ -148,6 +174,133 @@ def extract_pipeline_patterns(kaggle_df):
     return patterns
 
 
+# Only these columns are needed for pattern extraction; everything else
+# (messages, commit ids, users) is never parsed.
+PATTERN_COLUMNS = ['stage_name', 'job_name', 'task_name', 'status', 'environment', 'branch']
+
+# Rows read per chunk when streaming large log files
+LOG_CHUNK_SIZE = 200_000
+
+MAX_BRANCH_SUFFIXES = 20
+
+BRANCH_SUFFIX_RE = re.compile(r'(branch_)(\w+)')
+
+PATTERN_CACHE_VERSION = 1
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Hash a file's contents in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stream_pipeline_patterns(kaggle_path, chunk_size=LOG_CHUNK_SIZE):
+    """
+    Extract the same patterns as extract_pipeline_patterns() in one chunked pass.
+    
+    Reads only PATTERN_COLUMNS as categoricals, so per-chunk unique() and
+    value_counts() work on small integer codes, and the branch regex runs
+    once per distinct branch name instead of once per row. Memory is bounded
+    by chunk_size plus the (small) set of distinct values.
+    """
+    stages, jobs, tasks, environments, branches = {}, {}, {}, {}, {}
+    status_counts = {}
+    total = 0
+    
+    reader = pd.read_csv(
+        kaggle_path,
+        usecols=PATTERN_COLUMNS,
+        dtype={col: 'category' for col in PATTERN_COLUMNS},
+        chunksize=chunk_size,
+    )
+    for chunk in reader:
+        # dicts keep first-appearance order, matching Series.unique()
+        for seen, col in ((stages, 'stage_name'), (jobs, 'job_name'), (tasks, 'task_name')):
+            seen.update(dict.fromkeys(chunk[col].unique().tolist()))
+        environments.update(dict.fromkeys(chunk['environment'].dropna().unique().tolist()))
+        
+        for status, n in chunk['status'].value_counts(sort=False).items():
+            status_counts[status] = status_counts.get(status, 0) + int(n)
+        total += int(chunk['status'].notna().sum())
+        
+        if len(branches) < MAX_BRANCH_SUFFIXES:
+            for branch in chunk['branch'].dropna().unique().tolist():
+                match = BRANCH_SUFFIX_RE.search(branch)
+                if match:
+                    branches.setdefault(match.group(2), None)
+                    if len(branches) == MAX_BRANCH_SUFFIXES:
+                        break
+    
+    # Most frequent first, like value_counts(normalize=True)
+    status_rates = {
+        status: n / total
+        for status, n in sorted(status_counts.items(), key=lambda x: -x[1])
+        if n > 0
+    }
+    return {
+        'stages': list(stages),
+        'jobs': list(jobs),
+        'tasks': list(tasks),
+        'status_rates': status_rates,
+        'environments': list(environments),
+        'branches': list(branches),
+    }
+
+
+def load_pipeline_patterns(kaggle_path, cache_dir=None, refresh=False):
+    """
+    Return pipeline patterns for a log file, using a cache keyed by its hash.
+    
+    The summary is stored as <cache_dir>/<sha256>.json. A small index of
+    (size, mtime) -> sha256 lets unchanged files skip re-hashing, so repeat
+    runs cost one stat() and one small JSON read.
+    """
+    if not kaggle_path or not os.path.exists(kaggle_path):
+        print(f"⚠️ Kaggle file not found at {kaggle_path}, using synthetic patterns")
+        return None
+    
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(kaggle_path)), '.pattern_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, 'index.json')
+    
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        index = {}
+    
+    stat = os.stat(kaggle_path)
+    key = os.path.abspath(kaggle_path)
+    entry = index.get(key)
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        file_hash = entry['sha256']
+    else:
+        file_hash = file_sha256(kaggle_path)
+        index[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_hash}
+        with open(index_path, 'w') as f:
+            json.dump(index, f, indent=2)
+    
+    summary_path = os.path.join(cache_dir, f'{file_hash}.json')
+    if not refresh and os.path.exists(summary_path):
+        with open(summary_path) as f:
+            cached = json.load(f)
+        if cached.get('version') == PATTERN_CACHE_VERSION:
+            patterns = cached['patterns']
+            print(f"✅ Loaded cached patterns ({file_hash[:12]}): "
+                  f"{len(patterns['stages'])} stages, {len(patterns['jobs'])} jobs")
+            return patterns
+    
+    patterns = stream_pipeline_patterns(kaggle_path)
+    with open(summary_path, 'w') as f:
+        json.dump({'version': PATTERN_CACHE_VERSION, 'source': key, 'patterns': patterns}, f, indent=2)
+    print(f"✅ Extracted patterns: {len(patterns['stages'])} stages, {len(patterns['jobs'])} jobs "
+          f"(cached as {file_hash[:12]})")
+    return patterns
+
+
 # =============================================================================
 # DATA GENERATION
 # =============================================================================
@@ -447,13 +600,7 @@ def generate_single_record(record_id, base_timestamp, kaggle_patterns=None):
         status = np.random.choice(['success', 'failed'], p=[0.88, 0.12])
     
     # Build timestamp with realistic hour distribution
-    # More builds during work hours (9-18), fewer at night
-    hour_weights = [0.01, 0.01, 0.01, 0.01, 0.02, 0.02, 0.03, 0.05,  # 0-7
-                    0.08, 0.10, 0.10, 0.10, 0.08, 0.10, 0.10, 0.08,  # 8-15
-                    0.05, 0.03, 0.02, 0.01, 0.01, 0.01, 0.01, 0.01]  # 16-23
-    # Normalize to ensure sum = 1
-    hour_weights = [w / sum(hour_weights) for w in hour_weights]
-    hour = np.random.choice(24, p=hour_weights)
+    hour = np.random.choice(24, p=HOUR_WEIGHTS)
     timestamp = base_timestamp + timedelta(
         hours=hour,
         minutes=random.randint(0, 59)
@@ -500,100 +647,319 @@ def generate_single_record(record_id, base_timestamp, kaggle_patterns=None):
     }
 
 
-def generate_dataset(num_records=1000, kaggle_path=None):
-    """Generate the complete enhanced training dataset."""
+def generate_stage_records(record):
+    """
+    Split one build record into per-stage records.
+    
+    Each stage draws memory, CPU and time from its RESOURCE_PROFILES range,
+    then the draws are scaled to agree with the build's own targets: the
+    largest stage memory is the build's peak memory, stage times add up to
+    the build time, and the time-weighted CPU is the build's average CPU.
+    Draws come from a per-record stream seeded by the commit id, so the
+    build records are the same with or without stage records.
+    """
+    rng = random.Random(record['commit_id'])
+    profile = RESOURCE_PROFILES[record['project_type_name']]
+    
+    stages = []
+    for stage, key, flag in PIPELINE_STAGES:
+        ranges = DEPLOY_PROFILE if key == 'deploy' else profile.get(key)
+        if not record[flag] or ranges is None:
+            continue
+        if stage == 'build' and record['build_type'] == 1 and 'release' in profile:
+            release = profile['release']
+            ranges = {metric: (max(lo, release[metric][0]), max(hi, release[metric][1]))
+                      for metric, (lo, hi) in ranges.items()}
+        stages.append((stage, {metric: rng.uniform(*ranges[metric]) for metric in ranges}))
+    
+    memory_scale = record['memory_gb'] / max(draw['memory_gb'] for _, draw in stages)
+    time_scale = record['build_time_min'] / sum(draw['time_min'] for _, draw in stages)
+    cpu_scale = record['cpu_avg_pct'] / (sum(draw['cpu_pct'] * draw['time_min'] for _, draw in stages)
+                                         / sum(draw['time_min'] for _, draw in stages))
+    
+    features = {col: record[col] for col in TRAINING_COLUMNS[:-3]}
+    return [
+        {
+            'build_id': record['build_id'],
+            'stage': stage,
+            'stage_index': index,
+            **features,
+            'cpu_avg_pct': round(min(100, draw['cpu_pct'] * cpu_scale), 1),
+            'memory_gb': round(draw['memory_gb'] * memory_scale, 2),
+            'time_min': round(draw['time_min'] * time_scale, 1),
+            'status': record['status'],
+        }
+        for index, (stage, draw) in enumerate(stages)
+    ]
+
+
+def stage_records_frame(chunk):
+    """Stage records for a chunk of build records."""
+    return pd.DataFrame([row for record in chunk.to_dict('records')
+                         for row in generate_stage_records(record)])
+
+
+# =============================================================================
+# STREAMING OUTPUT
+# =============================================================================
+
+# Columns of the feature-only training file (27 features + 3 targets)
+TRAINING_COLUMNS = [
+    'project_type', 'repo_size_mb', 'is_monorepo',
+    'branch_type', 'build_type', 'environment',
+    'files_changed', 'lines_added', 'lines_deleted', 'source_files_pct',
+    'deps_file_changed', 'dependency_count', 'test_files_changed',
+    'stages_count', 'has_build_stage', 'has_unit_tests', 'has_integration_tests',
+    'has_e2e_tests', 'has_deploy_stage', 'has_docker_build', 'uses_emulator',
+    'parallel_stages', 'has_artifact_publish',
+    'is_first_build', 'cache_available', 'is_clean_build',
+    'time_of_day_hour',
+    'cpu_avg_pct', 'memory_gb', 'build_time_min'  # Targets
+]
+
+# Records generated and written per chunk (bounds peak memory)
+DEFAULT_CHUNK_SIZE = 5000
+
+OUTPUT_FORMATS = ('csv', 'parquet')
+
+
+def iter_record_chunks(num_records, kaggle_patterns=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield generated records as DataFrames of at most chunk_size rows.
+    
+    Records are produced in the same order (and from the same random
+    stream) as a single in-memory run, so chunking never changes the data.
+    """
+    base_timestamp = datetime(2024, 1, 1)
+    records = []
+    
+    for i in range(num_records):
+        base_date = base_timestamp + timedelta(days=i // 50)  # ~50 builds per day
+        records.append(generate_single_record(i + 1, base_date, kaggle_patterns))
+        
+        if len(records) == chunk_size:
+            yield pd.DataFrame(records)
+            records = []
+    
+    if records:
+        yield pd.DataFrame(records)
+
+
+class DatasetStats:
+    """One-pass summary statistics, updated chunk by chunk in O(1) memory."""
     
+    RATE_COLUMNS = ['cache_available', 'has_e2e_tests', 'uses_emulator',
+                    'is_clean_build', 'is_monorepo', 'has_artifact_publish']
+    RANGE_COLUMNS = ['memory_gb', 'cpu_avg_pct', 'build_time_min']
+    
+    def __init__(self):
+        self.count = 0
+        self.project_types = {}
+        self.build_types = {}
+        self.sums = {col: 0.0 for col in self.RATE_COLUMNS + ['test_files_changed']}
+        self.ranges = {col: [np.inf, -np.inf] for col in self.RANGE_COLUMNS}
+        self.peak_hour_builds = 0
+    
+    def update(self, chunk):
+        """Fold one chunk of records into the running totals."""
+        self.count += len(chunk)
+        
+        for name, n in chunk['project_type_name'].value_counts().items():
+            self.project_types[name] = self.project_types.get(name, 0) + int(n)
+        for build_type, n in chunk['build_type'].value_counts().items():
+            self.build_types[build_type] = self.build_types.get(build_type, 0) + int(n)
+        
+        for col in self.sums:
+            self.sums[col] += float(chunk[col].sum())
+        for col in self.RANGE_COLUMNS:
+            lo, hi = self.ranges[col]
+            self.ranges[col] = [min(lo, chunk[col].min()), max(hi, chunk[col].max())]
+        
+        self.peak_hour_builds += int(chunk['time_of_day_hour'].between(9, 17).sum())
+    
+    def rate(self, col):
+        return self.sums[col] / self.count if self.count else 0.0
+    
+    def print_summary(self):
+        print(f"\n{'='*60}")
+        print("Dataset Statistics")
+        print(f"{'='*60}")
+        print(f"\nTotal records: {self.count}")
+        print(f"\nProject Type Distribution:")
+        for name, n in sorted(self.project_types.items(), key=lambda x: -x[1]):
+            print(f"  {name:15s} {n}")
+        print(f"\nBuild Type Distribution:")
+        for build_type, n in sorted(self.build_types.items(), key=lambda x: -x[1]):
+            print(f"  {'release' if build_type == 1 else 'debug':15s} {n}")
+        print(f"\nResource Ranges:")
+        print(f"  Memory GB: {self.ranges['memory_gb'][0]:.1f} - {self.ranges['memory_gb'][1]:.1f}")
+        print(f"  CPU %:     {self.ranges['cpu_avg_pct'][0]:.1f} - {self.ranges['cpu_avg_pct'][1]:.1f}")
+        print(f"  Time min:  {self.ranges['build_time_min'][0]:.1f} - {self.ranges['build_time_min'][1]:.1f}")
+        print(f"\nCache hit rate: {self.rate('cache_available')*100:.1f}%")
+        print(f"E2E test rate:  {self.rate('has_e2e_tests')*100:.1f}%")
+        print(f"Emulator rate:  {self.rate('uses_emulator')*100:.1f}%")
+        print(f"\n--- NEW FEATURES ---")
+        print(f"Clean build rate:    {self.rate('is_clean_build')*100:.1f}%")
+        print(f"Monorepo rate:       {self.rate('is_monorepo')*100:.1f}%")
+        print(f"Artifact publish:    {self.rate('has_artifact_publish')*100:.1f}%")
+        print(f"Avg test files:      {self.rate('test_files_changed'):.1f}")
+        print(f"Peak hours (9-17):   {self.peak_hour_builds / max(self.count, 1)*100:.1f}%")
+
+
+class ChunkWriter:
+    """Appends DataFrame chunks to a CSV or (optionally) Parquet file."""
+    
+    def __init__(self, path, fmt='csv', columns=None):
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {fmt} (expected one of {OUTPUT_FORMATS})")
+        self.path = path
+        self.fmt = fmt
+        self.columns = columns
+        self.rows = 0
+        self._parquet_writer = None
+        
+        if fmt == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+                import pyarrow.parquet  # noqa: F401
+            except ImportError:
+                raise ImportError("Parquet output requires pyarrow (pip install pyarrow)")
+    
+    def write(self, chunk):
+        if self.columns is not None:
+            chunk = chunk[self.columns]
+        
+        if self.fmt == 'csv':
+            chunk.to_csv(self.path, mode='w' if self.rows == 0 else 'a',
+                         header=self.rows == 0, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table.cast(self._parquet_writer.schema))
+        
+        self.rows += len(chunk)
+    
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_dataset(num_records, output_path, training_output, kaggle_path=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE, fmt='csv', refresh_patterns=False, stage_output=None):
+    """
+    Generate records and stream them straight to the full and training outputs
+    (and, with stage_output, the per-stage records).
+    
+    Only one chunk is held in memory at a time, so peak memory is bounded by
+    chunk_size regardless of num_records. Returns the DatasetStats.
+    """
     print(f"\n{'='*60}")
     print(f"Generating Enhanced ML Training Dataset")
     print(f"{'='*60}")
     
-    # Load Kaggle patterns if available
-    kaggle_df = load_kaggle_data(kaggle_path) if kaggle_path else None
-    kaggle_patterns = extract_pipeline_patterns(kaggle_df)
+    # Load Kaggle patterns if available (streamed once, then cached by file hash)
+    kaggle_patterns = load_pipeline_patterns(kaggle_path, refresh=refresh_patterns) if kaggle_path else None
     
-    # Generate records
-    records = []
-    base_timestamp = datetime(2024, 1, 1)
-    
-    print(f"\n⏳ Generating {num_records} records...")
+    stats = DatasetStats()
+    print(f"\n⏳ Generating {num_records} records (chunks of {chunk_size}, {fmt})...")
     
-    for i in range(num_records):
-        # Progress every 100 records
-        base_date = base_timestamp + timedelta(days=i // 50)  # ~50 builds per day
-        record = generate_single_record(i + 1, base_date, kaggle_patterns)
-        records.append(record)
-        
-        if (i + 1) % 200 == 0:
-            print(f"   Generated {i + 1}/{num_records} records...")
+    with ChunkWriter(output_path, fmt) as full_writer, \
+            ChunkWriter(training_output, fmt, columns=TRAINING_COLUMNS) as training_writer, \
+            (ChunkWriter(stage_output, fmt) if stage_output else nullcontext()) as stage_writer:
+        for chunk in iter_record_chunks(num_records, kaggle_patterns, chunk_size):
+            full_writer.write(chunk)
+            training_writer.write(chunk)
+            if stage_writer is not None:
+                stage_writer.write(stage_records_frame(chunk))
+            stats.update(chunk)
+            print(f"   Generated {stats.count}/{num_records} records...")
     
-    # Create DataFrame
-    df = pd.DataFrame(records)
+    stats.print_summary()
+    return stats
+
+
+def generate_dataset(num_records=1000, kaggle_path=None, refresh_patterns=False):
+    """Generate the complete enhanced training dataset as one in-memory DataFrame."""
     
-    # Print statistics
     print(f"\n{'='*60}")
-    print("Dataset Statistics")
+    print(f"Generating Enhanced ML Training Dataset")
     print(f"{'='*60}")
-    print(f"\nTotal records: {len(df)}")
-    print(f"\nProject Type Distribution:")
-    print(df['project_type_name'].value_counts())
-    print(f"\nBuild Type Distribution:")
-    print(df['build_type'].map({0: 'debug', 1: 'release'}).value_counts())
-    print(f"\nResource Ranges:")
-    print(f"  Memory GB: {df['memory_gb'].min():.1f} - {df['memory_gb'].max():.1f}")
-    print(f"  CPU %:     {df['cpu_avg_pct'].min():.1f} - {df['cpu_avg_pct'].max():.1f}")
-    print(f"  Time min:  {df['build_time_min'].min():.1f} - {df['build_time_min'].max():.1f}")
-    print(f"\nCache hit rate: {df['cache_available'].mean()*100:.1f}%")
-    print(f"E2E test rate:  {df['has_e2e_tests'].mean()*100:.1f}%")
-    print(f"Emulator rate:  {df['uses_emulator'].mean()*100:.1f}%")
-    print(f"\n--- NEW FEATURES ---")
-    print(f"Clean build rate:    {df['is_clean_build'].mean()*100:.1f}%")
-    print(f"Monorepo rate:       {df['is_monorepo'].mean()*100:.1f}%")
-    print(f"Artifact publish:    {df['has_artifact_publish'].mean()*100:.1f}%")
-    print(f"Avg test files:      {df['test_files_changed'].mean():.1f}")
-    print(f"Peak hours (9-17):   {(df['time_of_day_hour'].between(9, 17)).mean()*100:.1f}%")
+    
+    # Load Kaggle patterns if available (streamed once, then cached by file hash)
+    kaggle_patterns = load_pipeline_patterns(kaggle_path, refresh=refresh_patterns) if kaggle_path else None
+    
+    print(f"\n⏳ Generating {num_records} records...")
+    chunks = list(iter_record_chunks(num_records, kaggle_patterns))
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    
+    stats = DatasetStats()
+    for chunk in chunks:
+        stats.update(chunk)
+    stats.print_summary()
     
     return df
 
 
 def main():
     """Main entry point."""
+    parser = argparse.ArgumentParser(description='Generate enhanced ML training data')
+    parser.add_argument('--num-records', type=int, default=1000,
+                        help='Number of build records to generate (default: 1000)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Records held in memory per write (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv',
+                        help='Output file format; parquet requires pyarrow (default: csv)')
+    parser.add_argument('--output-dir', default=None,
+                        help='Directory for the generated files (default: this script\'s directory)')
+    parser.add_argument('--kaggle-path', default=None,
+                        help='CI/CD log CSV to extract pipeline patterns from (default: ../ci_cd_logs.csv)')
+    parser.add_argument('--refresh-patterns', action='store_true',
+                        help='Ignore the cached pattern summary and re-scan the log file')
+    parser.add_argument('--stage-records', action='store_true',
+                        help='Also write stage_records.<format>: one row per pipeline stage of each build')
+    args = parser.parse_args()
+    
     # Paths
     script_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(script_dir)
+    output_dir = args.output_dir or script_dir
+    os.makedirs(output_dir, exist_ok=True)
+    
+    kaggle_path = args.kaggle_path or os.path.join(project_root, 'ci_cd_logs.csv')
+    output_path = os.path.join(output_dir, f'enhanced_training_data.{args.format}')
+    training_output = os.path.join(output_dir, f'training_features.{args.format}')
+    stage_output = os.path.join(output_dir, f'stage_records.{args.format}') if args.stage_records else None
+    
+    # Generate and stream both outputs chunk by chunk
+    stats = write_dataset(
+        num_records=args.num_records,
+        output_path=output_path,
+        training_output=training_output,
+        kaggle_path=kaggle_path,
+        chunk_size=args.chunk_size,
+        fmt=args.format,
+        refresh_patterns=args.refresh_patterns,
+        stage_output=stage_output,
+    )
     
-    kaggle_path = os.path.join(project_root, 'ci_cd_logs.csv')
-    output_path = os.path.join(script_dir, 'enhanced_training_data.csv')
-    
-    # Generate dataset
-    df = generate_dataset(num_records=1000, kaggle_path=kaggle_path)
-    
-    # Save to CSV
-    df.to_csv(output_path, index=False)
     print(f"\n✅ Dataset saved to: {output_path}")
-    print(f"   Columns: {len(df.columns)}")
-    print(f"   Records: {len(df)}")
-    
-    # Also save a feature-only version for training (with NEW features)
-    training_cols = [
-        'project_type', 'repo_size_mb', 'is_monorepo',  # NEW: is_monorepo
-        'branch_type', 'build_type', 'environment',
-        'files_changed', 'lines_added', 'lines_deleted', 'source_files_pct',
-        'deps_file_changed', 'dependency_count', 'test_files_changed',  # NEW: test_files_changed
-        'stages_count', 'has_build_stage', 'has_unit_tests', 'has_integration_tests',
-        'has_e2e_tests', 'has_deploy_stage', 'has_docker_build', 'uses_emulator',
-        'parallel_stages', 'has_artifact_publish',  # NEW: has_artifact_publish
-        'is_first_build', 'cache_available', 'is_clean_build',  # NEW: is_clean_build
-        'time_of_day_hour',  # NEW: time_of_day_hour
-        'cpu_avg_pct', 'memory_gb', 'build_time_min'  # Targets
-    ]
-    
-    df_training = df[training_cols]
-    training_output = os.path.join(script_dir, 'training_features.csv')
-    df_training.to_csv(training_output, index=False)
+    print(f"   Records: {stats.count}")
     print(f"\n✅ Training features saved to: {training_output}")
-    print(f"   Columns: {len(df_training.columns)} (including 5 NEW features)")
+    print(f"   Columns: {len(TRAINING_COLUMNS)} (including 5 NEW features)")
+    if stage_output:
+        print(f"\n✅ Stage records saved to: {stage_output}")
     
-    return df
+    return stats
 
 
 if __name__ == "__main__":
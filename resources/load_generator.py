@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+Prediction Traffic Load Generator
+==================================
+Synthesizes realistic build-context request streams and replays them
+against the prediction path to size serving infrastructure.
+
+Streams follow the dataset generator's traffic shape:
+- Arrivals: non-homogeneous Poisson process over the HOUR_WEIGHTS curve
+  (a full day is compressed into the run by default)
+- Mix: PROJECT_TYPE_WEIGHTS, with contexts sampled from real rows of
+  enhanced_training_data.csv for the chosen project type
+- Bursts: monorepo triggers fan out into several near-simultaneous builds
+
+Targets:
+- cli:    one `ml/predict.py --input` process per request
+- batch:  one `ml/predict.py --input` process per --batch-size requests
+- server: POST /predict to --url, or to a locally spawned `predict.py --serve`
+          (--workers N spawns it pre-forked; per-process RSS/PSS is reported)
+
+Modes:
+- open:   requests are sent at their scheduled arrival times; latency is
+          measured from the scheduled time, so queueing delay is included
+- closed: --concurrency workers send back-to-back requests
+
+Usage:
+    python load_generator.py --model ../ml/model.pkl --target server \\
+        --rate 20 --duration 60 --mode both --report load_report.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from generate_enhanced_dataset import HOUR_WEIGHTS, PROJECT_TYPES, PROJECT_TYPE_WEIGHTS
+
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_PATH = os.path.join(SCRIPT_DIR, 'enhanced_training_data.csv')
+DEFAULT_PREDICT_SCRIPT = os.path.join(os.path.dirname(SCRIPT_DIR), 'ml', 'predict.py')
+
+ENVIRONMENT_NAMES = ['development', 'staging', 'production']
+
+# Numeric context keys copied verbatim from a sampled row (predict.py
+# accepts the snake_case names as fallbacks for the camelCase ones)
+ROW_CONTEXT_COLUMNS = [
+    'repo_size_mb', 'is_monorepo',
+    'files_changed', 'lines_added', 'lines_deleted', 'source_files_pct',
+    'deps_file_changed', 'dependency_count', 'test_files_changed',
+    'stages_count', 'has_build_stage', 'has_unit_tests', 'has_integration_tests',
+    'has_e2e_tests', 'has_deploy_stage', 'has_docker_build', 'uses_emulator',
+    'parallel_stages', 'has_artifact_publish',
+    'is_first_build', 'cache_available', 'is_clean_build',
+]
+
+# Builds triggered by one monorepo push (min, max)
+DEFAULT_FANOUT = (3, 8)
+
+
+# =============================================================================
+# STREAM SYNTHESIS
+# =============================================================================
+
+def load_row_pools(data_path):
+    """Group dataset rows by project type name for context sampling."""
+    df = pd.read_csv(data_path, usecols=ROW_CONTEXT_COLUMNS + [
+        'project_type_name', 'branch', 'branch_type', 'build_type', 'environment'])
+    return {name: group.to_dict('records') for name, group in df.groupby('project_type_name')}
+
+
+def row_to_context(row, build_id, hour):
+    """Turn a dataset row into the context JSON that PipelineAnalyzer would send."""
+    context = {
+        'buildId': build_id,
+        'projectType': row['project_type_name'],
+        'branch': row['branch'],
+        'branchType': int(row['branch_type']),
+        'buildType': 'release' if row['build_type'] == 1 else 'debug',
+        'environment': ENVIRONMENT_NAMES[int(row['environment'])],
+        'timeOfDayHour': hour,
+    }
+    for col in ROW_CONTEXT_COLUMNS:
+        value = row[col]
+        context[col] = float(value) if isinstance(value, float) else int(value)
+    return context
+
+
+def synthesize_stream(pools, duration_s, rate, day_seconds=None, start_hour=0,
+                      fanout=DEFAULT_FANOUT, seed=42):
+    """
+    Generate a list of {'t': offset_seconds, 'context': {...}} requests.
+
+    rate is the mean trigger rate (per second) over a day; the instantaneous
+    rate follows HOUR_WEIGHTS. Arrivals are drawn by thinning a homogeneous
+    process at the peak rate. Monorepo triggers add a burst of fanout builds
+    within a fraction of a second, splitting the changed files between them.
+    """
+    rng = np.random.default_rng(seed)
+    day_seconds = day_seconds or duration_s
+    hourly = np.asarray(HOUR_WEIGHTS) * 24
+    peak = hourly.max()
+
+    names = [PROJECT_TYPES[i] for i in range(len(PROJECT_TYPE_WEIGHTS))]
+    weights = np.asarray([w if name in pools else 0.0
+                          for name, w in zip(names, PROJECT_TYPE_WEIGHTS)])
+    weights /= weights.sum()
+
+    stream = []
+    t = 0.0
+    while True:
+        t += rng.exponential(1.0 / (rate * peak))
+        if t >= duration_s:
+            break
+        hour = int(start_hour + t / day_seconds * 24) % 24
+        if rng.random() * peak > hourly[hour]:
+            continue
+
+        pool = pools[names[rng.choice(len(names), p=weights)]]
+        row = pool[rng.integers(len(pool))]
+
+        if row['is_monorepo']:
+            n = int(rng.integers(fanout[0], fanout[1] + 1))
+            for k in range(n):
+                context = row_to_context(row, f"load-{len(stream) + 1:06d}", hour)
+                context['files_changed'] = max(1, int(row['files_changed']) // n)
+                context['lines_added'] = max(1, int(row['lines_added']) // n)
+                stream.append({'t': t + float(rng.uniform(0, 0.05 * n)), 'context': context})
+        else:
+            stream.append({'t': t, 'context': row_to_context(row, f"load-{len(stream) + 1:06d}", hour)})
+
+    stream.sort(key=lambda r: r['t'])
+    return stream
+
+
+def save_stream(stream, path):
+    with open(path, 'w') as f:
+        for request in stream:
+            f.write(json.dumps(request) + '\n')
+
+
+def load_stream(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# =============================================================================
+# TARGETS
+# =============================================================================
+
+class CliTarget:
+    """Runs predict.py once per call; a list input exercises batch mode."""
+
+    def __init__(self, predict_script, model_path, python=sys.executable):
+        self.command = [python, predict_script, '--model', model_path, '--input']
+
+    def __call__(self, contexts):
+        payload = contexts if len(contexts) > 1 else contexts[0]
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(payload, f)
+            input_path = f.name
+        try:
+            proc = subprocess.run(self.command + [input_path], capture_output=True, text=True)
+        finally:
+            os.unlink(input_path)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'predict.py failed')
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        return result if isinstance(result, list) else [result]
+
+
+class HttpTarget:
+    """POSTs to a prediction server's /predict endpoint."""
+
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, contexts):
+        payload = contexts if len(contexts) > 1 else contexts[0]
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode(),
+            headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            result = json.loads(response.read())
+        return result if isinstance(result, list) else [result]
+
+
+def spawn_server(predict_script, model_path, python=sys.executable, timeout=60, workers=0):
+    """Start `predict.py --serve` (pre-forked with --workers N) on a free local port and wait until healthy."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    command = [python, predict_script, '--model', model_path, '--serve', f'127.0.0.1:{port}']
+    if workers:
+        command += ['--workers', str(workers)]
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('Prediction server exited during startup')
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1).read()
+            return proc, f'http://127.0.0.1:{port}/predict'
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError('Prediction server did not become healthy')
+
+
+# =============================================================================
+# REPLAY
+# =============================================================================
+
+def group_calls(stream, batch_size):
+    """Group consecutive requests into calls; a call is dispatched at its last arrival."""
+    return [stream[i:i + batch_size] for i in range(0, len(stream), batch_size)]
+
+
+def process_tree(pid):
+    """pid plus its live child processes (the pre-forked workers)."""
+    children = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        try:
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                children.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return [pid] + children
+
+
+def process_cpu_seconds(pid):
+    """User + system CPU seconds of a process and its children, from /proc/<pid>/stat."""
+    total = 0.0
+    for p in process_tree(pid):
+        try:
+            with open(f'/proc/{p}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        total += (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return total
+
+
+def process_memory_mb(pid):
+    """RSS and PSS (shared pages split between sharers) of each server process, in MB."""
+    memory = []
+    for p in process_tree(pid):
+        values = {}
+        try:
+            with open(f'/proc/{p}/smaps_rollup') as f:
+                for line in f:
+                    key, _, rest = line.partition(':')
+                    if key in ('Rss', 'Pss'):
+                        values[key.lower()] = round(int(rest.split()[0]) / 1024, 1)
+        except OSError:
+            continue
+        memory.append({'pid': p, 'role': 'parent' if p == pid else 'worker', **values})
+    return memory
+
+
+def client_cpu_seconds():
+    """CPU of this process plus reaped children (the CLI predict.py runs)."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def run_open_loop(calls, target, concurrency):
+    """Send each call at its scheduled time; latency includes queueing."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def execute(call):
+        nonlocal errors
+        try:
+            results = target([r['context'] for r in call])
+            failed = sum(1 for r in results if 'error' in r)
+        except Exception:
+            failed = len(call)
+        done = time.perf_counter() - start
+        with lock:
+            latencies.extend(done - r['t'] for r in call)
+            errors += failed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for call in calls:
+            delay = call[-1]['t'] - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(execute, call)
+
+    return latencies, errors, time.perf_counter() - start
+
+
+def run_closed_loop(calls, target, concurrency):
+    """concurrency workers send calls back to back, ignoring arrival times."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    pending = iter(calls)
+
+    def worker():
+        nonlocal errors
+        while True:
+            with lock:
+                call = next(pending, None)
+            if call is None:
+                return
+            sent = time.perf_counter()
+            try:
+                results = target([r['context'] for r in call])
+                failed = sum(1 for r in results if 'error' in r)
+            except Exception:
+                failed = len(call)
+            elapsed = time.perf_counter() - sent
+            with lock:
+                latencies.extend([elapsed] * len(call))
+                errors += failed
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def replay(stream, target, mode, concurrency, batch_size=1, server_pid=None):
+    """Replay a stream in one mode and return a metrics dict."""
+    calls = group_calls(stream, batch_size)
+
+    client_cpu = client_cpu_seconds()
+    server_cpu = process_cpu_seconds(server_pid) if server_pid else None
+
+    runner = run_open_loop if mode == 'open' else run_closed_loop
+    latencies, errors, wall = runner(calls, target, concurrency)
+
+    client_cpu = client_cpu_seconds() - client_cpu
+    lat_ms = np.asarray(latencies) * 1000
+    report = {
+        'mode': mode,
+        'requests': len(stream),
+        'calls': len(calls),
+        'concurrency': concurrency,
+        'batch_size': batch_size,
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(len(stream) / wall, 2) if wall > 0 else 0.0,
+        'error_rate': round(errors / len(stream), 4) if stream else 0.0,
+        'latency_ms': {
+            'mean': round(float(lat_ms.mean()), 2),
+            'p50': round(float(np.percentile(lat_ms, 50)), 2),
+            'p90': round(float(np.percentile(lat_ms, 90)), 2),
+            'p99': round(float(np.percentile(lat_ms, 99)), 2),
+            'max': round(float(lat_ms.max()), 2),
+        } if len(lat_ms) else {},
+        # CPU is reported as % of one core over the run's wall time
+        'client_cpu_pct': round(client_cpu / wall * 100, 1) if wall > 0 else 0.0,
+        'cpu_ms_per_request': round(client_cpu * 1000 / max(len(stream), 1), 2),
+    }
+    if server_pid:
+        server_cpu = process_cpu_seconds(server_pid) - server_cpu
+        report['server_cpu_pct'] = round(server_cpu / wall * 100, 1) if wall > 0 else 0.0
+        report['cpu_ms_per_request'] = round((client_cpu + server_cpu) * 1000 / max(len(stream), 1), 2)
+        report['server_memory_mb'] = process_memory_mb(server_pid)
+    return report
+
+
+def print_report(report):
+    print(f"\n{'='*60}")
+    print(f"{report['mode'].upper()}-LOOP: {report['requests']} requests "
+          f"({report['calls']} calls, concurrency {report['concurrency']})")
+    print(f"{'='*60}")
+    print(f"  Throughput:   {report['throughput_rps']:.2f} req/s over {report['wall_seconds']:.1f}s")
+    if report['latency_ms']:
+        lat = report['latency_ms']
+        print(f"  Latency ms:   p50 {lat['p50']:.1f}  p90 {lat['p90']:.1f}  "
+              f"p99 {lat['p99']:.1f}  max {lat['max']:.1f}")
+    print(f"  Error rate:   {report['error_rate']*100:.2f}%")
+    print(f"  Client CPU:   {report['client_cpu_pct']:.1f}% of a core")
+    if 'server_cpu_pct' in report:
+        print(f"  Server CPU:   {report['server_cpu_pct']:.1f}% of a core")
+    print(f"  CPU/request:  {report['cpu_ms_per_request']:.2f} ms")
+    for proc in report.get('server_memory_mb', []):
+        print(f"  {proc['role'].capitalize():8s} {proc['pid']}: RSS {proc.get('rss', 0):.1f} MB, "
+              f"PSS {proc.get('pss', 0):.1f} MB")
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay synthetic build traffic against the predictor')
+    parser.add_argument('--model', required=True, help='Path to trained model.pkl')
+    parser.add_argument('--target', choices=['cli', 'batch', 'server'], default='server')
+    parser.add_argument('--url', help='Prediction server URL (default: spawn a local predict.py --serve)')
+    parser.add_argument('--predict-script', default=DEFAULT_PREDICT_SCRIPT)
+    parser.add_argument('--data-path', default=DEFAULT_DATA_PATH,
+                        help='Dataset whose rows seed the synthetic contexts')
+    parser.add_argument('--stream', help='Replay a saved JSONL stream instead of synthesizing one')
+    parser.add_argument('--save-stream', help='Write the synthesized stream to this JSONL file')
+    parser.add_argument('--rate', type=float, default=10.0, help='Mean trigger rate per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='Stream length in seconds')
+    parser.add_argument('--day-seconds', type=float, default=None,
+                        help='Seconds representing one day of traffic (default: --duration)')
+    parser.add_argument('--start-hour', type=int, default=0)
+    parser.add_argument('--fanout', type=int, nargs=2, default=list(DEFAULT_FANOUT),
+                        metavar=('MIN', 'MAX'), help='Builds per monorepo trigger')
+    parser.add_argument('--mode', choices=['open', 'closed', 'both'], default='both')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Spawn the local server pre-forked with this many workers')
+    parser.add_argument('--batch-size', type=int, default=32, help='Requests per call for --target batch')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--report', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    if args.stream:
+        stream = load_stream(args.stream)
+    else:
+        stream = synthesize_stream(
+            load_row_pools(args.data_path), args.duration, args.rate,
+            day_seconds=args.day_seconds, start_hour=args.start_hour,
+            fanout=tuple(args.fanout), seed=args.seed)
+    if args.save_stream:
+        save_stream(stream, args.save_stream)
+    if not stream:
+        print("❌ Stream is empty (increase --rate or --duration)", file=sys.stderr)
+        sys.exit(1)
+    print(f"✅ Stream ready: {len(stream)} requests over {stream[-1]['t']:.1f}s")
+
+    server_proc, server_pid = None, None
+    batch_size = args.batch_size if args.target == 'batch' else 1
+    if args.target == 'server':
+        url = args.url
+        if not url:
+            server_proc, url = spawn_server(args.predict_script, args.model, workers=args.workers)
+            server_pid = server_proc.pid
+            print(f"✅ Spawned prediction server (pid {server_pid}) at {url}")
+        target = HttpTarget(url)
+    else:
+        target = CliTarget(args.predict_script, args.model)
+
+    modes = ['open', 'closed'] if args.mode == 'both' else [args.mode]
+    reports = []
+    try:
+        for mode in modes:
+            report = replay(stream, target, mode, args.concurrency, batch_size, server_pid)
+            report['target'] = args.target
+            print_report(report)
+            reports.append(report)
+    finally:
+        if server_proc:
+            server_proc.terminate()
+            server_proc.wait()
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n✅ Report saved: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
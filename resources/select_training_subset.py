@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Training Subset Selection
+=========================
+Cuts retraining time by fitting on a representative subset of the build
+history instead of all of it. Rows are put in a selection order, and
+every prefix of that order is itself a usable training set:
+
+- stratified: proportional by (project_type, branch_type, build_type).
+  Every stratum contributes one row first, then rows interleave so a
+  prefix of any size keeps each stratum's share. Selected rows are
+  reweighted so each stratum keeps its full total weight.
+- kcenter: greedy farthest-first (k-center) over the features, with
+  counts and sizes log-scaled and everything standardized. Each selected
+  row is weighted by the builds closest to it, so the subset is a
+  weighted coreset of the history rather than a bias toward outliers.
+
+Accuracy guard: the successful rows are split 80/20. The forest from
+train_model.py is fit on the full 80%, then on growing prefixes (--start
+rows, times --growth each step). Growth stops at the first size whose
+holdout R² is within --r2-tolerance of the full fit and whose per-target
+MAE is within --mae-tolerance (relative). That fraction is then applied
+to all successful rows.
+
+Output: the subset CSV (with sample_weight, for train_model.py
+--data-path) and a JSON with the selected 0-based data rows of the input
+CSV, their weights and the guard report (fit seconds and accuracy per
+step, training-time reduction), so a selection can be reproduced.
+
+Usage:
+    python select_training_subset.py --input enhanced_training_data.csv --output subset.csv
+    python select_training_subset.py --input enhanced_training_data.csv --output subset.csv --method kcenter
+    python train_model.py --data-path subset.csv --model-path ../ml
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from compact_training_data import LOG_FEATURES, fit_and_score, successful_rows
+from train_model import FEATURE_COLUMNS, TARGET_COLUMNS, WEIGHT_COLUMN
+
+
+STRATA = ['project_type', 'branch_type', 'build_type']
+DEFAULT_START = 500             # rows in the first candidate subset
+DEFAULT_GROWTH = 1.5            # each candidate is this many times the previous one
+DEFAULT_R2_TOLERANCE = 0.01     # allowed holdout R² drop vs the full fit
+DEFAULT_MAE_TOLERANCE = 0.05    # allowed relative holdout MAE increase per target
+SEED = 42
+
+
+# =============================================================================
+# SELECTION ORDER
+# =============================================================================
+
+def stratified_order(df, seed=SEED):
+    """
+    Row positions in selection order: the first row of every stratum, then
+    each stratum's rows spread evenly (with jitter) across the order.
+    """
+    rng = np.random.default_rng(seed)
+    shuffled = rng.permutation(len(df))
+    strata = df[STRATA].iloc[shuffled].fillna(0)
+    position = strata.groupby(STRATA, sort=False).cumcount().to_numpy()
+    size = strata.groupby(STRATA, sort=False)[STRATA[0]].transform('size').to_numpy()
+    key = np.where(position == 0, -1.0, (position + rng.random(len(df))) / size)
+    return shuffled[np.argsort(key, kind='stable')]
+
+
+def stratified_weights(df, rows):
+    """Weights for df.iloc[rows] that keep every stratum's total weight."""
+    weights = df[WEIGHT_COLUMN].to_numpy(dtype=float)
+    stratum = df[STRATA].fillna(0).groupby(STRATA, sort=False).ngroup().to_numpy()
+    total = np.bincount(stratum, weights=weights)
+    chosen = np.bincount(stratum[rows], weights=weights[rows], minlength=len(total))
+    return weights[rows] * total[stratum[rows]] / chosen[stratum[rows]]
+
+
+def scaled_features(df):
+    """Log-scaled counts/sizes, then every feature standardized (for distances)."""
+    Z = df[FEATURE_COLUMNS].to_numpy(dtype=float)
+    for k, col in enumerate(FEATURE_COLUMNS):
+        if col in LOG_FEATURES:
+            Z[:, k] = np.log1p(np.maximum(Z[:, k], 0))
+    std = Z.std(axis=0)
+    return (Z - Z.mean(axis=0)) / np.where(std > 0, std, 1)
+
+
+class KCenterOrder:
+    """Greedy farthest-first selection, extended on demand."""
+
+    def __init__(self, df, seed=SEED):
+        self.Z = scaled_features(df)
+        self.weights = df[WEIGHT_COLUMN].to_numpy(dtype=float)
+        self.order = [int(np.random.default_rng(seed).integers(len(self.Z)))]
+        self.nearest = np.zeros(len(self.Z), dtype=np.int64)
+        self.distance = ((self.Z - self.Z[self.order[0]]) ** 2).sum(axis=1)
+
+    def extend(self, k):
+        """The first k rows of the order."""
+        while len(self.order) < min(k, len(self.Z)):
+            row = int(np.argmax(self.distance))
+            distance = ((self.Z - self.Z[row]) ** 2).sum(axis=1)
+            closer = distance < self.distance
+            self.nearest[closer] = len(self.order)
+            self.distance[closer] = distance[closer]
+            self.order.append(row)
+        return np.array(self.order[:k])
+
+    def coreset_weights(self, k):
+        """Weight of each of the first k centers: the rows closest to it among them."""
+        self.extend(k)
+        if k == len(self.order):
+            return np.bincount(self.nearest, weights=self.weights, minlength=k)
+        centers = self.Z[self.order[:k]]
+        nearest = np.concatenate([((self.Z[i:i + 4096, None, :] - centers) ** 2).sum(axis=2).argmin(axis=1)
+                                  for i in range(0, len(self.Z), 4096)])
+        return np.bincount(nearest, weights=self.weights, minlength=k)
+
+
+def selector(df, method, seed=SEED):
+    """fn(k) -> (row positions, weights) of the first k rows in selection order."""
+    if method == 'kcenter':
+        order = KCenterOrder(df, seed)
+        return lambda k: (order.extend(k), order.coreset_weights(k))
+    order = stratified_order(df, seed)
+    return lambda k: (order[:k], stratified_weights(df, order[:k]))
+
+
+def subset_frame(df, rows, weights):
+    out = df.iloc[rows].copy()
+    out[WEIGHT_COLUMN] = np.round(weights, 6)
+    return out
+
+
+# =============================================================================
+# ACCURACY GUARD
+# =============================================================================
+
+def within_tolerance(metrics, full, r2_tolerance, mae_tolerance):
+    """Holdout R² and every target's MAE close enough to the full-data fit."""
+    if metrics['r2'] < full['r2'] - r2_tolerance:
+        return False
+    return all(metrics[f'{t}_mae'] <= full[f'{t}_mae'] * (1 + mae_tolerance) for t in TARGET_COLUMNS)
+
+
+def grow_until_accurate(train, test, method, start=DEFAULT_START, growth=DEFAULT_GROWTH,
+                        r2_tolerance=DEFAULT_R2_TOLERANCE, mae_tolerance=DEFAULT_MAE_TOLERANCE, seed=SEED):
+    """Smallest prefix (start, start*growth, ...) that passes the guard; returns the guard report."""
+    full = fit_and_score(train, test)
+    select = selector(train, method, seed)
+    steps = []
+    k = min(max(1, start), len(train))
+    while True:
+        rows, weights = select(k)
+        metrics = fit_and_score(subset_frame(train, rows, weights), test)
+        metrics['passed'] = within_tolerance(metrics, full, r2_tolerance, mae_tolerance)
+        steps.append(metrics)
+        if metrics['passed'] or k >= len(train):
+            break
+        k = min(len(train), max(k + 1, int(k * growth)))
+
+    chosen = steps[-1]
+    return {
+        'train_rows': len(train),
+        'test_rows': len(test),
+        'full': full,
+        'steps': steps,
+        'chosen_rows': chosen['rows'],
+        'fraction': round(chosen['rows'] / len(train), 4),
+        'passed': chosen['passed'],
+        'fit_time_reduction': round(1 - chosen['fit_seconds'] / max(full['fit_seconds'], 1e-9), 4),
+        'search_fit_seconds': round(sum(step['fit_seconds'] for step in steps), 3),
+    }
+
+
+def select_training_subset(df, method='stratified', seed=SEED, **options):
+    """
+    Guarded subset of the successful rows of df.
+
+    Returns (subset frame, selected df index labels, weights, report).
+    """
+    rows = successful_rows(df)
+    if len(rows) < 50:
+        raise ValueError(f"Not enough successful rows: {len(rows)} (need 50+)")
+    train, test = train_test_split(rows, test_size=0.2, random_state=seed)
+    guard = grow_until_accurate(train, test, method, seed=seed, **options)
+
+    k = len(rows) if guard['chosen_rows'] >= len(train) else int(round(guard['fraction'] * len(rows)))
+    positions, weights = selector(rows, method, seed)(max(1, k))
+    subset = subset_frame(rows, positions, weights)
+    report = {
+        'method': method,
+        'input_rows': len(df),
+        'successful_rows': len(rows),
+        'selected_rows': len(subset),
+        'guard': guard,
+    }
+    return subset, rows.index[positions], weights, report
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Select a representative training subset with an accuracy guard')
+    parser.add_argument('--input', required=True, help='Training CSV (raw or compacted)')
+    parser.add_argument('--output', required=True, help='Subset CSV with a sample_weight column')
+    parser.add_argument('--indices', help='Selected rows + guard report (default: <output>.json)')
+    parser.add_argument('--method', choices=['stratified', 'kcenter'], default='stratified')
+    parser.add_argument('--start', type=int, default=DEFAULT_START, help='Rows in the first candidate subset')
+    parser.add_argument('--growth', type=float, default=DEFAULT_GROWTH, help='Candidate size multiplier')
+    parser.add_argument('--r2-tolerance', type=float, default=DEFAULT_R2_TOLERANCE,
+                        help='Allowed holdout R² drop vs training on everything')
+    parser.add_argument('--mae-tolerance', type=float, default=DEFAULT_MAE_TOLERANCE,
+                        help='Allowed relative holdout MAE increase per target')
+    parser.add_argument('--seed', type=int, default=SEED)
+    args = parser.parse_args()
+
+    try:
+        df = pd.read_csv(args.input)
+        subset, rows, weights, report = select_training_subset(
+            df, args.method, args.seed, start=args.start, growth=max(args.growth, 1.0),
+            r2_tolerance=args.r2_tolerance, mae_tolerance=args.mae_tolerance)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    tmp = f'{args.output}.tmp'
+    subset.to_csv(tmp, index=False)
+    os.replace(tmp, args.output)
+
+    indices_path = args.indices or f'{os.path.splitext(args.output)[0]}.json'
+    selection = {
+        'input': os.path.abspath(args.input),
+        'seed': args.seed,
+        **report,
+        'rows': [int(i) for i in rows],
+        'weights': np.round(weights, 6).tolist(),
+    }
+    with open(f'{indices_path}.tmp', 'w') as f:
+        json.dump(selection, f)
+    os.replace(f'{indices_path}.tmp', indices_path)
+
+    guard = report['guard']
+    print(json.dumps(report, indent=2))
+    if guard['chosen_rows'] >= guard['train_rows']:
+        print("⚠️ No smaller subset stayed within tolerance; selected every row", file=sys.stderr)
+    print(f"✅ {report['successful_rows']} → {report['selected_rows']} rows ({guard['fraction']:.1%}); "
+          f"fit time -{guard['fit_time_reduction']:.0%}, holdout R² {guard['steps'][-1]['r2']:.4f} "
+          f"vs {guard['full']['r2']:.4f}: {args.output}, {indices_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,11 +15,35 @@ Targets:
 - cpu_avg_pct: Average CPU usage (%)
 - memory_gb: Peak memory usage (GB)
 - build_time_min: Total build time (minutes)
+
+With --stage-data (stage_records.csv from generate_enhanced_dataset.py
+--stage-records), a second forest is trained on per-stage records: the 27
+build features plus a stage code, predicting each stage's CPU, memory and
+time. It is saved as stage_model.pkl and listed under 'stages' in
+features.json; predict.py then adds per-stage predictions to its response.
+
+An optional sample_weight column (written by compact_training_data.py,
+where one row stands for several near-identical builds) is used as the
+fit and evaluation weight.
+
+Every run writes training_report.json next to the model: wall time, CPU
+time (including worker threads) and RSS per phase, plus dataset shapes and
+per-dtype memory. --trace-memory adds each phase's tracemalloc peak;
+tracing every allocation slows the fit several times over, so time a run
+without it. --profile also dumps a cProfile of the fit phase
+(train_fit.prof; view with `python -m pstats`).
 """
 
 import argparse
+import cProfile
+import json
 import os
+import pstats
+import resource
 import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
 import pandas as pd
 import joblib
 import numpy as np
@@ -76,16 +100,138 @@ FEATURE_COLUMNS = [
 
 # Target columns
 TARGET_COLUMNS = ['cpu_avg_pct', 'memory_gb', 'build_time_min']
+WEIGHT_COLUMN = 'sample_weight'
+
+# Stage records: the build features plus the stage, with per-stage targets
+STAGE_FEATURE = 'stage_code'
+STAGE_TARGET_COLUMNS = ['cpu_avg_pct', 'memory_gb', 'time_min']
+
+
+# =============================================================================
+# INSTRUMENTATION
+# =============================================================================
+
+def rss_mb():
+    """Current resident set size of this process (MB), or None off Linux."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class TrainingReport:
+    """
+    Per-phase wall/CPU/memory measurements and dataset footprints for one training run.
+    
+    With trace_memory, tracemalloc runs for the report's lifetime and each
+    phase also records its traced Python allocation peak.
+    """
+    
+    def __init__(self, trace_memory=False):
+        self.phases = []
+        self.datasets = {}
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.started = time.perf_counter()
+    
+    @contextmanager
+    def phase(self, name):
+        """
+        Measure one phase. process_time covers every thread of this process
+        (the forest fits on threads); cpu_children covers forked workers.
+        """
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        children_before = os.times()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            children = os.times()
+            entry = {
+                'phase': name,
+                'wall_s': round(wall, 4),
+                'cpu_s': round(cpu, 4),
+                'cpu_children_s': round((children.children_user + children.children_system)
+                                        - (children_before.children_user + children_before.children_system), 4),
+                'rss_mb': rss_mb(),
+                'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            }
+            if tracing:
+                traced, peak = tracemalloc.get_traced_memory()
+                entry['traced_peak_mb'] = round((peak - traced_before) / 2**20, 2)
+                entry['traced_retained_mb'] = round((traced - traced_before) / 2**20, 2)
+            self.phases.append(entry)
+    
+    def dataset(self, name, frame):
+        """Shape and per-dtype memory of a DataFrame (deep, so object columns count)."""
+        usage = frame.memory_usage(deep=True, index=False)
+        by_dtype = {}
+        for col, nbytes in usage.items():
+            dtype = str(frame[col].dtype)
+            by_dtype[dtype] = by_dtype.get(dtype, 0) + int(nbytes)
+        self.datasets[name] = {
+            'rows': int(frame.shape[0]),
+            'columns': int(frame.shape[1]),
+            'memory_mb': round(sum(by_dtype.values()) / 2**20, 3),
+            'dtypes_mb': {dtype: round(nbytes / 2**20, 3) for dtype, nbytes in sorted(by_dtype.items())},
+        }
+    
+    def to_dict(self):
+        total = time.perf_counter() - self.started
+        return {
+            'total_wall_s': round(total, 3),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'cpu_count': os.cpu_count(),
+            'trace_memory': self.trace_memory,
+            'phases': self.phases,
+            'datasets': self.datasets,
+        }
+    
+    def save(self, model_dir):
+        """Write training_report.json next to the model; returns its path."""
+        os.makedirs(model_dir, exist_ok=True)
+        path = os.path.join(model_dir, 'training_report.json')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+        return path
+    
+    def summary(self):
+        """Readable per-phase table for the console."""
+        lines = [f"  {'phase':20s} {'wall s':>8s} {'cpu s':>8s} {'peak MB':>9s} {'rss MB':>8s}"]
+        for p in self.phases:
+            peak = f"{p['traced_peak_mb']:9.1f}" if 'traced_peak_mb' in p else f"{'-':>9s}"
+            lines.append(f"  {p['phase']:20s} {p['wall_s']:8.3f} {p['cpu_s']:8.3f} "
+                         f"{peak} {p['rss_mb'] or 0:8.1f}")
+        return '\n'.join(lines)
 
 
 # =============================================================================
 # DATA LOADING
 # =============================================================================
 
-def load_data(csv_path):
-    """Load and validate the enhanced training dataset."""
+def load_data(csv_path, report=None):
+    """
+    Load and validate the enhanced training dataset.
+    
+    Returns X, y and the per-row sample weights (None when the CSV has no
+    sample_weight column).
+    """
+    report = report or TrainingReport()
     print(f"Loading dataset: {csv_path}")
-    df = pd.read_csv(csv_path)
+    with report.phase('read_csv'):
+        df = pd.read_csv(csv_path)
+    report.dataset('raw', df)
     
     print(f"  Total records: {len(df)}")
     print(f"  Total columns: {len(df.columns)}")
@@ -102,28 +248,57 @@ def load_data(csv_path):
     # Filter to successful builds only if status column exists
     if 'status' in df.columns:
         original_len = len(df)
-        df = df[df['status'].isin(['success', 'SUCCESS'])]
+        with report.phase('filter_status'):
+            df = df[df['status'].isin(['success', 'SUCCESS'])]
         print(f"  Filtered to successful builds: {len(df)}/{original_len}")
     
     if len(df) < 50:
         raise ValueError(f"Not enough data to train: {len(df)} records (need 50+)")
     
     # Extract features and targets
-    X = df[FEATURE_COLUMNS].fillna(0)
-    y = df[TARGET_COLUMNS].fillna(0)
+    with report.phase('extract_fillna'):
+        X = df[FEATURE_COLUMNS].fillna(0)
+        y = df[TARGET_COLUMNS].fillna(0)
+        
+        sample_weight = None
+        if WEIGHT_COLUMN in df.columns:
+            sample_weight = df[WEIGHT_COLUMN].fillna(1).to_numpy(dtype=float)
+    if sample_weight is not None:
+        print(f"  Sample weights: {len(df)} rows representing {sample_weight.sum():.0f} builds")
+    report.dataset('features', X)
+    report.dataset('targets', y)
     
     print(f"\n  Features shape: {X.shape}")
     print(f"  Targets shape: {y.shape}")
     
-    return X, y
+    return X, y, sample_weight
 
 
 # =============================================================================
 # MODEL TRAINING
 # =============================================================================
 
-def train_model(X, y):
-    """Train RandomForest model with cross-validation."""
+def create_model():
+    """RandomForest with the tuned hyperparameters used for the global model."""
+    return RandomForestRegressor(
+        n_estimators=150,      # More trees for better accuracy
+        max_depth=15,          # Deeper trees for complex patterns
+        min_samples_split=5,   # Prevent overfitting
+        min_samples_leaf=2,
+        max_features='sqrt',   # Use sqrt of features per split
+        random_state=42,
+        n_jobs=-1,             # Use all CPU cores
+    )
+
+
+def train_model(X, y, sample_weight=None, report=None, profile_path=None):
+    """
+    Train RandomForest model with cross-validation.
+    
+    Phases are recorded on `report`; with `profile_path`, the fit runs
+    under cProfile and the stats are dumped there.
+    """
+    report = report or TrainingReport()
     print(f"\n{'='*60}")
     print("Training Enhanced ML Model")
     print(f"{'='*60}")
@@ -131,35 +306,40 @@ def train_model(X, y):
     print(f"Features: {len(X.columns)}")
     
     # Split data: 80% train, 20% test
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
+    weights = np.ones(len(X)) if sample_weight is None else sample_weight
+    with report.phase('split'):
+        X_train, X_test, y_train, y_test, w_train, w_test = train_test_split(
+            X, y, weights, test_size=0.2, random_state=42
+        )
     print(f"Train/Test split: {len(X_train)}/{len(X_test)}")
     
     # Create model with tuned hyperparameters
-    model = RandomForestRegressor(
-        n_estimators=150,      # More trees for better accuracy
-        max_depth=15,          # Deeper trees for complex patterns
-        min_samples_split=5,   # Prevent overfitting
-        min_samples_leaf=2,
-        max_features='sqrt',   # Use sqrt of features per split
-        random_state=42,
-        n_jobs=-1,             # Use all CPU cores
-    )
+    model = create_model()
     
-    # Train model
+    # Train model (cProfile only sees the main thread; tree building runs in joblib threads)
     print("\nTraining Random Forest...")
-    model.fit(X_train, y_train)
+    profiler = cProfile.Profile() if profile_path else None
+    with report.phase('fit'):
+        if profiler:
+            profiler.enable()
+        model.fit(X_train, y_train, sample_weight=w_train)
+        if profiler:
+            profiler.disable()
+    if profiler:
+        profiler.dump_stats(profile_path)
+        print(f"  cProfile of fit saved: {profile_path}")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
     
     # Evaluate on test set
-    predictions = model.predict(X_test)
+    with report.phase('predict_test'):
+        predictions = model.predict(X_test)
     
     print(f"\n{'='*60}")
     print("Model Performance (Test Set)")
     print(f"{'='*60}")
     
-    overall_r2 = r2_score(y_test, predictions)
-    overall_mae = mean_absolute_error(y_test, predictions)
+    overall_r2 = r2_score(y_test, predictions, sample_weight=w_test)
+    overall_mae = mean_absolute_error(y_test, predictions, sample_weight=w_test)
     print(f"\nOverall R² Score:  {overall_r2:.4f}")
     print(f"Overall MAE:       {overall_mae:.4f}")
     
@@ -167,15 +347,16 @@ def train_model(X, y):
     for i, col in enumerate(TARGET_COLUMNS):
         y_true = y_test.iloc[:, i]
         y_pred = predictions[:, i]
-        r2 = r2_score(y_true, y_pred)
-        mae = mean_absolute_error(y_true, y_pred)
+        r2 = r2_score(y_true, y_pred, sample_weight=w_test)
+        mae = mean_absolute_error(y_true, y_pred, sample_weight=w_test)
         print(f"  {col:15s} → R²: {r2:.4f}, MAE: {mae:.4f}")
     
     # Feature importance
     print(f"\n{'='*60}")
     print("Feature Importance (Top 10)")
     print(f"{'='*60}")
-    importance = dict(zip(FEATURE_COLUMNS, model.feature_importances_))
+    with report.phase('feature_importance'):
+        importance = dict(zip(FEATURE_COLUMNS, model.feature_importances_))
     sorted_imp = sorted(importance.items(), key=lambda x: -x[1])
     for i, (feature, imp) in enumerate(sorted_imp[:10], 1):
         print(f"  {i:2d}. {feature:25s} {imp:.4f}")
@@ -186,7 +367,9 @@ def train_model(X, y):
     print(f"{'='*60}")
     
     # Flatten y for CV scoring (use build_time_min as primary metric)
-    cv_scores = cross_val_score(model, X, y['build_time_min'], cv=5, scoring='r2')
+    with report.phase('cross_validation'):
+        cv_scores = cross_val_score(model, X, y['build_time_min'], cv=5, scoring='r2',
+                                    params={'sample_weight': weights})
     print(f"  Build Time R² scores: {cv_scores}")
     print(f"  Mean CV R²: {cv_scores.mean():.4f} (+/- {cv_scores.std() * 2:.4f})")
     
@@ -198,12 +381,197 @@ def train_model(X, y):
     }
 
 
+# =============================================================================
+# PER-PROJECT-TYPE SUBMODELS
+# =============================================================================
+
+# Types with fewer rows than this stay on the global model
+DEFAULT_MIN_ROUTE_ROWS = 150
+
+PROJECT_TYPE_NAMES = {0: 'python', 1: 'java', 2: 'nodejs', 3: 'react-native', 4: 'android', 5: 'ios'}
+
+
+def single_row_latency_ms(model, row, repeats=20):
+    """Median wall time of one single-row predict() call."""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        model.predict(row)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings)) * 1000
+
+
+def train_submodels(X, y, global_model, min_rows=DEFAULT_MIN_ROUTE_ROWS, sample_weight=None):
+    """
+    Train a smaller forest per project_type on the same train/test split as
+    train_model(), and keep it only if it beats the global model on that
+    type's test rows. Returns {code: (model, route info)}.
+    """
+    print(f"\n{'='*60}")
+    print("Per-Project-Type Submodels")
+    print(f"{'='*60}")
+    
+    weights = np.ones(len(X)) if sample_weight is None else sample_weight
+    X_train, X_test, y_train, y_test, w_train, w_test = train_test_split(
+        X, y, weights, test_size=0.2, random_state=42
+    )
+    
+    routes = {}
+    for code in sorted(X['project_type'].unique()):
+        name = PROJECT_TYPE_NAMES.get(int(code), str(code))
+        train_rows = X_train['project_type'] == code
+        test_rows = X_test['project_type'] == code
+        if train_rows.sum() < min_rows or test_rows.sum() < 2:
+            print(f"  {name:13s} → global ({train_rows.sum()} train rows < {min_rows})")
+            continue
+        
+        model = RandomForestRegressor(
+            n_estimators=100,
+            max_depth=12,
+            min_samples_split=5,
+            min_samples_leaf=2,
+            max_features='sqrt',
+            random_state=42,
+            n_jobs=-1,
+        )
+        model.fit(X_train[train_rows], y_train[train_rows], sample_weight=w_train[train_rows.to_numpy()])
+        
+        X_route, y_route, w_route = X_test[test_rows], y_test[test_rows], w_test[test_rows.to_numpy()]
+        sub_mae = mean_absolute_error(y_route, model.predict(X_route), sample_weight=w_route)
+        global_mae = mean_absolute_error(y_route, global_model.predict(X_route), sample_weight=w_route)
+        info = {
+            'project_type': name,
+            'train_rows': int(train_rows.sum()),
+            'test_rows': int(test_rows.sum()),
+            'mae': round(float(sub_mae), 4),
+            'global_mae': round(float(global_mae), 4),
+            'latency_ms': round(single_row_latency_ms(model, X_route.iloc[:1]), 3),
+            'global_latency_ms': round(single_row_latency_ms(global_model, X_route.iloc[:1]), 3),
+        }
+        verdict = 'routed' if sub_mae <= global_mae else 'global (submodel not better)'
+        print(f"  {name:13s} → {verdict}: MAE {sub_mae:.4f} vs global {global_mae:.4f}, "
+              f"latency {info['latency_ms']:.1f} vs {info['global_latency_ms']:.1f} ms "
+              f"({info['train_rows']} train rows)")
+        if sub_mae <= global_mae:
+            routes[int(code)] = (model, info)
+    
+    return routes
+
+
+# =============================================================================
+# PER-STAGE MODEL
+# =============================================================================
+
+def train_stage_model(csv_path, report=None):
+    """
+    Train one forest on stage records: the 27 build features plus the
+    stage's code in, the stage's CPU, memory and time out.
+    
+    Builds (not rows) are split 80/20, so all stages of a test build are
+    unseen. Returns (model, 'stages' metadata for features.json).
+    """
+    report = report or TrainingReport()
+    print(f"\n{'='*60}")
+    print("Per-Stage Model")
+    print(f"{'='*60}")
+    print(f"Loading stage records: {csv_path}")
+    with report.phase('stage_read_csv'):
+        df = pd.read_csv(csv_path)
+    
+    missing = [col for col in FEATURE_COLUMNS + STAGE_TARGET_COLUMNS + ['build_id', 'stage']
+               if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing stage record columns: {missing}")
+    if 'status' in df.columns:
+        df = df[df['status'].isin(['success', 'SUCCESS'])]
+    if len(df) < 50:
+        raise ValueError(f"Not enough stage records to train: {len(df)} (need 50+)")
+    report.dataset('stage_records', df)
+    
+    stages = sorted(df['stage'].unique())
+    X = df[FEATURE_COLUMNS].fillna(0).assign(**{STAGE_FEATURE: df['stage'].map(stages.index)})
+    y = df[STAGE_TARGET_COLUMNS].fillna(0)
+    builds = df['build_id'].drop_duplicates().to_numpy()
+    _, test_builds = train_test_split(builds, test_size=0.2, random_state=42)
+    test = df['build_id'].isin(test_builds).to_numpy()
+    print(f"  {len(df)} stage records from {df['build_id'].nunique()} builds; "
+          f"train/test rows: {(~test).sum()}/{test.sum()}")
+    
+    model = create_model()
+    with report.phase('stage_fit'):
+        model.fit(X[~test], y[~test])
+    with report.phase('stage_predict_test'):
+        predictions = model.predict(X[test])
+    
+    metrics = {}
+    actual = y[test].to_numpy()
+    test_stages = df['stage'].to_numpy()[test]
+    print(f"\n  {'stage':12s} {'rows':>6s} " + ' '.join(f'{col + " MAE":>18s}' for col in STAGE_TARGET_COLUMNS))
+    for stage in stages:
+        rows = test_stages == stage
+        if not rows.any():
+            continue
+        mae = np.abs(predictions[rows] - actual[rows]).mean(axis=0)
+        metrics[stage] = {'test_rows': int(rows.sum()),
+                          **{f'{col}_mae': round(float(m), 4) for col, m in zip(STAGE_TARGET_COLUMNS, mae)}}
+        print(f"  {stage:12s} {rows.sum():6d} " + ' '.join(f'{m:18.3f}' for m in mae))
+    print(f"  Overall R²: {r2_score(actual, predictions):.4f}")
+    
+    seen = {str(int(code)): sorted(group.unique()) for code, group in df.groupby('project_type')['stage']}
+    return model, {
+        'path': 'stage_model.pkl',
+        'features': FEATURE_COLUMNS + [STAGE_FEATURE],
+        'stages': stages,
+        'targets': STAGE_TARGET_COLUMNS,
+        'seen': seen,
+        'metrics': metrics,
+    }
+
+
+# =============================================================================
+# DRIFT REFERENCE
+# =============================================================================
+
+# Histogram size for continuous features; features with at most
+# MAX_DISCRETE_VALUES distinct values get one bin per value instead
+DRIFT_BINS = 10
+MAX_DISCRETE_VALUES = 16
+
+
+def build_reference_sketches(X, sample_weight=None):
+    """
+    Per-feature reference histograms for ml/drift_monitor.py.
+    
+    Each feature gets sorted bin edges and training counts, where a value v
+    falls in bin bisect_right(edges, v). Continuous features use decile
+    edges; low-cardinality features use midpoints between their values.
+    With sample weights, counts are the number of builds each bin stands for.
+    """
+    sketches = {}
+    for col in X.columns:
+        values = X[col].to_numpy(dtype=float)
+        distinct = np.unique(values)
+        if len(distinct) <= MAX_DISCRETE_VALUES:
+            edges = (distinct[:-1] + distinct[1:]) / 2
+        else:
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, DRIFT_BINS + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, values, side='right'),
+                             weights=sample_weight, minlength=len(edges) + 1)
+        sketches[col] = {
+            'edges': [round(float(e), 6) for e in edges],
+            'counts': [int(round(c)) for c in counts],
+        }
+    samples = len(X) if sample_weight is None else int(round(sample_weight.sum()))
+    return {'samples': samples, 'features': sketches}
+
+
 # =============================================================================
 # SAVE MODEL AND METADATA
 # =============================================================================
 
-def save_model(model, metrics, model_dir, feature_list):
-    """Save trained model and metadata."""
+def save_model(model, metrics, model_dir, feature_list, drift_reference=None, submodels=None,
+               stage_model=None):
+    """Save trained model, per-project-type submodels, the stage model and metadata."""
     os.makedirs(model_dir, exist_ok=True)
     
     # Save model
@@ -211,6 +579,23 @@ def save_model(model, metrics, model_dir, feature_list):
     joblib.dump(model, model_path)
     print(f"\n✅ Model saved: {model_path}")
     
+    # Submodels go under submodels/; predict.py routes by project_type
+    routes = {}
+    for code, (submodel, info) in (submodels or {}).items():
+        relative = os.path.join('submodels', f'project_type_{code}.pkl')
+        os.makedirs(os.path.join(model_dir, 'submodels'), exist_ok=True)
+        joblib.dump(submodel, os.path.join(model_dir, relative))
+        routes[str(code)] = {'path': relative, **info}
+    if routes:
+        print(f"✅ {len(routes)} submodels saved: {os.path.join(model_dir, 'submodels')}")
+    
+    # Stage model (train_stage_model); predict.py adds per-stage predictions when listed
+    stages = None
+    if stage_model is not None:
+        stage_forest, stages = stage_model
+        joblib.dump(stage_forest, os.path.join(model_dir, stages['path']))
+        print(f"✅ Stage model saved: {os.path.join(model_dir, stages['path'])}")
+    
     # Save feature list for predict.py to use
     feature_path = os.path.join(model_dir, 'features.json')
     import json
@@ -222,7 +607,10 @@ def save_model(model, metrics, model_dir, feature_list):
                 'r2_score': float(metrics['r2_score']),
                 'mae': float(metrics['mae']),
                 'cv_mean': float(metrics['cv_mean']),
-            }
+            },
+            'drift_reference': drift_reference,
+            'routes': routes,
+            'stages': stages,
         }, f, indent=2)
     print(f"✅ Feature list saved: {feature_path}")
     
@@ -247,22 +635,74 @@ def main():
         required=True, 
         help='Directory to save trained model'
     )
+    parser.add_argument(
+        '--per-project-type',
+        action='store_true',
+        help='Also train a smaller model per project_type (global model stays the fallback)'
+    )
+    parser.add_argument(
+        '--min-route-rows',
+        type=int,
+        default=DEFAULT_MIN_ROUTE_ROWS,
+        help='Training rows a project_type needs for its own model'
+    )
+    parser.add_argument(
+        '--stage-data',
+        help='Also train the per-stage model on these stage records (stage_records.csv)'
+    )
+    parser.add_argument(
+        '--trace-memory',
+        action='store_true',
+        help='Record each phase\'s tracemalloc peak in the report (slows training; timings are not representative)'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Dump a cProfile of the fit phase to train_fit.prof next to the model'
+    )
     args = parser.parse_args()
     
     # Validate paths
     if not os.path.exists(args.data_path):
         print(f"❌ Dataset file not found: {args.data_path}", file=sys.stderr)
         sys.exit(1)
+    if args.stage_data and not os.path.exists(args.stage_data):
+        print(f"❌ Stage records not found: {args.stage_data}", file=sys.stderr)
+        sys.exit(1)
     
     try:
         # Load data
-        X, y = load_data(args.data_path)
+        report = TrainingReport(trace_memory=args.trace_memory)
+        X, y, sample_weight = load_data(args.data_path, report)
         
         # Train model
-        model, metrics = train_model(X, y)
+        profile_path = None
+        if args.profile:
+            os.makedirs(args.model_path, exist_ok=True)
+            profile_path = os.path.join(args.model_path, 'train_fit.prof')
+        model, metrics = train_model(X, y, sample_weight, report, profile_path)
+        
+        submodels = None
+        if args.per_project_type:
+            with report.phase('submodels'):
+                submodels = train_submodels(X, y, model, args.min_route_rows, sample_weight)
+        
+        stage_model = None
+        if args.stage_data:
+            stage_model = train_stage_model(args.stage_data, report)
         
         # Save model and metadata
-        save_model(model, metrics, args.model_path, FEATURE_COLUMNS)
+        with report.phase('drift_reference'):
+            drift_reference = build_reference_sketches(X, sample_weight)
+        with report.phase('save'):
+            save_model(model, metrics, args.model_path, FEATURE_COLUMNS,
+                       drift_reference=drift_reference, submodels=submodels, stage_model=stage_model)
+        
+        print(f"\n{'='*60}")
+        print("Training Cost by Phase")
+        print(f"{'='*60}")
+        print(report.summary())
+        print(f"\n✅ Training report saved: {report.save(args.model_path)}")
         
         # Summary
         print(f"\n{'='*60}")
@@ -25,12 +25,16 @@ class LabelMapper implements Serializable {
         'heavytest':   [memory: 32, instance: 'T3a 2X Large', executors: 1]
     ]
     
+    // Safety buffer on predicted memory when the prediction carries no learned one
+    static final double DEFAULT_BUFFER = 1.2
+    
     /**
-     * Get the appropriate Jenkins label based on predicted memory
+     * Get the appropriate Jenkins label based on predicted memory.
+     * buffer: memory multiplier; predict.py --buffers supplies a learned
+     * per-project-type value (prediction.memoryBuffer), else 20% headroom.
      */
-    String getLabel(double predictedMemoryGb) {
-        // Add 20% buffer for safety
-        double requiredMemory = predictedMemoryGb * 1.2
+    String getLabel(double predictedMemoryGb, double buffer = DEFAULT_BUFFER) {
+        double requiredMemory = predictedMemoryGb * buffer
         
         if (requiredMemory <= 1.0) {
             return 'lightweight'
@@ -48,8 +52,8 @@ class LabelMapper implements Serializable {
     /**
      * Get AWS instance type for display
      */
-    String getInstanceType(double predictedMemoryGb) {
-        String label = getLabel(predictedMemoryGb)
+    String getInstanceType(double predictedMemoryGb, double buffer = DEFAULT_BUFFER) {
+        String label = getLabel(predictedMemoryGb, buffer)
         return INSTANCES[label]?.instance ?: 'Unknown'
     }
     
@@ -52,8 +52,9 @@ def call(Map config = [:]) {
     echo '\n🏷️ Selecting Best AWS EC2 Node...'
 
     def mapper = new LabelMapper()
-    def label = mapper.getLabel(prediction.memoryGb)
-    def instanceType = mapper.getInstanceType(prediction.memoryGb)
+    double buffer = prediction.memoryBuffer ?: LabelMapper.DEFAULT_BUFFER
+    def label = mapper.getLabel(prediction.memoryGb, buffer)
+    def instanceType = mapper.getInstanceType(prediction.memoryGb, buffer)
     def memoryForLabel = mapper.getMemoryForLabel(label)
 
     echo '┌──────────────────────────────────────┐'
@@ -63,7 +64,7 @@ def call(Map config = [:]) {
     echo "│  AWS Instance    : ${instanceType}"
     echo "│  Instance Memory : ${memoryForLabel} GB"
     echo "│  Predicted Need  : ${prediction.memoryGb} GB"
-    echo "│  Buffer          : +20% safety margin"
+    echo "│  Buffer          : ${prediction.memoryBuffer ? "x${prediction.memoryBuffer} (learned)" : '+20% safety margin'}"
     echo '├──────────────────────────────────────┤'
     echo '│  WHY THIS NODE?                      │'
     echo "│  ${getReasoningText(prediction, metadata, label)}"
@@ -153,8 +153,9 @@ def call(Map config = [:]) {
     // Step 5: Map to Jenkins Label
     // ========================================
     def mapper = new LabelMapper()
-    def label = mapper.getLabel(prediction.memoryGb)
-    def instanceType = mapper.getInstanceType(prediction.memoryGb)
+    double buffer = prediction.memoryBuffer ?: LabelMapper.DEFAULT_BUFFER
+    def label = mapper.getLabel(prediction.memoryGb, buffer)
+    def instanceType = mapper.getInstanceType(prediction.memoryGb, buffer)
 
     echo '\n🏷️ Node Selection:'
     echo "   Jenkins Label: ${label}"